@@ -0,0 +1,63 @@
+# auth_app/authentication.py
+"""
+JWT authentication that trusts the verified token for the user's identity
+instead of loading CustomUser on every request. The view gets an unsaved
+CustomUser carrying only the primary key, which is all that filtering and
+foreign-key assignment need. Whether the user still exists, is active and
+(with SIMPLE_JWT['CHECK_REVOKE_TOKEN']) still has the password the token was
+issued for is read from a short-lived cache entry, so most requests make no
+auth-related query; saving or deleting a user drops the entry.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+MISSING = 'missing'
+
+
+def state_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def user_state(user_model, user_id):
+    """(is_active, md5 of the password hash) for `user_id`, or MISSING; cached for AUTH_USER_STATE_TTL seconds"""
+    key = state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}) \
+            .values_list('is_active', 'password').first()
+        state = MISSING if row is None else (row[0], get_md5_hash_password(row[1]))
+        cache.set(key, state, getattr(settings, 'AUTH_USER_STATE_TTL', 30))
+    return state
+
+
+def forget_user_state(user_id):
+    cache.delete(state_key(user_id))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with the same checks, but no CustomUser query per request"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        state = user_state(self.user_model, user_id)
+        if state == MISSING:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        is_active, password_hash = state
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # Unsaved, so an accidental save() fails on the primary key instead of blanking the row
+        user = self.user_model(**{api_settings.USER_ID_FIELD: user_id, 'is_active': True})
+        user.from_token = True
+        return user
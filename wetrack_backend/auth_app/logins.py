@@ -0,0 +1,28 @@
+# auth_app/logins.py
+"""
+last_login through a write-behind buffer: logins only queue (user id, time)
+and the buffer writes the latest time per user with one bulk_update.
+"""
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from wetrack.writebehind import WriteBehindBuffer
+
+
+def _write(items):
+    latest = {}
+    for user_id, when in items:
+        if user_id not in latest or when > latest[user_id]:
+            latest[user_id] = when
+    User = get_user_model()
+    # Saved users; bulk_update only needs the primary key and the new value
+    User.objects.bulk_update([User(pk=pk, last_login=when) for pk, when in latest.items()],
+                             ['last_login'], batch_size=500)
+
+
+logins = WriteBehindBuffer('last-login', _write)
+
+
+def record_login(user):
+    user.last_login = timezone.now()
+    logins.add((user.pk, user.last_login))
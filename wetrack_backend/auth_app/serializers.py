@@ -1,7 +1,28 @@
 # auth_app/serializers.py
+from dj_rest_auth.serializers import LoginSerializer
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .logins import record_login
 from .models import CustomUser
 
+
+class BufferedLoginSerializer(LoginSerializer):
+    """dj_rest_auth login that records last_login through the write-behind buffer"""
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        record_login(attrs['user'])
+        return attrs
+
+
+class BufferedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token obtain with last_login buffered instead of SIMPLE_JWT['UPDATE_LAST_LOGIN']"""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        record_login(self.user)
+        return data
+
 class CustomUserSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=True)  # Add this field
 
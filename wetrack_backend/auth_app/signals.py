@@ -0,0 +1,13 @@
+# auth_app/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user_state
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def drop_cached_user_state(sender, instance, **kwargs):
+    # Deactivation and password changes take effect on the next request
+    forget_user_state(instance.pk)
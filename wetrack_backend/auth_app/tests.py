@@ -1,5 +1,12 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from auth_app.logins import logins
 from auth_app.models import CustomUser
+from tracker.models import Transaction
+from wetrack.testing import QueryBudgetMixin
 
 class CustomUserTests(TestCase):
     def test_create_user(self):
@@ -14,4 +21,84 @@ class CustomUserTests(TestCase):
         self.assertEqual(admin_user.email, 'super@user.com')
         self.assertTrue(admin_user.is_active)
         self.assertTrue(admin_user.is_staff)
-        self.assertTrue(admin_user.is_superuser)
\ No newline at end of file
+        self.assertTrue(admin_user.is_superuser)
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_cached_state_skips_the_user_query(self):
+        self.assertEqual(self.client.get('/api/transactions/').status_code, 200)
+        # Only the transaction list itself
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/transactions/').status_code, 200)
+
+    def test_writes_are_owned_by_the_token_user(self):
+        response = self.client.post('/api/transactions/', {
+            'date': '2024-11-01T12:00:00Z', 'amount': '3.50', 'category': '1', 'currency': 'GBP', 'description': 'Bus',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Transaction.objects.get().user, self.user)
+
+    def test_deactivated_user_is_rejected_on_the_next_request(self):
+        self.assertEqual(self.client.get('/api/transactions/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get('/api/transactions/').status_code, 401)
+
+
+
+@override_settings(WRITE_BEHIND_INTERVAL=0)
+class BufferedLastLoginTests(TestCase):
+    def test_login_records_last_login_on_flush(self):
+        self.addCleanup(logins.clear)
+        user = CustomUser.objects.create_user(username='alice', password='pw')
+
+        response = APIClient().post('/api/auth/login/', {'username': 'alice', 'password': 'pw'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertIsNone(user.last_login)
+        logins.flush()
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        self.added = 0
+
+    def add_users(self, count):
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f"user{self.added + i}", email=f"user{self.added + i}@example.com")
+            for i in range(count)
+        ])
+        self.added += count
+
+    def api(self, path):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}")
+        return lambda: client.get(path)
+
+    def admin_page(self, path):
+        self.client.force_login(self.admin)
+        return lambda: self.client.get(path)
+
+    def test_user_detail(self):
+        self.assertQueryBudget(1, self.api('/api/auth/users/me/'), self.add_users)
+        self.assertQueryBudget(2, self.api(f'/api/auth/users/{self.admin.pk}/'), self.add_users)
+
+    def test_admin_changelist(self):
+        # Session, user, two counts, the page, the email filter
+        self.assertQueryBudget(6, self.admin_page('/admin/auth_app/customuser/'), self.add_users)
+
+    def test_admin_change_and_add_pages(self):
+        self.assertQueryBudget(9, self.admin_page(f'/admin/auth_app/customuser/{self.admin.pk}/change/'),
+                               self.add_users)
+        self.assertQueryBudget(6, self.admin_page('/admin/auth_app/customuser/add/'), self.add_users)
@@ -55,6 +55,10 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         pk = self.kwargs.get('pk')
-        if pk == 'me':
+        # users/me/ has no pk in its URL
+        if pk is None or pk == 'me':
+            if getattr(self.request.user, 'from_token', False):
+                # Token-only users carry just the primary key
+                return CustomUser.objects.get(pk=self.request.user.pk)
             return self.request.user
         return super().get_object()
\ No newline at end of file
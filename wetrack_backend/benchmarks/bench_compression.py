@@ -0,0 +1,137 @@
+"""
+CPU cost against bytes saved of the response encodings CompressionMiddleware
+can pick (wetrack.compression), on the payloads it sees most: transaction
+lists (a keyset page, a full page and an unpaginated list), the ~150 entry
+/api/currency/currencies/ body and a streamed NDJSON export, which is
+flushed after every chunk as the middleware does. Payloads are built in
+memory, so no database is needed.
+
+    python -m benchmarks.bench_compression --rows 50,500,5000 --repeat 20
+"""
+import argparse
+import json
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wetrack.settings')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'bench')
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from benchmarks.bench_list_serializer import make_rows  # noqa: E402
+from tracker import exporters  # noqa: E402
+from tracker.serializers import CATEGORY_LABELS, datetime_formatter, format_amount, represent_values  # noqa: E402
+from wetrack.compression import StreamCompressor, compress  # noqa: E402
+
+ENCODINGS = [('zstd', 1), ('zstd', 3), ('zstd', 6), ('gzip', 1), ('gzip', 6), ('gzip', 9)]
+
+# ISO 4217 codes and names, as FastForex lists them
+CURRENCY_NAMES = """
+AED UAE Dirham|AFN Afghan Afghani|ALL Albanian Lek|AMD Armenian Dram|ANG Netherlands Antillean Guilder
+AOA Angolan Kwanza|ARS Argentine Peso|AUD Australian Dollar|AWG Aruban Florin|AZN Azerbaijani Manat
+BAM Bosnia-Herzegovina Convertible Mark|BBD Barbadian Dollar|BDT Bangladeshi Taka|BGN Bulgarian Lev
+BHD Bahraini Dinar|BIF Burundian Franc|BMD Bermudan Dollar|BND Brunei Dollar|BOB Bolivian Boliviano
+BRL Brazilian Real|BSD Bahamian Dollar|BTN Bhutanese Ngultrum|BWP Botswanan Pula|BZD Belize Dollar
+CAD Canadian Dollar|CDF Congolese Franc|CHF Swiss Franc|CLF Chilean Unit of Account (UF)|CLP Chilean Peso
+CNH Chinese Yuan (Offshore)|CNY Chinese Yuan|COP Colombian Peso|CUP Cuban Peso|CVE Cape Verdean Escudo
+CZK Czech Republic Koruna|DJF Djiboutian Franc|DKK Danish Krone|DOP Dominican Peso|DZD Algerian Dinar
+EGP Egyptian Pound|ERN Eritrean Nakfa|ETB Ethiopian Birr|EUR Euro|FJD Fijian Dollar
+FKP Falkland Islands Pound|GBP British Pound Sterling|GEL Georgian Lari|GHS Ghanaian Cedi
+GIP Gibraltar Pound|GMD Gambian Dalasi|GNF Guinean Franc|GTQ Guatemalan Quetzal|GYD Guyanaese Dollar
+HKD Hong Kong Dollar|HNL Honduran Lempira|HRK Croatian Kuna|HTG Haitian Gourde|HUF Hungarian Forint
+IDR Indonesian Rupiah|ILS Israeli New Sheqel|INR Indian Rupee|IQD Iraqi Dinar|IRR Iranian Rial
+ISK Icelandic Krona|JMD Jamaican Dollar|JOD Jordanian Dinar|JPY Japanese Yen|KES Kenyan Shilling
+KGS Kyrgystani Som|KHR Cambodian Riel|KMF Comorian Franc|KPW North Korean Won|KRW South Korean Won
+KWD Kuwaiti Dinar|KYD Cayman Islands Dollar|KZT Kazakhstani Tenge|LAK Laotian Kip|LBP Lebanese Pound
+LKR Sri Lankan Rupee|LRD Liberian Dollar|LSL Lesotho Loti|LYD Libyan Dinar|MAD Moroccan Dirham
+MDL Moldovan Leu|MGA Malagasy Ariary|MKD Macedonian Denar|MMK Myanma Kyat|MNT Mongolian Tugrik
+MOP Macanese Pataca|MRU Mauritanian Ouguiya|MUR Mauritian Rupee|MVR Maldivian Rufiyaa|MWK Malawian Kwacha
+MXN Mexican Peso|MYR Malaysian Ringgit|MZN Mozambican Metical|NAD Namibian Dollar|NGN Nigerian Naira
+NOK Norwegian Krone|NPR Nepalese Rupee|NZD New Zealand Dollar|OMR Omani Rial|PAB Panamanian Balboa
+PEN Peruvian Nuevo Sol|PGK Papua New Guinean Kina|PHP Philippine Peso|PKR Pakistani Rupee|PLN Polish Zloty
+PYG Paraguayan Guarani|QAR Qatari Rial|RON Romanian Leu|RSD Serbian Dinar|RUB Russian Ruble
+RWF Rwandan Franc|SAR Saudi Riyal|SCR Seychellois Rupee|SDG Sudanese Pound|SEK Swedish Krona
+SGD Singapore Dollar|SHP Saint Helena Pound|SLL Sierra Leonean Leone|SOS Somali Shilling
+SRD Surinamese Dollar|SYP Syrian Pound|SZL Swazi Lilangeni|THB Thai Baht|TJS Tajikistani Somoni
+TMT Turkmenistani Manat|TND Tunisian Dinar|TOP Tongan Pa'anga|TRY Turkish Lira|TTD Trinidad and Tobago Dollar
+TWD New Taiwan Dollar|TZS Tanzanian Shilling|UAH Ukrainian Hryvnia|UGX Ugandan Shilling|USD US Dollar
+UYU Uruguayan Peso|UZS Uzbekistan Som|VND Vietnamese Dong|VUV Vanuatu Vatu|WST Samoan Tala
+XAF CFA Franc BEAC|XAG Silver Ounce|XAU Gold Ounce|XCD East Caribbean Dollar|XDR Special Drawing Rights
+XOF CFA Franc BCEAO|XPD Palladium Ounce|XPF CFP Franc|XPT Platinum Ounce|YER Yemeni Rial
+ZAR South African Rand|ZMW Zambian Kwacha
+"""
+
+
+def currencies_payload():
+    entries = (entry.split(' ', 1) for entry in CURRENCY_NAMES.replace('\n', '|').split('|') if entry)
+    return JSONRenderer().render({'currencies': dict(entries)})
+
+
+def ndjson_chunks(rows):
+    format_datetime = datetime_formatter()
+    values = ((row['id'], format_datetime(row['date']), format_amount(row['amount']), row['category'],
+               CATEGORY_LABELS.get(row['category'], row['category']), row['description'], row['currency'],
+               format_datetime(row['created_at']), format_datetime(row['updated_at'])) for row in rows)
+    return list(exporters.encode(exporters.iter_ndjson(values)))
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure(chunks, encoding, level, repeat, streamed):
+    size = sum(len(chunk) for chunk in chunks)
+    if streamed:
+        def run():
+            stream = StreamCompressor(encoding, level)
+            return b''.join([stream.compress(chunk) for chunk in chunks] + [stream.finish()])
+    else:
+        def run():
+            return compress(chunks[0], encoding, level)
+    seconds, compressed = best_of(repeat, run)
+    return {
+        'encoding': f"{encoding}-{level}",
+        'best_ms': round(seconds * 1000, 3),
+        'mb_per_second': round(size / seconds / 1e6, 1),
+        'bytes': len(compressed),
+        'ratio': round(size / len(compressed), 2),
+        'saved_bytes': size - len(compressed),
+        # Transfer time saved per CPU millisecond spent, on a 10 Mbit/s link
+        'saved_link_ms_per_cpu_ms': round((size - len(compressed)) * 8 / 10e6 * 1000 / (seconds * 1000), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', default='50,500,5000', help='transaction list sizes, comma separated')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    renderer = JSONRenderer()
+    payloads = {'currencies': ([currencies_payload()], False)}
+    sizes = [int(size) for size in args.rows.split(',')]
+    for count in sizes:
+        payloads[f"transaction_list_{count}"] = ([renderer.render(represent_values(make_rows(count)))], False)
+    payloads[f"export_ndjson_{sizes[-1]}"] = (ndjson_chunks(make_rows(sizes[-1])), True)
+
+    results = {}
+    for name, (chunks, streamed) in payloads.items():
+        results[name] = {
+            'bytes': sum(len(chunk) for chunk in chunks),
+            'chunks': len(chunks),
+            'encodings': [measure(chunks, encoding, level, args.repeat, streamed) for encoding, level in ENCODINGS],
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
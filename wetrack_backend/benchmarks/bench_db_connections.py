@@ -0,0 +1,85 @@
+"""
+Per-request connection cost against the configured Postgres: a new
+connection for every request (CONN_MAX_AGE=0, the old default) against a
+checkout from a psycopg 3 pool with the DB_POOL health check, each followed
+by one small query.
+
+    DB_NAME=... DB_HOST=... python -m benchmarks.bench_db_connections --requests 300 --threads 8
+
+Uses the DATABASES['default'] connection parameters, so with sslmode=require
+the fresh-connection figures include the TLS handshake.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+
+def run(request, total, threads):
+    latencies = []
+
+    def one(_):
+        started = time.perf_counter()
+        request()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests_per_second': round(total / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wetrack.settings')
+    django.setup()
+    import psycopg
+    from django.db import connections
+    from psycopg_pool import ConnectionPool
+
+    params = connections['default'].get_connection_params()
+    params.pop('cursor_factory', None)
+    params.pop('context', None)
+    params.pop('pool', None)
+
+    def fresh_connection():
+        with psycopg.connect(**params) as connection:
+            connection.execute('SELECT 1').fetchone()
+
+    pool = ConnectionPool(kwargs=params, min_size=args.threads, max_size=args.threads,
+                          check=ConnectionPool.check_connection, open=True)
+    pool.wait()
+
+    def pooled_connection():
+        with pool.connection() as connection:
+            connection.execute('SELECT 1').fetchone()
+
+    results = {
+        'fresh_connection': run(fresh_connection, args.requests, args.threads),
+        'pooled_checked': run(pooled_connection, args.requests, args.threads),
+    }
+    results['saved_per_request_ms'] = round(
+        results['fresh_connection']['mean_ms'] - results['pooled_checked']['mean_ms'], 3)
+    results['pool_stats'] = pool.get_stats()
+    pool.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-request overhead of a fresh connection per call (module-level
+requests.get, as the currency views used to do) against the pooled
+keep-alive client, both hitting the local FakeFastForex server.
+
+    python -m benchmarks.bench_http_client --requests 500 --threads 8
+
+The stand-in speaks plain HTTP, so this measures TCP setup only; against
+api.fastforex.io each fresh connection also pays a TLS handshake.
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from currency.client import PooledHTTPClient
+from currency.testing import FakeFastForex
+
+
+def run(get, url, total, threads):
+    params = {'from': 'GBP', 'to': 'USD', 'api_key': 'bench'}
+    latencies = []
+
+    def one(_):
+        started = time.perf_counter()
+        response = get(url, params=params, timeout=5)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests_per_second': round(total / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    with FakeFastForex() as fake:
+        url = f"{fake.url}/fetch-one"
+        client = PooledHTTPClient(pool_maxsize=args.threads)
+        results = {
+            'fresh_connection': run(requests.get, url, args.requests, args.threads),
+            'pooled_keep_alive': run(client.get, url, args.requests, args.threads),
+        }
+        client.close()
+
+    saved = results['fresh_connection']['mean_ms'] - results['pooled_keep_alive']['mean_ms']
+    results['saved_per_request_ms'] = round(saved, 3)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+List serialization throughput of TransactionSerializer(many=True) against
+the .values() fast path (tracker.serializers.represent_values), both rendered
+with DRF's JSONRenderer. Rows are built in memory, so no database is needed.
+
+    python -m benchmarks.bench_list_serializer --rows 5000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wetrack.settings')
+os.environ.setdefault('DJANGO_SECRET_KEY', 'bench')
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from tracker.models import Transaction  # noqa: E402
+from tracker.serializers import VALUE_FIELDS, TransactionSerializer, represent_values  # noqa: E402
+
+
+def make_rows(count):
+    rng = random.Random(0)
+    now = timezone.now()
+    categories = [code for code, _ in Transaction.CATEGORY_CHOICES]
+    rows = []
+    for pk in range(1, count + 1):
+        created = now - timedelta(minutes=pk)
+        rows.append({
+            'id': pk,
+            'date': created - timedelta(days=rng.randint(0, 400)),
+            'amount': Decimal(rng.randint(1, 100000)) / 100,
+            'category': rng.choice(categories),
+            'description': f"Purchase {pk}",
+            'currency': rng.choice(['GBP', 'EUR', 'USD']),
+            'created_at': created,
+            'updated_at': created,
+        })
+    return rows
+
+
+def run(render, count, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {'best_ms': round(best * 1000, 2), 'rows_per_second': round(count / best)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    # The serializer path also pays for model instances, as it does behind a QuerySet
+    renderer = JSONRenderer()
+
+    def serializer():
+        instances = [Transaction(**row) for row in rows]
+        return renderer.render(TransactionSerializer(instances, many=True).data)
+
+    def fast_path():
+        return renderer.render(represent_values({field: row[field] for field in VALUE_FIELDS} for row in rows))
+
+    assert serializer() == fast_path(), 'fast path output differs from TransactionSerializer'
+    results = {
+        'serializer': run(serializer, args.rows, args.repeat),
+        'fast_path': run(fast_path, args.rows, args.repeat),
+    }
+    results['speedup'] = round(results['serializer']['best_ms'] / results['fast_path']['best_ms'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Requests per second of the sync currency endpoints under WSGI against the
+async ones under ASGI, at a fixed number of concurrent connections.
+
+Start a slow FakeFastForex, then both servers against it:
+
+    python -m benchmarks.loadtest fake --port 8900 --delay 0.2
+    export FASTFOREX_BASE_URL=http://127.0.0.1:8900
+    gunicorn wetrack.wsgi -w 2 --threads 4 -b 127.0.0.1:8001
+    uvicorn wetrack.asgi:application --workers 2 --port 8002
+
+and compare:
+
+    python -m benchmarks.loadtest run --concurrency 200 --duration 20 \\
+        --url wsgi=http://127.0.0.1:8001/api/currency/rate/ \\
+        --url asgi=http://127.0.0.1:8002/api/currency/async/rate/
+
+Once rates are cached both paths answer locally, so the gap is widest on a
+cold start: empty the ExchangeRate table and restart the servers between
+runs to measure how each holds up while waiting on the slow upstream.
+Requests rotate over currency pairs so coalescing does not fold them into
+one call.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import httpx
+
+from currency.testing import DEFAULT_RATES, FakeFastForex
+
+PAIRS = [(a, b) for a in DEFAULT_RATES for b in DEFAULT_RATES if a != b]
+
+
+async def load(url, concurrency, duration, timeout):
+    latencies = []
+    statuses = {}
+    pairs = itertools.cycle(PAIRS)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                from_currency, to_currency = next(pairs)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url, params={'from': from_currency, 'to': to_currency})
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1) if latencies else None,
+        'statuses': statuses,
+    }
+
+
+def serve_fake(port, delay, error_rate=0):
+    fake = FakeFastForex(delay=delay, error_rate=error_rate)
+    fake.start(port=port)
+    print(f"FakeFastForex on {fake.url} (delay {delay}s, error rate {error_rate}); Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fake = commands.add_parser('fake', help='serve a slow FakeFastForex')
+    fake.add_argument('--port', type=int, default=8900)
+    fake.add_argument('--delay', type=float, default=0.2)
+    fake.add_argument('--error-rate', type=float, default=0)
+
+    run = commands.add_parser('run', help='load the given endpoints one after another')
+    run.add_argument('--url', action='append', required=True, metavar='LABEL=URL')
+    run.add_argument('--concurrency', type=int, default=200)
+    run.add_argument('--duration', type=float, default=20)
+    run.add_argument('--timeout', type=float, default=30)
+
+    args = parser.parse_args()
+    if args.command == 'fake':
+        serve_fake(args.port, args.delay, args.error_rate)
+        return
+
+    results = {}
+    for target in args.url:
+        label, _, url = target.partition('=')
+        results[label] = asyncio.run(load(url, args.concurrency, args.duration, args.timeout))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Deterministic benchmark data: N users with M transactions each, spread over
+the last `days` days, plus daily rates for home-currency summaries. Rows are
+bulk-inserted with their sync sequence numbers and rollups, as the API would
+leave them.
+
+    python -m benchmarks.seed --users 20 --transactions 2000
+
+seeds the database configured by DJANGO_SETTINGS_MODULE (wetrack.settings by
+default). Users are named bench-0, bench-1, ... with password "bench"; an
+existing bench user is replaced.
+"""
+import argparse
+import json
+import os
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+
+def seed_rates(days, rates=None):
+    """Daily rates against the history base for the last `days` days, from FakeFastForex's drifting table"""
+    from django.utils import timezone
+
+    from currency.history import history_base, store_history
+    from currency.testing import FakeFastForex
+
+    fake = FakeFastForex(rates=rates)
+    base = history_base()
+    today = timezone.localdate()
+    span = [today - timedelta(days=i) for i in range(days + 1)]
+    return sum(store_history(base, target, {day: fake.historical(base, target, day) for day in span})
+               for target in fake.rates if target != base)
+
+
+def seed(users=10, transactions=1000, days=365, seed=0, batch_size=2000):
+    """Create the users and their transactions; returns the users"""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+
+    from tracker import rollups
+    from tracker.models import SyncCounter, Transaction
+
+    rng = random.Random(seed)
+    User = get_user_model()
+    password = make_password('bench')
+    categories = [code for code, _ in Transaction.CATEGORY_CHOICES]
+    currencies = [code for code, _ in Transaction.CURRENCY_CHOICES]
+    now = timezone.now()
+
+    names = [f"bench-{i}" for i in range(users)]
+    User.objects.filter(username__in=names).delete()
+    User.objects.bulk_create([User(username=name, password=password) for name in names])
+    # Primary keys are not returned by bulk_create on every backend
+    created = list(User.objects.filter(username__in=names).order_by('id'))
+
+    for user in created:
+        rows = [
+            Transaction(
+                user=user,
+                date=now - timedelta(seconds=rng.randrange(days * 86400)),
+                amount=Decimal(rng.randint(50, 20000)) / 100,
+                category=rng.choice(categories),
+                description=f"Purchase {n}",
+                currency=rng.choice(currencies),
+                sync_seq=n + 1,
+            )
+            for n in range(transactions)
+        ]
+        Transaction.objects.bulk_create(rows, batch_size=batch_size)
+        SyncCounter.objects.create(user=user, seq=transactions)
+        rollups.rebuild(user)
+    seed_rates(days)
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=1000, help='per user')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wetrack.settings')
+    django.setup()
+    users = seed(args.users, args.transactions, args.days, args.seed)
+    print(json.dumps({'users': [user.username for user in users], 'transactions_per_user': args.transactions}))
+
+
+if __name__ == '__main__':
+    main()
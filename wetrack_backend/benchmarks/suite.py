@@ -0,0 +1,145 @@
+"""
+Reproducible in-process benchmark of the main API paths, as JSON to diff
+between commits:
+
+    python -m benchmarks.suite --users 10 --transactions 2000 --iterations 200 > after.json
+
+Creates a throwaway test database (schema from the current models), seeds it
+with benchmarks.seed, points the rate provider at a FakeFastForex with the
+given latency and error rate, then runs each scenario's requests through the
+Django test client with JWT authentication, rotating over users and currency
+pairs. For every endpoint it reports p50/p95/p99 latency, throughput, query
+counts and response statuses. Requests run one at a time, so this measures
+per-request cost; benchmarks.loadtest drives concurrent load over HTTP.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import django
+
+from currency.testing import DEFAULT_RATES, FakeFastForex
+
+PAIRS = [(a, b) for a in DEFAULT_RATES for b in DEFAULT_RATES if a != b]
+
+# Scenario: [(endpoint label, path, params for iteration i)]
+SCENARIOS = {
+    'dashboard': [
+        ('summary_by_month', '/api/transactions/summary/', lambda i: {'by': 'month', 'home': 'GBP'}),
+        ('summary_by_category', '/api/transactions/summary/', lambda i: {'by': 'category'}),
+        ('recent_transactions', '/api/transactions/', lambda i: {'page_size': 20}),
+    ],
+    'transaction_list': [
+        ('transactions_page', '/api/transactions/', lambda i: {'page_size': 100}),
+    ],
+    'convert': [
+        ('convert', '/api/currency/convert/',
+         lambda i: {'amount': f"{10 + i % 90}.50", 'from': PAIRS[i % len(PAIRS)][0], 'to': PAIRS[i % len(PAIRS)][1]}),
+    ],
+    'rate': [
+        ('rate', '/api/currency/rate/', lambda i: {'from': PAIRS[i % len(PAIRS)][0], 'to': PAIRS[i % len(PAIRS)][1]}),
+    ],
+}
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize(latencies, queries, statuses):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'requests_per_second': round(len(ordered) / sum(ordered), 1),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'queries_mean': round(statistics.fmean(queries), 2),
+        'queries_max': max(queries),
+        'statuses': statuses,
+    }
+
+
+def run_scenario(steps, clients, iterations, warmup):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    samples = {label: ([], [], {}) for label, _, _ in steps}
+    started = None
+    for i in range(-warmup, iterations):
+        if i == 0:
+            started = time.perf_counter()
+        client = clients[i % len(clients)]
+        for label, path, params in steps:
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = client.get(path, params(i))
+                elapsed = time.perf_counter() - request_started
+            if i < 0:
+                continue
+            latencies, queries, statuses = samples[label]
+            latencies.append(elapsed)
+            queries.append(len(captured))
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    elapsed = time.perf_counter() - started
+    return {
+        'iterations_per_second': round(iterations / elapsed, 1),
+        'endpoints': {label: summarize(*sample) for label, sample in samples.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=2000, help='per user')
+    parser.add_argument('--iterations', type=int, default=200, help='per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured iterations per scenario')
+    parser.add_argument('--fake-delay', type=float, default=0.02, help='seconds per FakeFastForex answer')
+    parser.add_argument('--fake-error-rate', type=float, default=0.0)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='default: all')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wetrack.settings')
+    django.setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from benchmarks.seed import seed
+    from wetrack.writebehind import close_all
+
+    # Committed migrations trail the models; build the throwaway schema from the models
+    settings.MIGRATION_MODULES = {app: None for app in ('auth_app', 'currency', 'tracker')}
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with FakeFastForex(delay=args.fake_delay, error_rate=args.fake_error_rate, seed=args.seed) as fake:
+            settings.FASTFOREX_BASE_URL = fake.url
+            seed_started = time.perf_counter()
+            users = seed(args.users, args.transactions, seed=args.seed)
+            seed_seconds = time.perf_counter() - seed_started
+            clients = [Client(headers={'authorization': f"Bearer {AccessToken.for_user(user)}"}) for user in users]
+
+            results = {
+                'config': {**vars(args), 'database': connection.vendor, 'seed_seconds': round(seed_seconds, 2)},
+                'scenarios': {
+                    name: run_scenario(SCENARIOS[name], clients, args.iterations, args.warmup)
+                    for name in args.scenario or SCENARIOS
+                },
+                'upstream_requests': dict(fake.requests),
+            }
+    finally:
+        # Write out buffered conversions and logins while their tables still exist
+        close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
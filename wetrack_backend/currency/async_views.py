@@ -0,0 +1,180 @@
+# currency/async_views.py
+"""
+Native async versions of the currency endpoints for the ASGI entry point.
+Memory-tier hits are answered on the event loop, database and shared cache
+tiers go through sync_to_async in the same order as the sync path, and
+upstream calls use the httpx client under the same cross-worker lock, so one
+worker can keep many FastForex requests in flight. Responses match the sync
+views.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.utils.encoders import JSONEncoder
+
+from .audit import record_conversion
+from .cache import RateQuote, rate_cache
+from .matrix import MAX_AMOUNT, convert_amount, current_matrix
+from .providers import ProviderError, get_async_provider
+from .singleflight import AsyncSingleFlight, afetch_once_across_workers
+from .views import _with_staleness
+
+logger = logging.getLogger(__name__)
+
+_flights = AsyncSingleFlight()
+
+
+def _json(data, status=200):
+    # DRF's encoder, so Decimals render as numbers exactly like the sync views
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+
+async def _upstream(key, fetch, recheck):
+    """RateCache._upstream() for coroutines: one call per key in this loop, and across workers"""
+    name = ':'.join(key)
+
+    async def counted_fetch():
+        rate_cache.record('upstream_calls')
+        logger.info(f"Upstream fetch {name}")
+        return await fetch()
+
+    async def leader():
+        return await afetch_once_across_workers(
+            name, counted_fetch, recheck, lock_timeout=rate_cache.lock_timeout, wait=rate_cache.lock_wait,
+        )
+
+    result, shared = await _flights.do(key, leader)
+    if shared:
+        rate_cache.record('coalesced')
+    return result
+
+
+async def lookup_rate(from_currency, to_currency):
+    """Async counterpart of RateCache.lookup_rate()"""
+    quote = rate_cache.peek(from_currency, to_currency)
+    if quote is not None:
+        return quote
+    quote = await sync_to_async(rate_cache.lookup_cached)(from_currency, to_currency)
+    if quote is not None:
+        return quote
+
+    provider = get_async_provider()
+    if current_matrix() is None:
+        base = rate_cache.matrix_base
+
+        async def fetch_snapshot():
+            rates = await provider.fetch_all(base)
+            return await sync_to_async(rate_cache.store_snapshot)(base, rates)
+
+        matrix = await _upstream(('fetch-all', base), fetch_snapshot, rate_cache.recheck_snapshot)
+        if from_currency in matrix and to_currency in matrix:
+            return RateQuote(matrix.cross(from_currency, to_currency))
+
+    async def fetch_rate():
+        rate = await provider.fetch_rate(from_currency, to_currency)
+        return await sync_to_async(rate_cache.store_rate)(from_currency, to_currency, rate)
+
+    return RateQuote(await _upstream(('fetch-one', from_currency, to_currency), fetch_rate,
+                                     lambda: rate_cache.recheck_rate(from_currency, to_currency)))
+
+
+async def get_currencies():
+    """Async counterpart of RateCache.get_currencies()"""
+    currencies = rate_cache.peek_currencies()
+    if currencies is not None:
+        return currencies
+    currencies = await sync_to_async(rate_cache.cached_currencies)()
+    if currencies is not None:
+        return currencies
+
+    rate_cache.record('misses')
+    provider = get_async_provider()
+
+    async def fetch():
+        currencies = await provider.fetch_currencies()
+        await sync_to_async(rate_cache.store_currencies)(currencies)
+        return currencies
+
+    try:
+        return await _upstream(('currencies',), fetch, rate_cache.recheck_currencies)
+    except ProviderError as e:
+        return await sync_to_async(rate_cache.last_currencies)(e)
+
+
+@require_GET
+async def convert_currency(request):
+    """Convert currency using cached FastForex rates"""
+    try:
+        amount = request.GET.get('amount')
+        from_currency = request.GET.get('from', 'GBP').upper()
+        to_currency = request.GET.get('to', 'USD').upper()
+
+        if not amount:
+            return _json({'error': 'Amount is required'}, status=400)
+
+        try:
+            amount = Decimal(amount)
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+            return _json({'error': 'Invalid amount format'}, status=400)
+
+        quote = await lookup_rate(from_currency, to_currency)
+        try:
+            result = convert_amount(amount, quote.rate)
+        except InvalidOperation:
+            # Past the Decimal context's precision at this rate
+            return _json({'error': 'Invalid amount format'}, status=400)
+        # Only queued here; the buffer's thread does the INSERT. No DRF authentication on this path
+        record_conversion(from_currency, to_currency, amount, quote.rate, result)
+
+        return _json(_with_staleness({
+            'amount': amount,
+            'from': from_currency,
+            'to': to_currency,
+            'rate': quote.rate,
+            'result': result
+        }, quote))
+
+    except ProviderError as e:
+        return _json({'error': str(e)}, status=503)
+    except Exception as e:
+        logger.error(f"Currency conversion error: {str(e)}")
+        return _json({'error': str(e)}, status=500)
+
+
+@require_GET
+async def get_available_currencies(request):
+    """Fetch available currencies, cached from FastForex"""
+    try:
+        return _json({'currencies': await get_currencies()})
+
+    except ProviderError as e:
+        return _json({'error': str(e)}, status=503)
+    except Exception as e:
+        logger.error(f"Currency fetch error: {str(e)}")
+        return _json({'error': str(e)}, status=500)
+
+
+@require_GET
+async def get_exchange_rate(request):
+    """Get exchange rate between two currencies"""
+    try:
+        from_currency = request.GET.get('from', 'GBP').upper()
+        to_currency = request.GET.get('to', 'USD').upper()
+
+        quote = await lookup_rate(from_currency, to_currency)
+        return _json(_with_staleness({
+            'from': from_currency,
+            'to': to_currency,
+            'rate': quote.rate
+        }, quote))
+
+    except ProviderError as e:
+        return _json({'error': str(e)}, status=503)
+    except Exception as e:
+        logger.error(f"Exchange rate error: {str(e)}")
+        return _json({'error': str(e)}, status=500)
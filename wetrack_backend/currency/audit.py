@@ -0,0 +1,53 @@
+# currency/audit.py
+"""
+Records every conversion in CurrencyConversion through a write-behind
+buffer, so the convert endpoints never wait on the INSERT.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from wetrack.writebehind import WriteBehindBuffer
+
+from .matrix import quantize_rate
+from .models import CurrencyConversion
+
+logger = logging.getLogger(__name__)
+
+CENTS = Decimal('0.01')
+
+
+def _write(rows):
+    CurrencyConversion.objects.bulk_create(rows, batch_size=500)
+
+
+conversions = WriteBehindBuffer('currency-conversions', _write)
+
+
+def record_conversion(from_currency, to_currency, amount, rate, result, user_id=None):
+    """Queue one CurrencyConversion row; conversions the columns cannot hold are skipped"""
+    try:
+        values = {
+            'amount': amount.quantize(CENTS),
+            'converted_amount': result.quantize(CENTS),
+            'rate': quantize_rate(rate),
+        }
+    except InvalidOperation:
+        values = None
+    if values is None or any(len(value.as_tuple().digits) > CurrencyConversion._meta.get_field(name).max_digits
+                             for name, value in values.items()):
+        logger.debug(f"Not recording conversion of {amount} {from_currency}: too large for CurrencyConversion")
+        return
+    conversions.add(CurrencyConversion(
+        from_currency=from_currency,
+        to_currency=to_currency,
+        timestamp=timezone.now(),
+        user_id=user_id,
+        **values,
+    ))
+
+
+def user_id_of(request):
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
@@ -0,0 +1,127 @@
+# currency/batch.py
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import numpy as np
+
+from .matrix import AMOUNT_PLACES, MAX_AMOUNT, convert_amount, quantize_rate
+from .providers import ProviderError
+
+INT64_SAFE = 2 ** 62
+CODE = re.compile(r'^[A-Z]{3}$')
+
+
+class BatchError(Exception):
+    """Raised when a batch as a whole is malformed"""
+
+
+def parse_items(items, max_items, known=None, max_pairs=None):
+    """
+    Validate `[{amount, from, to}, ...]`. Returns (amounts, pairs, errors) where
+    invalid items have amount None and an entry in errors {index: message}.
+    Amounts may not exceed MAX_AMOUNT either way. Currencies must be three
+    letters and, given `known`, among those codes; each distinct pair may
+    cost an upstream call, so at most `max_pairs`.
+    """
+    if not isinstance(items, list):
+        raise BatchError('items must be a list')
+    if len(items) > max_items:
+        raise BatchError(f"At most {max_items} items per batch")
+
+    amounts, pairs, errors = [], [], {}
+    for i, item in enumerate(items):
+        amount = None
+        pair = (None, None)
+        if not isinstance(item, dict):
+            errors[i] = 'Each item must be an object'
+        else:
+            pair = (str(item.get('from', 'GBP')).upper(), str(item.get('to', 'USD')).upper())
+            unknown = [code for code in pair if not CODE.match(code) or (known is not None and code not in known)]
+            try:
+                amount = Decimal(str(item['amount'])).quantize(AMOUNT_PLACES, rounding=ROUND_HALF_UP)
+                if not amount.is_finite() or abs(amount) > MAX_AMOUNT:
+                    raise InvalidOperation
+            except KeyError:
+                errors[i] = 'Amount is required'
+            except (InvalidOperation, ValueError):
+                amount = None
+                errors[i] = 'Invalid amount format'
+            if unknown and i not in errors:
+                amount = None
+                errors[i] = f"Unknown currency: {unknown[0]}"
+        amounts.append(amount)
+        pairs.append(pair)
+
+    if max_pairs is not None:
+        distinct = {pair for i, pair in enumerate(pairs) if i not in errors}
+        if len(distinct) > max_pairs:
+            raise BatchError(f"At most {max_pairs} currency pairs per batch")
+    return amounts, pairs, errors
+
+
+def convert_batch(items, get_rate, max_items=5000, known=None, max_pairs=None):
+    """
+    Convert every item, resolving each distinct (from, to) pair once through
+    `get_rate`. Amounts are multiplied in integer cents x integer rate digits
+    so the vectorised result matches convert_amount() to the cent.
+    """
+    amounts, pairs, errors = parse_items(items, max_items, known, max_pairs)
+
+    pair_index = {}
+    pair_rates = []
+    pair_errors = {}
+    for i, pair in enumerate(pairs):
+        if i in errors or pair in pair_index:
+            continue
+        pair_index[pair] = len(pair_rates)
+        try:
+            pair_rates.append(quantize_rate(get_rate(*pair)))
+        except ProviderError as e:
+            pair_errors[pair] = str(e)
+            pair_rates.append(Decimal(0))
+
+    valid = [i for i, pair in enumerate(pairs) if i not in errors and pair not in pair_errors]
+    results = _multiply(
+        [amounts[i] for i in valid],
+        [pair_index[pairs[i]] for i in valid],
+        pair_rates,
+    )
+    converted = dict(zip(valid, results))
+
+    response = []
+    for i, (amount, (from_currency, to_currency)) in enumerate(zip(amounts, pairs)):
+        if i in errors:
+            response.append({'index': i, 'error': errors[i]})
+        elif (from_currency, to_currency) in pair_errors:
+            response.append({'index': i, 'error': pair_errors[(from_currency, to_currency)]})
+        else:
+            response.append({
+                'index': i,
+                'amount': amount,
+                'from': from_currency,
+                'to': to_currency,
+                'rate': pair_rates[pair_index[(from_currency, to_currency)]],
+                'result': converted[i],
+            })
+    return response
+
+
+def _multiply(amounts, rate_indices, pair_rates):
+    """Half-up rounded `amount * rate` for parallel lists, as Decimals"""
+    if not amounts:
+        return []
+    cents = [int(amount.scaleb(2)) for amount in amounts]
+    # Each rate as integer digits over 10 ** its decimal places
+    places = [max(0, -rate.as_tuple().exponent) for rate in pair_rates]
+    rate_digits = [int(rate.scaleb(p)) for rate, p in zip(pair_rates, places)]
+
+    # Checked on Python ints: numpy would raise OverflowError building the arrays
+    if max(map(abs, cents)) * max(map(abs, rate_digits)) >= INT64_SAFE:
+        # Too large for exact int64 arithmetic; fall back to Decimal
+        return [convert_amount(amount, pair_rates[r]) for amount, r in zip(amounts, rate_indices)]
+
+    digits = np.array(rate_digits, dtype=np.int64)[rate_indices]
+    scales = np.array([10 ** p for p in places], dtype=np.int64)[rate_indices]
+    product = np.array(cents, dtype=np.int64) * digits
+    rounded = np.sign(product) * ((np.abs(product) + scales // 2) // scales)
+    return [Decimal(int(value)).scaleb(-2) for value in rounded]
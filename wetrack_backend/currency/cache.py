@@ -0,0 +1,401 @@
+# currency/cache.py
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from wetrack.routers import replica_reads
+
+from .matrix import RateMatrix, current_matrix, publish, quantize_rate
+from .models import ExchangeRate
+from .providers import ProviderError, get_provider
+from .refresher import store_rates
+from .singleflight import SingleFlight, fetch_once_across_workers
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_OUTCOMES = ('matrix_hits', 'memory_hits', 'db_hits', 'stale_hits', 'misses')
+
+CURRENCIES_KEY = 'currency:currencies'
+LAST_CURRENCIES_KEY = 'currency:currencies:last'
+
+# `age` is in seconds and only meaningful when `stale` is True
+RateQuote = namedtuple('RateQuote', 'rate stale age', defaults=(False, 0))
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RateCache:
+    """
+    Exchange rates looked up in process memory first, then in the ExchangeRate
+    table, and only then from the upstream provider. A rate fetched upstream is
+    written back to both tiers so the next lookup (in any worker) stays local.
+
+    In front of both tiers sits the cross-rate matrix of `matrix_base`: while
+    a fresh snapshot exists, any pair it covers is answered without a lookup,
+    and a miss refreshes the whole snapshot with a single upstream call.
+
+    Upstream calls are coalesced: one in flight per key in this process, and
+    one per key across workers while the shared cache lock is held.
+
+    Expired rates are served stale while a background thread revalidates them,
+    so only a pair we have never seen waits on upstream.
+    """
+
+    def __init__(self, memory_ttl=None, db_ttl=None, maxsize=None, provider=None, matrix_base=None):
+        self._provider = provider
+        self.matrix_base = matrix_base or getattr(settings, 'CURRENCY_MATRIX_BASE', 'USD')
+        self._matrix_checked_at = None
+        self.memory_ttl = memory_ttl if memory_ttl is not None else getattr(settings, 'CURRENCY_RATE_CACHE_TTL', 300)
+        self.db_ttl = db_ttl if db_ttl is not None else getattr(settings, 'CURRENCY_RATE_DB_TTL', 3600)
+        maxsize = maxsize if maxsize is not None else getattr(settings, 'CURRENCY_RATE_CACHE_SIZE', 1024)
+        self._memory = LRUCache(maxsize, self.memory_ttl)
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(LOOKUP_OUTCOMES + ('upstream_calls', 'coalesced'), 0)
+        self._flights = SingleFlight()
+        self.lock_timeout = getattr(settings, 'CURRENCY_UPSTREAM_LOCK_TIMEOUT', 10)
+        self.lock_wait = getattr(settings, 'CURRENCY_UPSTREAM_WAIT', 5)
+        self._revalidations = LRUCache(256, getattr(settings, 'CURRENCY_REVALIDATE_INTERVAL', 10))
+
+    @property
+    def provider(self):
+        return self._provider or get_provider()
+
+    def record(self, outcome):
+        with self._stats_lock:
+            self._stats[outcome] += 1
+
+    def matrix(self):
+        """
+        The fresh cross-rate snapshot, or None. A stale or missing snapshot is
+        reloaded from ExchangeRate (e.g. rows the refresher wrote from another
+        process) at most once per memory TTL.
+        """
+        matrix = current_matrix()
+        if matrix is None or matrix.age() > self.memory_ttl:
+            now = time.monotonic()
+            if self._matrix_checked_at is None or now - self._matrix_checked_at >= self.memory_ttl:
+                self._matrix_checked_at = now
+                loaded = RateMatrix.from_db(self.matrix_base)
+                if loaded is not None and (matrix is None or loaded.as_of > matrix.as_of):
+                    publish(loaded)
+                    matrix = loaded
+        if matrix is not None and matrix.age() <= self.db_ttl:
+            return matrix
+        return None
+
+    def _upstream(self, key, fetch, recheck):
+        """
+        Run `fetch` for `key` unless an identical call is already in flight, in
+        which case share its result. `recheck` reads back what another worker's
+        fetch stored while we waited on its lock.
+        """
+        name = ':'.join(key)
+
+        def counted_fetch():
+            self.record('upstream_calls')
+            logger.info(f"Upstream fetch {name}")
+            return fetch()
+
+        def leader():
+            return fetch_once_across_workers(
+                name, counted_fetch, recheck, lock_timeout=self.lock_timeout, wait=self.lock_wait,
+            )
+
+        result, shared = self._flights.do(key, leader)
+        if shared:
+            self.record('coalesced')
+        return result
+
+    def refresh_matrix(self):
+        """Fetch the whole `matrix_base` snapshot upstream, store and publish it"""
+        base = self.matrix_base
+
+        def fetch():
+            return self.store_snapshot(base, self.provider.fetch_all(base))
+
+        return self._upstream(('fetch-all', base), fetch, self.recheck_snapshot)
+
+    def recheck_snapshot(self):
+        """The `matrix_base` snapshot another worker stored while we waited on its lock, published, or None"""
+        matrix = RateMatrix.from_db(self.matrix_base)
+        if matrix is not None and matrix.age() <= self.db_ttl:
+            publish(matrix)
+            return matrix
+        return None
+
+    def recheck_rate(self, from_currency, to_currency):
+        """A rate another worker stored while we waited on its lock, or None"""
+        row = self._stored_rate(from_currency, to_currency, max_age=self.db_ttl)
+        return row[0] if row else None
+
+    def _stored_rate(self, from_currency, to_currency, max_age=None):
+        rows = ExchangeRate.objects.filter(base_currency=from_currency, target_currency=to_currency)
+        if max_age is not None:
+            rows = rows.filter(last_updated__gte=timezone.now() - timedelta(seconds=max_age))
+        return rows.values_list('rate', 'last_updated').first()
+
+    def _fetch_rate(self, from_currency, to_currency):
+        def fetch():
+            return self.store_rate(from_currency, to_currency, self.provider.fetch_rate(from_currency, to_currency))
+
+        return self._upstream(('fetch-one', from_currency, to_currency), fetch,
+                              lambda: self.recheck_rate(from_currency, to_currency))
+
+    def _spawn(self, fn):
+        threading.Thread(target=fn, daemon=True).start()
+
+    def _revalidate(self, key, refresh):
+        """Run `refresh` in the background unless it was tried recently or the provider is down"""
+        if self._revalidations.get(key) or not self.provider.is_available():
+            return
+        self._revalidations.set(key, True)
+
+        def run():
+            try:
+                refresh()
+            except ProviderError as e:
+                logger.warning(f"Background revalidation of {':'.join(key)} failed: {str(e)}")
+            finally:
+                connections.close_all()
+
+        self._spawn(run)
+
+    def peek(self, from_currency, to_currency):
+        """
+        Answer from the fresh matrix or memory tier only, or return None. Never
+        touches the database or network, so it is safe on an event loop.
+        """
+        if from_currency == to_currency:
+            return RateQuote(Decimal('1'))
+
+        matrix = current_matrix()
+        if matrix is not None and matrix.age() <= self.memory_ttl \
+                and from_currency in matrix and to_currency in matrix:
+            self.record('matrix_hits')
+            return RateQuote(matrix.cross(from_currency, to_currency))
+
+        rate = self._memory.get(('rate', from_currency, to_currency))
+        if rate is not None:
+            self.record('memory_hits')
+            return RateQuote(rate)
+        return None
+
+    def lookup_cached(self, from_currency, to_currency):
+        """
+        Answer from every local tier, or return None (counted as a miss) when
+        only upstream can. If only an expired rate is known it comes back with
+        stale=True and its age, and a refresh is started in the background.
+        """
+        quote = self.peek(from_currency, to_currency)
+        if quote is not None:
+            return quote
+
+        # Rate rows are shared and refreshed in the background, so a replica's lag is harmless here
+        with replica_reads():
+            matrix = self.matrix()
+            if matrix is not None and from_currency in matrix and to_currency in matrix:
+                self.record('matrix_hits')
+                return RateQuote(matrix.cross(from_currency, to_currency))
+
+            key = ('rate', from_currency, to_currency)
+            row = self._stored_rate(from_currency, to_currency)
+        age = (timezone.now() - row[1]).total_seconds() if row else None
+        if row is not None and age <= self.db_ttl:
+            self.record('db_hits')
+            self._memory.set(key, row[0])
+            return RateQuote(row[0])
+
+        published = current_matrix()
+        if published is not None and published.base == self.matrix_base \
+                and from_currency in published and to_currency in published:
+            self.record('stale_hits')
+            self._revalidate(('fetch-all', self.matrix_base), self.refresh_matrix)
+            return RateQuote(published.cross(from_currency, to_currency), True, published.age())
+        if row is not None:
+            self.record('stale_hits')
+            self._revalidate(
+                ('fetch-one', from_currency, to_currency),
+                lambda: self._memory.set(key, self._fetch_rate(from_currency, to_currency)),
+            )
+            return RateQuote(row[0], True, age)
+
+        self.record('misses')
+        return None
+
+    def lookup_rate(self, from_currency, to_currency):
+        """
+        Return a RateQuote for one unit of `from_currency` in `to_currency`,
+        going upstream only when no local tier knows the pair at all.
+        """
+        quote = self.lookup_cached(from_currency, to_currency)
+        if quote is not None:
+            return quote
+
+        if current_matrix() is None:
+            matrix = self.refresh_matrix()
+            if from_currency in matrix and to_currency in matrix:
+                return RateQuote(matrix.cross(from_currency, to_currency))
+
+        rate = self._fetch_rate(from_currency, to_currency)
+        self._memory.set(('rate', from_currency, to_currency), rate)
+        return RateQuote(rate)
+
+    def get_rate(self, from_currency, to_currency):
+        """Return the (possibly stale) rate for one unit of `from_currency` in `to_currency`"""
+        return self.lookup_rate(from_currency, to_currency).rate
+
+    def store_snapshot(self, base, rates):
+        """Persist a fetched `base` snapshot and publish it as the matrix"""
+        store_rates(base, rates)
+        matrix = RateMatrix(base, rates)
+        publish(matrix)
+        return matrix
+
+    def store_rate(self, from_currency, to_currency, rate):
+        """Persist a single fetched rate in both tiers"""
+        rate = quantize_rate(rate)
+        ExchangeRate.objects.update_or_create(
+            base_currency=from_currency,
+            target_currency=to_currency,
+            defaults={'rate': rate, 'last_updated': timezone.now()},
+        )
+        self._memory.set(('rate', from_currency, to_currency), rate)
+        return rate
+
+    def peek_currencies(self):
+        """The currency map from the memory tier, or None (no I/O)"""
+        currencies = self._memory.get(('currencies',))
+        if currencies is not None:
+            self.record('memory_hits')
+        return currencies
+
+    def store_currencies(self, currencies):
+        cache.set(CURRENCIES_KEY, currencies, self.db_ttl)
+        cache.set(LAST_CURRENCIES_KEY, currencies, None)
+        self._memory.set(('currencies',), currencies, ttl=self.db_ttl)
+
+    def cached_currencies(self):
+        """The currency map from the memory or shared tier, or None (no upstream call)"""
+        currencies = self.peek_currencies()
+        if currencies is not None:
+            return currencies
+
+        currencies = cache.get(CURRENCIES_KEY)
+        if currencies is not None:
+            self.record('db_hits')
+            self._memory.set(('currencies',), currencies, ttl=self.db_ttl)
+        return currencies
+
+    def recheck_currencies(self):
+        return cache.get(CURRENCIES_KEY)
+
+    def last_currencies(self, error):
+        """The last currency map fetched, served when upstream fails; raises `error` without one"""
+        currencies = cache.get(LAST_CURRENCIES_KEY)
+        if currencies is None:
+            raise error
+        logger.warning('Serving last known currency list')
+        return currencies
+
+    def get_currencies(self):
+        """
+        Return the provider's currency map. It has no table, so Django's cache
+        stands in for the DB tier; both tiers keep it for the DB TTL. The last
+        map fetched is kept without expiry and served if upstream fails.
+        """
+        currencies = self.cached_currencies()
+        if currencies is not None:
+            return currencies
+
+        self.record('misses')
+
+        def fetch():
+            currencies = self.provider.fetch_currencies()
+            self.store_currencies(currencies)
+            return currencies
+
+        try:
+            return self._upstream(('currencies',), fetch, self.recheck_currencies)
+        except ProviderError as e:
+            return self.last_currencies(e)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = sum(stats[outcome] for outcome in LOOKUP_OUTCOMES)
+        stats['hit_ratio'] = (lookups - stats['misses']) / lookups if lookups else 0.0
+        stats['memory_entries'] = len(self._memory)
+        matrix = current_matrix()
+        stats['matrix_currencies'] = len(matrix) if matrix is not None else 0
+        return stats
+
+    def known_currencies(self):
+        """
+        Codes the matrix covers or the provider lists, so made-up currencies
+        are rejected before they cost an upstream call; None if neither is known
+        """
+        self.matrix()
+        matrix = current_matrix()
+        codes = set(matrix.codes) if matrix is not None else set()
+        try:
+            codes.update(self.get_currencies())
+        except ProviderError as e:
+            logger.warning(f"Currency list unavailable, validating against the matrix only: {str(e)}")
+        return codes or None
+
+    def clear(self):
+        """Drop the memory tier, matrix and counters (the DB tier is kept)"""
+        self._memory.clear()
+        self._revalidations.clear()
+        cache.delete_many([CURRENCIES_KEY, LAST_CURRENCIES_KEY])
+        self._matrix_checked_at = None
+        publish(None)
+        with self._stats_lock:
+            for outcome in self._stats:
+                self._stats[outcome] = 0
+
+
+rate_cache = RateCache()
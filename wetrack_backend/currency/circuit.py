@@ -0,0 +1,117 @@
+# currency/circuit.py
+import logging
+import threading
+import time
+
+from .providers import ProviderError, ProviderUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ProviderUnavailable):
+    """Raised instead of calling upstream while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive ProviderUnavailable errors.
+    Once `reset_timeout` seconds have passed a single trial call is let through
+    (half-open); its success closes the circuit, its failure re-opens it. A
+    trial that ends without an outcome (cancelled, say, when an ASGI client
+    disconnects) hands the trial to the next call.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """True if a call may go upstream now (claims the half-open trial)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def is_open(self):
+        with self._lock:
+            return self.state != self.CLOSED and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give up a half-open trial that ended without an outcome; the next call makes its own"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                # opened_at is already past reset_timeout, so the next allow_request() claims a trial
+                self.state = self.OPEN
+
+    def _reject(self):
+        raise CircuitOpenError(f"{self.name} is unavailable, retrying in {self.reset_timeout}s")
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow_request():
+            self._reject()
+        try:
+            result = fn(*args, **kwargs)
+        except ProviderUnavailable:
+            self.record_failure()
+            raise
+        except ProviderError:
+            # Upstream answered, just not with what we asked for
+            self.record_success()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        """call() for a coroutine function"""
+        if not self.allow_request():
+            self._reject()
+        try:
+            result = await fn(*args, **kwargs)
+        except ProviderUnavailable:
+            self.record_failure()
+            raise
+        except ProviderError:
+            self.record_success()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
@@ -0,0 +1,217 @@
+# currency/client.py
+import asyncio
+import bisect
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from wetrack.perf import record_upstream
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+def _observe(histogram, started):
+    # Per endpoint here, and per request for the perf middleware
+    elapsed = time.perf_counter() - started
+    histogram.observe(elapsed)
+    record_upstream(elapsed)
+
+
+class LatencyHistogram:
+    """Thread-safe latency histogram over LATENCY_BUCKETS_MS"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        slot = bisect.bisect_left(self.buckets, ms)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.total_ms += ms
+
+    def percentile(self, q):
+        """Upper bucket bound below which a fraction `q` of observations fall"""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            seen += n
+            if seen >= q * count:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            counts, count, total_ms = list(self.counts), self.count, self.total_ms
+        cumulative, seen = {}, 0
+        for bound, n in zip(self.buckets + ('+Inf',), counts):
+            seen += n
+            cumulative[str(bound)] = seen
+        return {
+            'count': count,
+            'mean_ms': total_ms / count if count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+            'buckets': cumulative,
+        }
+
+
+class PooledHTTPClient:
+    """
+    Shared outbound HTTP client: one requests.Session whose urllib3 pool keeps
+    connections (and their TLS sessions) alive across calls and threads.
+    Connection errors, timeouts and 429/5xx answers are retried with capped,
+    fully-jittered exponential backoff. Latency is recorded per endpoint.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=32, retries=1, backoff=0.1, backoff_max=2.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.latency = {}
+        self._latency_lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.latency.get(name)
+        if histogram is None:
+            with self._latency_lock:
+                histogram = self.latency.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+
+    def get(self, url, params=None, timeout=None, name=None):
+        """GET `url`, retrying transient failures; `name` labels the latency histogram"""
+        histogram = self.histogram(name or url)
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                _observe(histogram, started)
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Retrying {name or url} after connection error (attempt {attempt + 1})")
+            else:
+                _observe(histogram, started)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                logger.warning(f"Retrying {name or url} after HTTP {response.status_code} (attempt {attempt + 1})")
+            self._sleep_before_retry(attempt)
+
+    def stats(self):
+        with self._latency_lock:
+            latency = dict(self.latency)
+        return {name: histogram.snapshot() for name, histogram in latency.items()}
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncPooledHTTPClient:
+    """
+    httpx counterpart of PooledHTTPClient for async views, with the same retry
+    policy. An httpx.AsyncClient belongs to the event loop that created it, so
+    one pooled client is kept per running loop. Latency is recorded in the
+    histograms of `histograms` (the sync client) so both paths report together.
+    """
+
+    def __init__(self, histograms, max_connections=100, max_keepalive=20, retries=1, backoff=0.1, backoff_max=2.0):
+        self.histograms = histograms
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(limits=self.limits)
+        return client
+
+    async def get(self, url, params=None, timeout=None, name=None):
+        """GET `url`, retrying transient failures; `timeout` is (connect, read)"""
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        client = self._client()
+        histogram = self.histograms.histogram(name or url)
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, params=params, timeout=timeout)
+            except httpx.TransportError:
+                _observe(histogram, started)
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Retrying {name or url} after connection error (attempt {attempt + 1})")
+            else:
+                _observe(histogram, started)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                logger.warning(f"Retrying {name or url} after HTTP {response.status_code} (attempt {attempt + 1})")
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+
+    async def aclose(self):
+        """Close the client of the running loop"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, configured by FASTFOREX_POOL_SIZE and FASTFOREX_RETRIES"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledHTTPClient(
+                    pool_maxsize=getattr(settings, 'FASTFOREX_POOL_SIZE', 32),
+                    retries=getattr(settings, 'FASTFOREX_RETRIES', 1),
+                )
+    return _client
+
+
+def get_async_client():
+    """The process-wide async client; its connection limit is FASTFOREX_ASYNC_POOL_SIZE"""
+    global _async_client
+    if _async_client is None:
+        histograms = get_client()
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncPooledHTTPClient(
+                    histograms,
+                    max_connections=getattr(settings, 'FASTFOREX_ASYNC_POOL_SIZE', 100),
+                    retries=getattr(settings, 'FASTFOREX_RETRIES', 1),
+                )
+    return _async_client
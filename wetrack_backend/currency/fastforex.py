@@ -0,0 +1,172 @@
+# currency/fastforex.py
+import os
+import logging
+import threading
+from datetime import date
+from decimal import Decimal
+
+import httpx
+import requests
+from django.conf import settings
+
+from .circuit import CircuitBreaker
+from .client import get_async_client, get_client
+from .providers import ProviderError, ProviderUnavailable, RateProvider
+
+logger = logging.getLogger(__name__)
+
+
+class FastForexError(ProviderError):
+    """Raised when FastForex cannot give us a usable answer"""
+
+
+class FastForexUnavailable(FastForexError, ProviderUnavailable):
+    """Raised when FastForex times out, is unreachable or returns a 5xx"""
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def shared_breaker():
+    """The circuit breaker shared by the sync and async FastForex providers"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    'fastforex',
+                    failure_threshold=getattr(settings, 'FASTFOREX_BREAKER_FAILURES', 5),
+                    reset_timeout=getattr(settings, 'FASTFOREX_BREAKER_RESET', 30),
+                )
+    return _breaker
+
+
+class FastForexProvider(RateProvider):
+    """
+    Rates from api.fastforex.io (or a stand-in at FASTFOREX_BASE_URL). Calls
+    share the pooled keep-alive client, have bounded connect/read timeouts and
+    go through a circuit breaker, so an outage fails fast instead of holding
+    worker threads.
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=None, breaker=None, client=None):
+        base_url = base_url or getattr(settings, 'FASTFOREX_BASE_URL', 'https://api.fastforex.io')
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.client = client or get_client()
+        self.timeout = timeout or getattr(settings, 'FASTFOREX_TIMEOUT', (3.05, 5))
+        self.breaker = breaker or shared_breaker()
+
+    def is_available(self):
+        return not self.breaker.is_open()
+
+    def _prepare(self, endpoint, params):
+        params['api_key'] = self.api_key or os.getenv('CURR_API')
+        url = f"{self.base_url}/{endpoint}"
+        logger.info(f"Making request to FastForex: {url}")
+        return url
+
+    def _get(self, endpoint, **params):
+        return self.breaker.call(self._request, endpoint, params)
+
+    def _request(self, endpoint, params):
+        url = self._prepare(endpoint, params)
+        try:
+            response = self.client.get(url, params=params, timeout=self.timeout, name=endpoint)
+        except requests.RequestException as e:
+            logger.error(f"FastForex request failed: {str(e)}")
+            raise FastForexUnavailable('Currency service unavailable')
+        return _check(response)
+
+    def fetch_all(self, base):
+        return _parse_rates(self._get('fetch-all', **{'from': base}))
+
+    def fetch_rate(self, from_currency, to_currency):
+        return _parse_rate(self._get('fetch-one', **{'from': from_currency, 'to': to_currency}), to_currency)
+
+    def fetch_currencies(self):
+        return self._get('currencies').get('currencies', {})
+
+    def fetch_history(self, base, target, start, end):
+        data = self._get('time-series', **{'from': base, 'to': target,
+                                           'start': start.isoformat(), 'end': end.isoformat()})
+        return _parse_series(data, target)
+
+
+class AsyncFastForexProvider(FastForexProvider):
+    """
+    FastForexProvider for async views: the same endpoints, timeouts and
+    circuit breaker, with calls made through the httpx async client so the
+    event loop keeps serving other requests while FastForex answers.
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=None, breaker=None, client=None):
+        super().__init__(base_url, api_key, timeout, breaker, client=client or get_async_client())
+
+    async def _get(self, endpoint, **params):
+        return await self.breaker.call_async(self._request, endpoint, params)
+
+    async def _request(self, endpoint, params):
+        url = self._prepare(endpoint, params)
+        try:
+            response = await self.client.get(url, params=params, timeout=self.timeout, name=endpoint)
+        except httpx.HTTPError as e:
+            logger.error(f"FastForex request failed: {str(e)}")
+            raise FastForexUnavailable('Currency service unavailable')
+        return _check(response)
+
+    async def fetch_all(self, base):
+        return _parse_rates(await self._get('fetch-all', **{'from': base}))
+
+    async def fetch_rate(self, from_currency, to_currency):
+        return _parse_rate(await self._get('fetch-one', **{'from': from_currency, 'to': to_currency}), to_currency)
+
+    async def fetch_currencies(self):
+        return (await self._get('currencies')).get('currencies', {})
+
+    async def fetch_history(self, base, target, start, end):
+        data = await self._get('time-series', **{'from': base, 'to': target,
+                                                 'start': start.isoformat(), 'end': end.isoformat()})
+        return _parse_series(data, target)
+
+
+def _check(response):
+    """Decoded JSON of a FastForex response, or the matching error"""
+    try:
+        data = response.json()
+    except ValueError:
+        logger.error(f"FastForex returned non-JSON ({response.status_code})")
+        raise FastForexUnavailable('Invalid response from currency service')
+
+    if response.status_code != 200:
+        error_message = data.get('message', data.get('error', 'Currency service request failed'))
+        logger.error(f"FastForex API error: {error_message}")
+        if response.status_code >= 500:
+            raise FastForexUnavailable(error_message)
+        raise FastForexError(error_message)
+    return data
+
+
+def _parse_rates(data):
+    try:
+        return {code: Decimal(str(rate)) for code, rate in data['results'].items()}
+    except (KeyError, AttributeError):
+        logger.error(f"Unexpected response format: {data}")
+        raise FastForexError('Invalid response format from currency service')
+
+
+def _parse_series(data, to_currency):
+    try:
+        return {date.fromisoformat(day): Decimal(str(rate)) for day, rate in data['results'][to_currency].items()}
+    except (KeyError, AttributeError, TypeError, ValueError):
+        logger.error(f"Unexpected response format: {data}")
+        raise FastForexError('Invalid response format from currency service')
+
+
+def _parse_rate(data, to_currency):
+    try:
+        return Decimal(str(data['result'][to_currency]))
+    except (KeyError, TypeError):
+        logger.error(f"Unexpected response format: {data}")
+        raise FastForexError('Invalid response format from currency service')
@@ -0,0 +1,153 @@
+# currency/history.py
+"""
+Daily exchange rate history. DailyRate keeps one row per currency per day
+against CURRENCY_MATRIX_BASE, and any pair on any day is derived from two of
+them like the live RateMatrix. RateHistory loads the series needed for a
+date span up front and answers as-of lookups (the latest rate on or before
+a day) by binary search, so converting many rows costs no further queries.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .matrix import quantize_rate
+from .models import DailyRate
+from .providers import ProviderError, get_provider
+
+logger = logging.getLogger(__name__)
+
+
+class MissingRate(LookupError):
+    """Raised when no rate for a pair is known on or before a day"""
+
+
+def history_base():
+    return getattr(settings, 'CURRENCY_MATRIX_BASE', 'USD')
+
+
+class RateHistory:
+    """
+    As-of rates for a set of currencies. Each series is a sorted int64 array
+    of date ordinals with a parallel float64 array of rates per unit of the
+    base, so a lookup is one searchsorted over that currency's days.
+    """
+
+    def __init__(self, base, series):
+        self.base = base
+        self.series = {}
+        for code, points in series.items():
+            points = sorted(points)
+            days = np.array([day.toordinal() for day, _ in points], dtype=np.int64)
+            rates = np.array([float(rate) for _, rate in points], dtype=np.float64)
+            days.setflags(write=False)
+            rates.setflags(write=False)
+            self.series[code] = (days, rates)
+
+    @classmethod
+    def load(cls, currencies, start, end, base=None):
+        """
+        Series for `currencies` covering `start`..`end`, including the last rate
+        before `start` so the first days resolve. Two queries.
+        """
+        base = base or history_base()
+        codes = set(currencies) - {base}
+        rows = DailyRate.objects.filter(base_currency=base, target_currency__in=codes)
+        earliest = (rows.filter(date__lte=start)
+                    .values('target_currency')
+                    .annotate(last=Max('date'))
+                    .order_by()
+                    .values_list('last', flat=True))
+        earliest = min(earliest, default=start)
+
+        series = {code: [] for code in codes}
+        for code, day, rate in (rows.filter(date__gte=earliest, date__lte=end)
+                                .values_list('target_currency', 'date', 'rate')):
+            series[code].append((day, rate))
+        return cls(base, series)
+
+    def as_of(self, code, day):
+        """Float rate of `code` per unit of the base on `day`, or None if none is known yet"""
+        if code == self.base:
+            return 1.0
+        days, rates = self.series.get(code, (None, None))
+        if days is None:
+            return None
+        i = int(np.searchsorted(days, day.toordinal(), side='right')) - 1
+        return float(rates[i]) if i >= 0 else None
+
+    def rate(self, from_currency, to_currency, day):
+        """Decimal rate for one unit of `from_currency` in `to_currency` on `day`, or None"""
+        if from_currency == to_currency:
+            return Decimal('1')
+        from_rate, to_rate = self.as_of(from_currency, day), self.as_of(to_currency, day)
+        if from_rate is None or to_rate is None:
+            return None
+        return quantize_rate(to_rate / from_rate)
+
+    def require(self, from_currency, to_currency, day):
+        """rate(), raising MissingRate instead of returning None"""
+        rate = self.rate(from_currency, to_currency, day)
+        if rate is None:
+            raise MissingRate(f"No {from_currency}/{to_currency} rate on or before {day}")
+        return rate
+
+
+def _upsert(rows, batch_size=500):
+    DailyRate.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['base_currency', 'target_currency', 'date'],
+        update_fields=['rate'],
+    )
+    return len(rows)
+
+
+def store_history(base, target, series):
+    """Upsert {date: rate} for one pair into DailyRate; returns the row count"""
+    return _upsert([
+        DailyRate(base_currency=base, target_currency=target, date=day, rate=quantize_rate(rate))
+        for day, rate in series.items()
+    ])
+
+
+def store_daily(base, rates, day):
+    """Record a fetched {target: rate} snapshot of the history base as the rates for `day`"""
+    if base != history_base():
+        return 0
+    return _upsert([
+        DailyRate(base_currency=base, target_currency=target, date=day, rate=quantize_rate(rate))
+        for target, rate in rates.items()
+        if target != base
+    ])
+
+
+def backfill(targets, start, end, provider=None, chunk_days=365):
+    """
+    Fetch and store daily rates of each target against the history base from
+    `start` through `end`, `chunk_days` per upstream call. A failing target is
+    logged and skipped. Returns {target: rows stored}.
+    """
+    provider = provider or get_provider()
+    base = history_base()
+    stored = {}
+    for target in targets:
+        if target == base:
+            continue
+        try:
+            count = 0
+            chunk_start = start
+            while chunk_start <= end:
+                chunk_end = min(end, chunk_start + timedelta(days=chunk_days - 1))
+                count += store_history(base, target, provider.fetch_history(base, target, chunk_start, chunk_end))
+                chunk_start = chunk_end + timedelta(days=1)
+        except ProviderError as e:
+            logger.error(f"Rate backfill failed for {target}: {str(e)}")
+            continue
+        stored[target] = count
+        logger.info(f"Backfilled {count} daily rates for {base}/{target}")
+    return stored
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from currency.history import backfill, history_base
+from currency.refresher import default_bases
+from tracker.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load DailyRate history against CURRENCY_MATRIX_BASE from the rate provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--currency', action='append', dest='currencies',
+                            help='Currency to backfill (repeatable, defaults to every Transaction currency)')
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help='First day (YYYY-MM-DD, defaults to the earliest transaction)')
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help='Last day (YYYY-MM-DD, defaults to today)')
+
+    def handle(self, *args, **options):
+        currencies = [code.upper() for code in options['currencies'] or default_bases()]
+        end = options['end'] or timezone.localdate()
+        start = options['start']
+        if start is None:
+            earliest = Transaction.objects.aggregate(earliest=Min('date'))['earliest']
+            start = timezone.localtime(earliest).date() if earliest else end
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        stored = backfill(currencies, start, end)
+        base = history_base()
+        for code in currencies:
+            if code == base:
+                continue
+            if code in stored:
+                self.stdout.write(self.style.SUCCESS(f"{base}/{code}: {stored[code]} days"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{base}/{code}: backfill failed"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from currency.refresher import RateRefresher, default_bases, refresh_rates
+
+
+class Command(BaseCommand):
+    help = 'Bulk-refresh ExchangeRate from one upstream call per base currency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', action='append', dest='bases',
+                            help='Base currency to refresh (repeatable, defaults to CURRENCY_REFRESH_BASES)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and refresh every --interval seconds')
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Seconds between refreshes in --loop mode')
+
+    def handle(self, *args, **options):
+        bases = [base.upper() for base in options['bases'] or default_bases()]
+
+        if options['loop']:
+            refresher = RateRefresher(bases, options['interval'])
+            self.stdout.write(f"Refreshing {', '.join(bases)} every {refresher.interval}s")
+            try:
+                refresher.run()
+            except KeyboardInterrupt:
+                refresher.stop()
+            return
+
+        stored = refresh_rates(bases)
+        for base in bases:
+            if base in stored:
+                self.stdout.write(self.style.SUCCESS(f"{base}: {stored[base]} rates"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{base}: refresh failed"))
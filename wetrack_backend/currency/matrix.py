@@ -0,0 +1,97 @@
+# currency/matrix.py
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import ExchangeRate
+
+# Rates keep RATE_DIGITS significant digits (within the RATE_MAX_PLACES the rate columns
+# hold), so one VND in USD is 0.00003935... rather than a fixed-point 0.000039
+RATE_DIGITS = 10
+RATE_MAX_PLACES = 16
+AMOUNT_PLACES = Decimal('0.01')
+# Largest amount converted: at the rate columns' digits, amount * rate still fits the
+# default 28-digit Decimal context when quantized to cents
+MAX_AMOUNT = Decimal('1e15')
+
+
+def quantize_rate(rate):
+    """Round a float or Decimal rate half-up to RATE_DIGITS significant digits"""
+    rate = Decimal(repr(rate) if isinstance(rate, float) else rate)
+    if not rate:
+        return rate.quantize(Decimal(1))
+    places = max(0, min(RATE_DIGITS - 1 - rate.adjusted(), RATE_MAX_PLACES))
+    return rate.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def convert_amount(amount, rate):
+    """`amount` (taken to whole cents) times `rate`, rounded half-up to cents"""
+    amount = Decimal(amount).quantize(AMOUNT_PLACES, rounding=ROUND_HALF_UP)
+    return (amount * rate).quantize(AMOUNT_PLACES, rounding=ROUND_HALF_UP)
+
+
+class RateMatrix:
+    """
+    Immutable snapshot of one base currency's rates held in a float64 array.
+    Any pair is derived from it as r[to] / r[from], so one upstream call per
+    base answers every cross rate.
+    """
+
+    def __init__(self, base, rates, as_of=None):
+        rates = dict(rates)
+        rates[base] = 1
+        self.base = base
+        self.codes = tuple(sorted(rates))
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.rates = np.array([float(rates[code]) for code in self.codes], dtype=np.float64)
+        self.rates.setflags(write=False)
+        self.as_of = as_of or timezone.now()
+
+    @classmethod
+    def from_db(cls, base):
+        """Build a snapshot from the stored ExchangeRate rows of `base`, or None"""
+        rows = ExchangeRate.objects.filter(base_currency=base)
+        rates = dict(rows.values_list('target_currency', 'rate'))
+        if not rates:
+            return None
+        return cls(base, rates, as_of=rows.aggregate(oldest=Min('last_updated'))['oldest'])
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def __len__(self):
+        return len(self.codes)
+
+    def age(self):
+        """Seconds since the oldest rate in the snapshot was fetched"""
+        return (timezone.now() - self.as_of).total_seconds()
+
+    def cross(self, from_currency, to_currency):
+        """Decimal rate for one unit of `from_currency` in `to_currency`"""
+        rates = self.rates
+        return quantize_rate(float(rates[self.index[to_currency]] / rates[self.index[from_currency]]))
+
+    def indices(self, codes):
+        """Array positions of `codes`; raises KeyError for unknown currencies"""
+        index = self.index
+        return np.fromiter((index[code] for code in codes), dtype=np.intp, count=len(codes))
+
+    def cross_many(self, from_indices, to_indices):
+        """Vectorised float64 cross rates for parallel arrays of positions"""
+        return self.rates[to_indices] / self.rates[from_indices]
+
+
+_current = None
+
+
+def current_matrix():
+    """The snapshot most recently published in this process"""
+    return _current
+
+
+def publish(matrix):
+    """Swap in a new snapshot; readers see the old or new one, never a mix"""
+    global _current
+    _current = matrix
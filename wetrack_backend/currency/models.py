@@ -8,7 +8,7 @@ class CurrencyConversion(models.Model):
     to_currency = models.CharField(max_length=3)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     converted_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    rate = models.DecimalField(max_digits=10, decimal_places=6)
+    rate = models.DecimalField(max_digits=28, decimal_places=16)
     timestamp = models.DateTimeField(default=timezone.now)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,  # Changed from 'auth.User' to settings.AUTH_USER_MODEL
@@ -30,7 +30,7 @@ class CurrencyConversion(models.Model):
 class ExchangeRate(models.Model):
     base_currency = models.CharField(max_length=3)
     target_currency = models.CharField(max_length=3)
-    rate = models.DecimalField(max_digits=10, decimal_places=6)
+    rate = models.DecimalField(max_digits=28, decimal_places=16)
     last_updated = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -41,4 +41,18 @@ class ExchangeRate(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.base_currency}/{self.target_currency}: {self.rate}"
\ No newline at end of file
+        return f"{self.base_currency}/{self.target_currency}: {self.rate}"
+
+class DailyRate(models.Model):
+    """Closing rate of `target_currency` per unit of `base_currency` on `date`"""
+    base_currency = models.CharField(max_length=3)
+    target_currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=28, decimal_places=16)
+
+    class Meta:
+        ordering = ['base_currency', 'target_currency', 'date']
+        unique_together = ('base_currency', 'target_currency', 'date')
+
+    def __str__(self):
+        return f"{self.base_currency}/{self.target_currency} {self.date}: {self.rate}"
@@ -0,0 +1,71 @@
+# currency/providers.py
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class ProviderError(Exception):
+    """Raised when an exchange rate provider cannot give us a usable answer"""
+
+
+class ProviderUnavailable(ProviderError):
+    """Raised when the provider is down, slow or erroring (counts against its circuit)"""
+
+
+class RateProvider:
+    """
+    Interface for upstream exchange rate sources. Set CURRENCY_RATE_PROVIDER to
+    the dotted path of a subclass to swap the source (e.g. a fake in tests).
+    """
+
+    def fetch_all(self, base):
+        """Return {currency_code: Decimal rate} for one unit of `base`"""
+        raise NotImplementedError
+
+    def fetch_rate(self, from_currency, to_currency):
+        """Return the Decimal rate for one unit of `from_currency` in `to_currency`"""
+        rates = self.fetch_all(from_currency)
+        try:
+            return rates[to_currency]
+        except KeyError:
+            raise ProviderError(f"No rate for {from_currency}/{to_currency}")
+
+    def fetch_currencies(self):
+        """Return {currency_code: name} for every supported currency"""
+        raise NotImplementedError
+
+    def fetch_history(self, base, target, start, end):
+        """Return {date: Decimal rate} of one `base` in `target` for each day from `start` to `end`"""
+        raise NotImplementedError
+
+    def is_available(self):
+        """False while calls are known to fail fast (e.g. an open circuit)"""
+        return True
+
+
+_providers = {}
+_provider_lock = threading.Lock()
+
+
+def _load(setting, default):
+    provider = _providers.get(setting)
+    if provider is None:
+        with _provider_lock:
+            provider = _providers.get(setting)
+            if provider is None:
+                provider = _providers[setting] = import_string(getattr(settings, setting, default))()
+    return provider
+
+
+def get_provider():
+    """Return the process-wide provider configured by CURRENCY_RATE_PROVIDER"""
+    return _load('CURRENCY_RATE_PROVIDER', 'currency.fastforex.FastForexProvider')
+
+
+def get_async_provider():
+    """
+    Return the process-wide provider for async views, configured by
+    CURRENCY_ASYNC_RATE_PROVIDER; its fetch methods are coroutines.
+    """
+    return _load('CURRENCY_ASYNC_RATE_PROVIDER', 'currency.fastforex.AsyncFastForexProvider')
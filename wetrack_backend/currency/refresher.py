@@ -0,0 +1,85 @@
+# currency/refresher.py
+import logging
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from tracker.models import Transaction
+
+from .history import store_daily
+from .matrix import quantize_rate
+from .models import ExchangeRate
+from .providers import ProviderError, get_provider
+
+logger = logging.getLogger(__name__)
+
+
+def default_bases():
+    """Bases from CURRENCY_REFRESH_BASES, or every currency a Transaction can use"""
+    bases = getattr(settings, 'CURRENCY_REFRESH_BASES', None)
+    return list(bases) if bases else [code for code, _ in Transaction.CURRENCY_CHOICES]
+
+
+def store_rates(base, rates, batch_size=500):
+    """Upsert {target: rate} for `base` into ExchangeRate, one statement per batch"""
+    now = timezone.now()
+    rows = [
+        ExchangeRate(
+            base_currency=base,
+            target_currency=target,
+            rate=quantize_rate(rate),
+            last_updated=now,
+        )
+        for target, rate in rates.items()
+        if target != base
+    ]
+    ExchangeRate.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['base_currency', 'target_currency'],
+        update_fields=['rate', 'last_updated'],
+    )
+    return len(rows)
+
+
+def refresh_rates(bases=None, provider=None):
+    """
+    Fetch every rate for each base with one upstream call per base and store
+    them. A failing base is logged and skipped so the others still refresh.
+    Returns {base: rows stored}.
+    """
+    provider = provider or get_provider()
+    stored = {}
+    for base in bases or default_bases():
+        try:
+            rates = provider.fetch_all(base)
+        except ProviderError as e:
+            logger.error(f"Rate refresh failed for {base}: {str(e)}")
+            continue
+        stored[base] = store_rates(base, rates)
+        store_daily(base, rates, timezone.localdate())
+        logger.info(f"Refreshed {stored[base]} rates for {base}")
+    return stored
+
+
+class RateRefresher:
+    """Worker loop calling refresh_rates() every `interval` seconds until stopped"""
+
+    def __init__(self, bases=None, interval=None, provider=None):
+        self.bases = bases
+        self.interval = interval or getattr(settings, 'CURRENCY_REFRESH_INTERVAL', 600)
+        self.provider = provider
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                refresh_rates(self.bases, self.provider)
+            except Exception as e:
+                logger.error(f"Rate refresh error: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,137 @@
+# currency/singleflight.py
+import asyncio
+import logging
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time in this process. Callers arriving
+    while it is in flight wait and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another caller ran `fn`"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines: `fn` runs as a task of its own, which every
+    task on the same event loop asking for the key awaits through a shield,
+    so one caller being cancelled (a client disconnecting) cancels neither
+    the call nor the others waiting on it.
+    """
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn):
+        """Return (result, shared) like SingleFlight.do()"""
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = calls[key] = loop.create_task(fn())
+            task.add_done_callback(lambda done: self._finish(calls, key, done))
+        return await asyncio.shield(task), shared
+
+    @staticmethod
+    def _finish(calls, key, task):
+        if calls.get(key) is task:
+            del calls[key]
+        if not task.cancelled():
+            # Callers re-raise it; retrieve it here so an error nobody awaited is not logged
+            task.exception()
+
+
+def fetch_once_across_workers(key, fetch, recheck, lock_timeout=10, wait=5, poll=0.05):
+    """
+    Call `fetch` only if no other worker holds the shared lock for `key`.
+    Otherwise poll `recheck` (which reads what the lock holder stores) until it
+    returns a value, falling back to fetching ourselves after `wait` seconds.
+    The lock lives in Django's cache, so it is shared when CACHES is.
+    """
+    lock_key = f"currency:upstream-lock:{key}"
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            return fetch()
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(poll)
+        result = recheck()
+        if result is not None:
+            return result
+        if cache.get(lock_key) is None:
+            # The holder finished without storing anything (e.g. upstream error)
+            return fetch()
+    logger.warning(f"Gave up waiting on upstream lock {key}")
+    return fetch()
+
+
+async def afetch_once_across_workers(key, fetch, recheck, lock_timeout=10, wait=5, poll=0.05):
+    """fetch_once_across_workers() for a coroutine `fetch`; `recheck` is sync and runs in a thread"""
+    lock_key = f"currency:upstream-lock:{key}"
+    if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+        try:
+            return await fetch()
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll)
+        result = await sync_to_async(recheck)()
+        if result is not None:
+            return result
+        if await cache.aget(lock_key) is None:
+            return await fetch()
+    logger.warning(f"Gave up waiting on upstream lock {key}")
+    return await fetch()
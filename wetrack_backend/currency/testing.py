@@ -0,0 +1,138 @@
+# currency/testing.py
+"""Local stand-in for api.fastforex.io, for tests and benchmarks"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Units of each currency per 1 USD
+DEFAULT_RATES = {
+    'USD': 1.0,
+    'GBP': 0.79,
+    'EUR': 0.92,
+    'JPY': 149.5,
+    'CAD': 1.36,
+    'IDR': 15650.0,
+}
+
+
+class FakeFastForex:
+    """
+    Serves /fetch-all, /fetch-one, /convert, /currencies and /time-series from
+    a USD rate table on a random local port. Historical rates drift by
+    `drift` (a fraction) per day before today. Use as a context manager; `url` is the value
+    for FASTFOREX_BASE_URL, `requests` counts hits per endpoint and `peers`
+    holds the client address of every connection seen. `delay` seconds are
+    slept before each answer to mimic a slow upstream, and a fraction
+    `error_rate` of requests is answered 503 (drawn from a generator seeded
+    with `seed`, so runs repeat).
+    """
+
+    def __init__(self, rates=None, delay=0, drift=0.001, error_rate=0, seed=0):
+        self.rates = dict(rates or DEFAULT_RATES)
+        self.delay = delay
+        self.drift = drift
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = Counter()
+        self.peers = set()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def cross(self, from_currency, to_currency):
+        return self.rates[to_currency] / self.rates[from_currency]
+
+    def historical(self, from_currency, to_currency, day):
+        """Cross rate on `day`: today's, with non-USD currencies drifting by day"""
+        days = (date.today() - day).days
+
+        def usd(code):
+            return self.rates[code] * (1 + self.drift * days if code != 'USD' else 1)
+
+        return round(usd(to_currency) / usd(from_currency), 6)
+
+    def handle(self, endpoint, params):
+        """Return (status, payload) for one request"""
+        base = params.get('from', 'USD')
+        if endpoint == 'currencies':
+            return 200, {'currencies': {code: code for code in self.rates}}
+        if base not in self.rates:
+            return 400, {'error': f"Invalid currency: {base}"}
+        if endpoint == 'fetch-all':
+            results = {code: self.cross(base, code) for code in self.rates}
+            return 200, {'base': base, 'results': results}
+        target = params.get('to', 'USD')
+        if target not in self.rates:
+            return 400, {'error': f"Invalid currency: {target}"}
+        if endpoint == 'time-series':
+            try:
+                start, end = date.fromisoformat(params['start']), date.fromisoformat(params['end'])
+            except (KeyError, ValueError):
+                return 400, {'error': 'start and end are required'}
+            days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+            series = {day.isoformat(): self.historical(base, target, day) for day in days}
+            return 200, {'base': base, 'start': params['start'], 'end': params['end'],
+                         'interval': 'P1D', 'results': {target: series}}
+        if endpoint == 'fetch-one':
+            return 200, {'base': base, 'result': {target: self.cross(base, target)}}
+        if endpoint == 'convert':
+            rate = self.cross(base, target)
+            amount = float(params.get('amount', 1))
+            return 200, {'base': base, 'amount': amount, 'result': {target: amount * rate, 'rate': rate}}
+        return 404, {'error': 'Not found'}
+
+    def start(self, port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, keep-alive
+            # clients stall on Nagle + delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                endpoint = parsed.path.strip('/')
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                fake.requests[endpoint] += 1
+                fake.peers.add(self.client_address)
+                if fake.error_rate and fake._random.random() < fake.error_rate:
+                    status, payload = 503, {'error': 'Service unavailable'}
+                else:
+                    status, payload = fake.handle(endpoint, params)
+                if fake.delay:
+                    time.sleep(fake.delay)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
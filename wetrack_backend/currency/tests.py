@@ -1,3 +1,519 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .audit import conversions
+from .batch import BatchError, convert_batch
+from .cache import CURRENCIES_KEY, RateCache, rate_cache
+from .circuit import CircuitBreaker, CircuitOpenError
+from .client import AsyncPooledHTTPClient, LatencyHistogram, PooledHTTPClient, get_client
+from .fastforex import AsyncFastForexProvider, FastForexError, FastForexProvider, FastForexUnavailable
+from .matrix import RateMatrix, convert_amount, current_matrix, publish
+from .history import RateHistory, backfill
+from .models import CurrencyConversion, DailyRate, ExchangeRate
+from .providers import RateProvider
+from .refresher import refresh_rates
+from .singleflight import AsyncSingleFlight, SingleFlight, fetch_once_across_workers
+from .testing import FakeFastForex
+
+
+class RateCacheTests(TestCase):
+    def setUp(self):
+        self.provider = mock.Mock(spec=RateProvider)
+        self.provider.fetch_all.return_value = {'GBP': Decimal('0.8'), 'EUR': Decimal('0.92')}
+        self.cache = RateCache(memory_ttl=60, db_ttl=3600, maxsize=16, provider=self.provider, matrix_base='USD')
+        self.addCleanup(self.cache.clear)
+
+    def test_miss_fetches_one_snapshot_for_every_pair(self):
+        self.assertEqual(self.cache.get_rate('GBP', 'USD'), Decimal('1.250000'))
+        self.assertEqual(self.cache.get_rate('GBP', 'EUR'), Decimal('1.150000'))
+        self.assertEqual(self.cache.get_rate('EUR', 'USD'), Decimal('1.086956522'))
+
+        self.provider.fetch_all.assert_called_once_with('USD')
+        self.assertEqual(ExchangeRate.objects.filter(base_currency='USD').count(), 2)
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['matrix_hits']), (1, 2))
+
+    def test_matrix_is_loaded_from_stored_snapshot(self):
+        ExchangeRate.objects.create(base_currency='USD', target_currency='GBP', rate=Decimal('0.5'))
+
+        self.assertEqual(self.cache.get_rate('USD', 'GBP'), Decimal('0.5'))
+        self.assertEqual(self.cache.get_rate('GBP', 'USD'), Decimal('2'))
+        self.provider.fetch_all.assert_not_called()
+        self.assertEqual(self.cache.stats()['matrix_hits'], 2)
+
+    def test_fresh_pair_row_is_served_without_upstream_call(self):
+        ExchangeRate.objects.create(base_currency='EUR', target_currency='GBP', rate=Decimal('0.85'))
+
+        self.assertEqual(self.cache.get_rate('EUR', 'GBP'), Decimal('0.85'))
+        self.provider.fetch_all.assert_not_called()
+        self.assertEqual(self.cache.stats()['db_hits'], 1)
+
+    def test_stale_pair_row_is_served_while_revalidating(self):
+        self.provider.fetch_rate.return_value = Decimal('0.86')
+        ExchangeRate.objects.create(
+            base_currency='EUR', target_currency='GBP', rate=Decimal('0.85'),
+            last_updated=timezone.now() - timedelta(hours=2),
+        )
+
+        with mock.patch.object(self.cache, '_spawn', side_effect=lambda fn: fn()):
+            quote = self.cache.lookup_rate('EUR', 'GBP')
+
+        self.assertEqual((quote.rate, quote.stale), (Decimal('0.85'), True))
+        self.assertGreaterEqual(quote.age, 7200)
+        self.assertEqual(self.cache.lookup_rate('EUR', 'GBP'), (Decimal('0.86'), False, 0))
+
+    def test_stale_matrix_is_not_revalidated_while_circuit_is_open(self):
+        publish(RateMatrix('USD', {'GBP': 0.8}, as_of=timezone.now() - timedelta(hours=2)))
+        self.provider.is_available.return_value = False
+
+        with mock.patch.object(self.cache, '_spawn') as spawn:
+            quote = self.cache.lookup_rate('GBP', 'USD')
+
+        self.assertEqual((quote.rate, quote.stale), (Decimal('1.250000'), True))
+        spawn.assert_not_called()
+        self.provider.fetch_all.assert_not_called()
+
+    def test_pair_outside_matrix_falls_back_to_single_fetch(self):
+        self.provider.fetch_rate.return_value = Decimal('4.1')
+
+        self.assertEqual(self.cache.get_rate('GBP', 'PLN'), Decimal('4.1'))
+        self.provider.fetch_rate.assert_called_once_with('GBP', 'PLN')
+
+
+class RateMatrixTests(TestCase):
+    def test_cross_rates_are_rounded_half_up(self):
+        matrix = RateMatrix('USD', {'GBP': 0.8, 'JPY': 150.0})
+
+        self.assertEqual(matrix.cross('GBP', 'JPY'), Decimal('187.500000'))
+        self.assertEqual(matrix.cross('JPY', 'GBP'), Decimal('0.005333333333'))
+        self.assertEqual(convert_amount(Decimal('10.005'), Decimal('1')), Decimal('10.01'))
+
+    def test_weak_currency_rates_keep_significant_digits(self):
+        matrix = RateMatrix('USD', {'VND': 25410.0, 'IDR': 15650.0, 'GBP': 0.79})
+
+        self.assertEqual(matrix.cross('VND', 'USD'), Decimal('0.00003935458481'))
+        self.assertEqual(convert_amount(Decimal('10000000'), matrix.cross('VND', 'USD')), Decimal('393.55'))
+        self.assertEqual(convert_amount(Decimal('5000000'), matrix.cross('IDR', 'GBP')), Decimal('252.40'))
+        # The batch path multiplies in integers and must agree to the cent
+        results = convert_batch([{'amount': '10000000', 'from': 'VND', 'to': 'USD'}],
+                                lambda f, t: matrix.cross(f, t))
+        self.assertEqual(results[0]['result'], Decimal('393.55'))
+
+    def test_publish_swaps_snapshot(self):
+        self.addCleanup(publish, current_matrix())
+        matrix = RateMatrix('USD', {'GBP': 0.8})
+
+        publish(matrix)
+        self.assertIs(current_matrix(), matrix)
+
+
+class BatchConversionTests(TestCase):
+    def test_each_pair_is_resolved_once_and_matches_single_conversion(self):
+        get_rate = mock.Mock(side_effect=lambda f, t: {'GBP': Decimal('1.234567'), 'EUR': Decimal('0.5')}[f])
+        items = [{'amount': amount, 'from': 'GBP', 'to': 'USD'} for amount in ('0.01', '10.005', '999.99', 7)]
+        items.append({'amount': '3', 'from': 'eur', 'to': 'usd'})
+
+        results = convert_batch(items, get_rate)
+
+        self.assertEqual(get_rate.call_count, 2)
+        for item, result in zip(items[:4], results):
+            self.assertEqual(result['result'], convert_amount(Decimal(str(item['amount'])), Decimal('1.234567')))
+        self.assertEqual(results[4]['result'], Decimal('1.50'))
+
+    def test_invalid_items_are_reported_individually(self):
+        results = convert_batch([{'amount': 'x'}, {'from': 'GBP'}, 'nope'], mock.Mock())
+
+        self.assertEqual([r['error'] for r in results],
+                         ['Invalid amount format', 'Amount is required', 'Each item must be an object'])
+
+    def test_large_amounts(self):
+        rate = Decimal('25432.10987')
+        items = [{'amount': amount} for amount in ('1e15', '-999999999999999.99', '1e20', '1e30')]
+
+        results = convert_batch(items, mock.Mock(return_value=rate))
+
+        # Past int64, the product is worked out in Decimal
+        self.assertEqual([r['result'] for r in results[:2]],
+                         [convert_amount(Decimal(item['amount']), rate) for item in items[:2]])
+        self.assertEqual([r['error'] for r in results[2:]], ['Invalid amount format'] * 2)
+
+    def test_unknown_currencies_are_rejected_before_any_lookup(self):
+        get_rate = mock.Mock(return_value=Decimal('1.25'))
+        items = [{'amount': 1, 'from': 'GBP', 'to': code} for code in ('USD', 'ZZZ', 'us', 'DOLLARS')]
+
+        results = convert_batch(items, get_rate, known={'GBP', 'USD'})
+
+        get_rate.assert_called_once_with('GBP', 'USD')
+        self.assertEqual([r.get('error') for r in results],
+                         [None, 'Unknown currency: ZZZ', 'Unknown currency: US', 'Unknown currency: DOLLARS'])
+
+    def test_distinct_pairs_are_capped(self):
+        items = [{'amount': 1, 'from': 'GBP', 'to': code} for code in ('USD', 'EUR', 'JPY')] * 10
+
+        with self.assertRaisesMessage(BatchError, 'At most 2 currency pairs'):
+            convert_batch(items, mock.Mock(), max_pairs=2)
+        self.assertEqual(len(convert_batch(items, mock.Mock(return_value=Decimal(1)), max_pairs=3)), 30)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow_fetch():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 'rate'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('GBP:USD', slow_fetch)))
+                   for _ in range(8)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('rate', False)] + [('rate', True)] * 7)
+        self.assertEqual(flights.in_flight(), 0)
+
+    def test_errors_are_shared_and_not_cached(self):
+        flights = SingleFlight()
+
+        with self.assertRaises(FastForexError):
+            flights.do('k', mock.Mock(side_effect=FastForexError('down')))
+        self.assertEqual(flights.do('k', lambda: 1), (1, False))
+
+    async def test_concurrent_tasks_share_one_await(self):
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def slow_fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'rate'
+
+        results = await asyncio.gather(*(flights.do('GBP:USD', slow_fetch) for _ in range(8)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('rate', False)] + [('rate', True)] * 7)
+
+    async def test_cancelled_leader_does_not_cancel_waiters(self):
+        flights = AsyncSingleFlight()
+
+        async def slow_fetch():
+            await asyncio.sleep(0.05)
+            return 'rate'
+
+        leader = asyncio.ensure_future(flights.do('GBP:USD', slow_fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flights.do('GBP:USD', slow_fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        self.assertEqual(await waiter, ('rate', True))
+        self.assertTrue(leader.cancelled())
+
+    def test_other_worker_holding_lock_is_waited_on(self):
+        cache.add('currency:upstream-lock:fetch-all:USD', 1)
+        self.addCleanup(cache.delete, 'currency:upstream-lock:fetch-all:USD')
+        fetch = mock.Mock()
+        recheck = mock.Mock(side_effect=[None, 'stored'])
+
+        result = fetch_once_across_workers('fetch-all:USD', fetch, recheck, poll=0)
+
+        self.assertEqual(result, 'stored')
+        fetch.assert_not_called()
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_repeated_failures_and_recovers(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+        failing = mock.Mock(side_effect=FastForexUnavailable('timeout'))
+
+        for _ in range(2):
+            with self.assertRaises(FastForexUnavailable):
+                breaker.call(failing)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(failing)
+        self.assertEqual(failing.call_count, 2)
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_trial_does_not_wedge_the_circuit(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        with self.assertRaises(FastForexUnavailable):
+            breaker.call(mock.Mock(side_effect=FastForexUnavailable('timeout')))
+        time.sleep(0.06)
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(breaker.call_async(mock.AsyncMock(side_effect=asyncio.CancelledError)))
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_do_not_trip_the_circuit(self):
+        breaker = CircuitBreaker('test', failure_threshold=1)
+
+        with self.assertRaises(FastForexError):
+            breaker.call(mock.Mock(side_effect=FastForexError('Invalid currency')))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unreachable_provider_fails_fast(self):
+        provider = FastForexProvider(base_url='http://127.0.0.1:9', timeout=(0.5, 0.5),
+                                     breaker=CircuitBreaker('test', failure_threshold=1))
+
+        with self.assertRaises(FastForexUnavailable):
+            provider.fetch_all('USD')
+        self.assertFalse(provider.is_available())
+        with self.assertRaises(CircuitOpenError):
+            provider.fetch_all('USD')
+
+
+class PooledHTTPClientTests(SimpleTestCase):
+    def test_transient_failures_are_retried_and_timed(self):
+        client = PooledHTTPClient(retries=2, backoff=0)
+        ok = mock.Mock(status_code=200)
+        with mock.patch.object(client.session, 'get',
+                               side_effect=[mock.Mock(status_code=503), requests.ConnectionError(), ok]) as get:
+            self.assertIs(client.get('http://fx/fetch-one', name='fetch-one'), ok)
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(client.stats()['fetch-one']['count'], 3)
+
+    def test_keep_alive_against_stub_server(self):
+        client = PooledHTTPClient()
+        with FakeFastForex() as fake:
+            for _ in range(3):
+                client.get(f"{fake.url}/fetch-one", params={'from': 'GBP', 'to': 'USD'}, timeout=2)
+        self.assertEqual(fake.requests['fetch-one'], 3)
+        self.assertEqual(len(fake.peers), 1)
+        client.close()
+
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram(buckets=(10, 100))
+        for seconds in (0.001, 0.002, 0.05, 0.5):
+            histogram.observe(seconds)
+
+        self.assertEqual(histogram.percentile(0.5), 10)
+        self.assertEqual(histogram.snapshot()['buckets'], {'10': 2, '100': 3, '+Inf': 4})
+
+
+class RefresherTests(TestCase):
+    def test_refresh_stores_every_rate_with_one_call_per_base(self):
+        with FakeFastForex() as fake:
+            stored = refresh_rates(['GBP', 'USD'], FastForexProvider(base_url=fake.url))
+            self.assertEqual(fake.requests['fetch-all'], 2)
+
+        self.assertEqual(stored, {'GBP': 5, 'USD': 5})
+        self.assertEqual(ExchangeRate.objects.count(), 10)
+        self.assertEqual(
+            ExchangeRate.objects.get(base_currency='USD', target_currency='IDR').rate,
+            Decimal('15650.000000'),
+        )
+
+    def test_refresh_upserts_and_skips_failed_bases(self):
+        ExchangeRate.objects.create(
+            base_currency='USD', target_currency='EUR', rate=Decimal('0.5'),
+            last_updated=timezone.now() - timedelta(days=1),
+        )
+
+        with FakeFastForex() as fake:
+            stored = refresh_rates(['USD', 'XXX'], FastForexProvider(base_url=fake.url))
+
+        self.assertEqual(list(stored), ['USD'])
+        row = ExchangeRate.objects.get(base_currency='USD', target_currency='EUR')
+        self.assertEqual(row.rate, Decimal('0.920000'))
+        self.assertGreater(row.last_updated, timezone.now() - timedelta(minutes=1))
+
+
+class RateHistoryTests(TestCase):
+    def test_backfill_and_as_of_lookup(self):
+        with FakeFastForex() as fake:
+            stored = backfill(['GBP', 'EUR', 'XXX'], date(2024, 1, 1), date(2024, 1, 10),
+                              FastForexProvider(base_url=fake.url), chunk_days=4)
+            self.assertEqual(fake.requests['time-series'], 7)
+            expected = fake.historical('GBP', 'EUR', date(2024, 1, 10))
+
+        self.assertEqual(stored, {'GBP': 10, 'EUR': 10})
+        DailyRate.objects.filter(date=date(2024, 1, 6)).delete()
+        with self.assertNumQueries(2):
+            history = RateHistory.load(['GBP', 'EUR'], date(2024, 1, 6), date(2024, 1, 20))
+
+        self.assertEqual(history.rate('GBP', 'EUR', date(2024, 1, 20)), history.rate('GBP', 'EUR', date(2024, 1, 10)))
+        self.assertAlmostEqual(float(history.rate('GBP', 'EUR', date(2024, 1, 10))), expected, places=5)
+        # A missing day falls back to the day before
+        self.assertEqual(history.as_of('GBP', date(2024, 1, 6)), history.as_of('GBP', date(2024, 1, 5)))
+        self.assertIsNone(RateHistory.load(['GBP'], date(2023, 12, 1), date(2023, 12, 31)).rate('GBP', 'USD', date(2023, 12, 31)))
+
+    def test_refresh_records_todays_rates(self):
+        with FakeFastForex() as fake:
+            refresh_rates(['USD'], FastForexProvider(base_url=fake.url))
+
+        self.assertEqual(DailyRate.objects.filter(date=timezone.localdate()).count(), 5)
+
+
+# Conversions are queued without a flush thread; tests flush explicitly
+@override_settings(WRITE_BEHIND_INTERVAL=0)
+class CurrencyViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        rate_cache.clear()
+        self.addCleanup(rate_cache.clear)
+        self.addCleanup(conversions.clear)
+        ExchangeRate.objects.create(base_currency='GBP', target_currency='USD', rate=Decimal('1.25'))
+        rate_cache.store_currencies({'GBP': 'British Pound Sterling', 'USD': 'US Dollar', 'EUR': 'Euro'})
+
+    def test_convert_uses_cached_rate(self):
+        response = self.client.get('/api/currency/convert/', {'amount': '10', 'from': 'GBP', 'to': 'USD'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['result'], 12.5)
+
+    def test_convert_rejects_amounts_out_of_range(self):
+        for path in ('/api/currency/convert/', '/api/currency/async/convert/'):
+            for amount in ('1e30', '-1e16'):
+                response = self.client.get(path, {'amount': amount, 'from': 'GBP', 'to': 'USD'})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid amount format'})
+
+    def test_rate_is_derived_from_matrix(self):
+        ExchangeRate.objects.create(base_currency='USD', target_currency='EUR', rate=Decimal('0.9'))
+        ExchangeRate.objects.create(base_currency='USD', target_currency='GBP', rate=Decimal('0.8'))
+
+        response = self.client.get('/api/currency/rate/', {'from': 'eur', 'to': 'gbp'})
+
+        self.assertEqual(response.json(), {'from': 'EUR', 'to': 'GBP', 'rate': 0.8888888889})
+
+    def test_batch_convert(self):
+        response = self.client.post('/api/currency/convert/batch/', {'items': [
+            {'amount': '10', 'from': 'GBP', 'to': 'USD'},
+            {'amount': '2.50', 'from': 'GBP', 'to': 'USD'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['result'] for r in response.json()['results']], [12.5, 3.13])
+
+    def test_batch_rejects_unlisted_currencies_without_upstream_calls(self):
+        with mock.patch('currency.fastforex.FastForexProvider.fetch_rate') as fetch_rate:
+            response = self.client.post('/api/currency/convert/batch/', {'items': [
+                {'amount': '1', 'from': 'GBP', 'to': f"Q{a}{b}"} for a in 'ABC' for b in 'XYZ'
+            ]}, format='json')
+
+        fetch_rate.assert_not_called()
+        self.assertEqual({r['error'] for r in response.json()['results']},
+                         {f"Unknown currency: Q{a}{b}" for a in 'ABC' for b in 'XYZ'})
+
+    def test_conversions_are_recorded_on_flush(self):
+        self.client.get('/api/currency/convert/', {'amount': '10', 'from': 'GBP', 'to': 'USD'})
+        self.client.get('/api/currency/convert/', {'amount': '1e12', 'from': 'GBP', 'to': 'USD'})
+        self.assertFalse(CurrencyConversion.objects.exists())
+
+        self.assertEqual(conversions.flush(), 1)
+        row = CurrencyConversion.objects.get()
+        self.assertEqual((row.amount, row.converted_amount, row.rate), (Decimal('10'), Decimal('12.5'), Decimal('1.25')))
+
+    def test_oversized_batch_is_400(self):
+        with self.settings(CURRENCY_BATCH_MAX_ITEMS=1):
+            response = self.client.post('/api/currency/convert/batch/', [{'amount': 1}, {'amount': 2}], format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_stale_rate_is_flagged(self):
+        ExchangeRate.objects.filter(base_currency='GBP').update(last_updated=timezone.now() - timedelta(hours=3))
+
+        with mock.patch.object(rate_cache, '_revalidate') as revalidate:
+            response = self.client.get('/api/currency/convert/', {'amount': '2', 'from': 'GBP', 'to': 'USD'})
+
+        data = response.json()
+        self.assertEqual((data['result'], data['stale']), (2.5, True))
+        self.assertGreaterEqual(data['age'], 3 * 3600)
+        revalidate.assert_called_once()
+
+    def test_invalid_amount_is_400(self):
+        response = self.client.get('/api/currency/convert/', {'amount': 'nan'})
+
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('currency.fastforex.FastForexProvider.fetch_all', side_effect=FastForexError('down'))
+    def test_upstream_failure_is_503(self, fetch_all):
+        response = self.client.get('/api/currency/rate/', {'from': 'USD', 'to': 'EUR'})
+
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(WRITE_BEHIND_INTERVAL=0)
+class AsyncCurrencyViewTests(TestCase):
+    def setUp(self):
+        self.client = AsyncClient()
+        rate_cache.clear()
+        self.addCleanup(rate_cache.clear)
+        self.addCleanup(conversions.clear)
+        ExchangeRate.objects.create(base_currency='GBP', target_currency='USD', rate=Decimal('1.25'))
+
+    async def test_convert_matches_sync_view(self):
+        response = await self.client.get('/api/currency/async/convert/', {'amount': '10', 'from': 'GBP', 'to': 'USD'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'amount': 10.0, 'from': 'GBP', 'to': 'USD', 'rate': 1.25, 'result': 12.5})
+
+    async def test_concurrent_misses_make_one_upstream_call(self):
+        with FakeFastForex() as fake:
+            client = AsyncPooledHTTPClient(get_client())
+            provider = AsyncFastForexProvider(base_url=fake.url, breaker=CircuitBreaker('test'), client=client)
+            with mock.patch('currency.async_views.get_async_provider', return_value=provider):
+                responses = await asyncio.gather(*(
+                    self.client.get('/api/currency/async/rate/', {'from': 'EUR', 'to': 'JPY'}) for _ in range(5)
+                ))
+            await client.aclose()
+
+        self.assertEqual([r.json()['rate'] for r in responses], [162.5] * 5)
+        self.assertEqual(fake.requests['fetch-all'], 1)
+
+    async def test_currencies_come_from_the_shared_tier_before_upstream(self):
+        provider = mock.Mock(fetch_currencies=mock.AsyncMock(return_value={'GBP': 'Pound'}))
+        await sync_to_async(cache.set)(CURRENCIES_KEY, {'EUR': 'Euro'})
+        with mock.patch('currency.async_views.get_async_provider', return_value=provider):
+            response = await self.client.get('/api/currency/async/currencies/')
+
+        self.assertEqual(response.json(), {'currencies': {'EUR': 'Euro'}})
+        provider.fetch_currencies.assert_not_called()
+
+    async def test_upstream_waits_on_another_workers_lock(self):
+        provider = mock.Mock(fetch_currencies=mock.AsyncMock(return_value={'GBP': 'Pound'}))
+        lock_key = 'currency:upstream-lock:currencies'
+        await sync_to_async(cache.add)(lock_key, 1)
+        self.addCleanup(cache.delete, lock_key)
+
+        # The lock holder stores the list a moment later
+        other_worker = threading.Timer(0.2, cache.set, (CURRENCIES_KEY, {'EUR': 'Euro'}))
+        other_worker.start()
+        with mock.patch('currency.async_views.get_async_provider', return_value=provider):
+            response = await self.client.get('/api/currency/async/currencies/')
+        other_worker.join()
+
+        self.assertEqual(response.json(), {'currencies': {'EUR': 'Euro'}})
+        provider.fetch_currencies.assert_not_called()
+
+    async def test_upstream_failure_is_503(self):
+        provider = mock.Mock(fetch_all=mock.AsyncMock(side_effect=FastForexUnavailable('down')))
+        with mock.patch('currency.async_views.get_async_provider', return_value=provider):
+            response = await self.client.get('/api/currency/async/rate/', {'from': 'USD', 'to': 'EUR'})
+
+        self.assertEqual(response.status_code, 503)
@@ -1,9 +1,14 @@
 # currency/urls.py
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('convert/', views.convert_currency, name='convert-currency'),
+    path('convert/batch/', views.convert_currency_batch, name='convert-currency-batch'),
     path('currencies/', views.get_available_currencies, name='available-currencies'),
     path('rate/', views.get_exchange_rate, name='exchange-rate'),
+    path('async/convert/', async_views.convert_currency, name='async-convert-currency'),
+    path('async/currencies/', async_views.get_available_currencies, name='async-available-currencies'),
+    path('async/rate/', async_views.get_exchange_rate, name='async-exchange-rate'),
+    path('cache/stats/', views.get_cache_stats, name='rate-cache-stats'),
 ]
\ No newline at end of file
@@ -1,21 +1,34 @@
 # currency/views.py
+from django.conf import settings
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-import requests
-import os
 import logging
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+
+from .audit import record_conversion, user_id_of
+from .batch import BatchError, convert_batch
+from .cache import rate_cache
+from .client import get_client
+from .matrix import MAX_AMOUNT, convert_amount
+from .providers import ProviderError
 
 logger = logging.getLogger(__name__)
 
+def _with_staleness(data, quote):
+    """Flag responses built from an expired rate with its age in seconds"""
+    if quote.stale:
+        data['stale'] = True
+        data['age'] = int(quote.age)
+    return data
+
 @api_view(['GET'])
 def convert_currency(request):
-    """Convert currency using FastForex API"""
+    """Convert currency using cached FastForex rates"""
     try:
         amount = request.GET.get('amount')
-        from_currency = request.GET.get('from', 'GBP')
-        to_currency = request.GET.get('to', 'USD')
+        from_currency = request.GET.get('from', 'GBP').upper()
+        to_currency = request.GET.get('to', 'USD').upper()
 
         if not amount:
             return Response(
@@ -24,58 +37,39 @@ def convert_currency(request):
             )
 
         try:
-            amount = float(amount)
-        except ValueError:
+            amount = Decimal(amount)
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite() or abs(amount) > MAX_AMOUNT:
             return Response(
                 {'error': 'Invalid amount format'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        api_key = os.getenv('CURR_API')
-        url = 'https://api.fastforex.io/convert'
+        quote = rate_cache.lookup_rate(from_currency, to_currency)
+        try:
+            result = convert_amount(amount, quote.rate)
+        except InvalidOperation:
+            # Past the Decimal context's precision at this rate
+            return Response(
+                {'error': 'Invalid amount format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        record_conversion(from_currency, to_currency, amount, quote.rate, result, user_id_of(request))
 
-        params = {
+        return Response(_with_staleness({
+            'amount': amount,
             'from': from_currency,
             'to': to_currency,
-            'amount': str(amount),
-            'api_key': api_key
-        }
-
-        logger.info(f"Making request to FastForex: {url}")
-
-        response = requests.get(url, params=params)
-        data = response.json()
-
-        logger.info(f"FastForex response: {data}")  # Log the response
-
-        if response.status_code == 200:
-            # Extract the result and rate from the response
-            if 'result' in data and to_currency in data['result']:
-                result = float(data['result'][to_currency])
-                # The rate can be calculated from the result and amount
-                rate = result / amount if amount != 0 else 0
-
-                return Response({
-                    'amount': amount,
-                    'from': from_currency,
-                    'to': to_currency,
-                    'rate': rate,
-                    'result': result
-                })
-            else:
-                logger.error(f"Unexpected response format: {data}")
-                return Response(
-                    {'error': 'Invalid response format from currency service'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-        else:
-            error_message = data.get('message', data.get('error', 'Currency conversion failed'))
-            logger.error(f"FastForex API error: {error_message}")
-            return Response(
-                {'error': error_message},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
+            'rate': quote.rate,
+            'result': result
+        }, quote))
 
+    except ProviderError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         logger.error(f"Currency conversion error: {str(e)}")
         return Response(
@@ -83,30 +77,52 @@ def convert_currency(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+def convert_currency_batch(request):
+    """Convert a list of {amount, from, to} items in one request"""
+    try:
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        results = convert_batch(
+            items,
+            rate_cache.get_rate,
+            max_items=getattr(settings, 'CURRENCY_BATCH_MAX_ITEMS', 5000),
+            known=rate_cache.known_currencies(),
+            max_pairs=getattr(settings, 'CURRENCY_BATCH_MAX_PAIRS', 100),
+        )
+        user_id = user_id_of(request)
+        for item in results:
+            if 'result' in item:
+                record_conversion(item['from'], item['to'], item['amount'], item['rate'], item['result'], user_id)
+        return Response({
+            'count': len(results),
+            'results': results
+        })
+
+    except BatchError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        logger.error(f"Batch conversion error: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['GET'])
 def get_available_currencies(request):
-    """Fetch available currencies from FastForex"""
+    """Fetch available currencies, cached from FastForex"""
     try:
-        api_key = os.getenv('CURR_API')
-        url = 'https://api.fastforex.io/currencies'
-        params = {
-            'api_key': api_key
-        }
-
-        response = requests.get(url, params=params)
-        data = response.json()
-
-        if response.status_code == 200:
-            return Response({
-                'currencies': data.get('currencies', {})
-            })
-        else:
-            logger.error(f"FastForex API error: {data}")
-            return Response(
-                {'error': data.get('message', 'Failed to fetch currencies')},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
+        return Response({
+            'currencies': rate_cache.get_currencies()
+        })
 
+    except ProviderError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         logger.error(f"Currency fetch error: {str(e)}")
         return Response(
@@ -118,38 +134,31 @@ def get_available_currencies(request):
 def get_exchange_rate(request):
     """Get exchange rate between two currencies"""
     try:
-        from_currency = request.GET.get('from', 'GBP')
-        to_currency = request.GET.get('to', 'USD')
+        from_currency = request.GET.get('from', 'GBP').upper()
+        to_currency = request.GET.get('to', 'USD').upper()
 
-        api_key = os.getenv('CURR_API')
-        url = 'https://api.fastforex.io/fetch-one'
-
-        params = {
+        quote = rate_cache.lookup_rate(from_currency, to_currency)
+        return Response(_with_staleness({
             'from': from_currency,
             'to': to_currency,
-            'api_key': api_key
-        }
-
-        response = requests.get(url, params=params)
-        data = response.json()
-
-        if response.status_code == 200 and 'result' in data:
-            rate = float(data['result'][to_currency])
-            return Response({
-                'from': from_currency,
-                'to': to_currency,
-                'rate': rate
-            })
-        else:
-            logger.error(f"FastForex API error: {data}")
-            return Response(
-                {'error': data.get('message', 'Failed to fetch exchange rate')},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
+            'rate': quote.rate
+        }, quote))
 
+    except ProviderError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         logger.error(f"Exchange rate error: {str(e)}")
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+@api_view(['GET'])
+def get_cache_stats(request):
+    """Hit/miss counters and upstream latency of this worker's exchange rate cache"""
+    stats = rate_cache.stats()
+    stats['upstream_latency'] = get_client().stats()
+    return Response(stats)
@@ -0,0 +1,135 @@
+# tracker/bulk.py
+"""
+Bulk create/update/delete of a user's transactions, for replaying offline
+edits in one request. Items are validated in one pass of a many=True
+TransactionSerializer and the valid ones are written with bulk_create,
+bulk_update and a single DELETE inside one database transaction, together
+with their sync sequence numbers, tombstones and rollup deltas. Invalid items
+are reported and skipped without affecting the rest.
+"""
+import copy
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, sync
+from .models import Transaction
+from .serializers import TransactionSerializer
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class BulkError(Exception):
+    """Raised when a bulk request as a whole is malformed"""
+
+
+def parse_operations(operations, max_items):
+    """
+    Check the shape of `[{op, id?, data?}, ...]`. Returns a list of
+    (op, id, data) with None for items that are malformed, and {index: errors}.
+    """
+    if not isinstance(operations, list):
+        raise BulkError('operations must be a list')
+    if len(operations) > max_items:
+        raise BulkError(f"At most {max_items} operations per request")
+
+    parsed, errors, seen_ids = [], {}, set()
+    for i, item in enumerate(operations):
+        op = item.get('op') if isinstance(item, dict) else None
+        if op not in OPERATIONS:
+            errors[i] = {'op': [f"Must be one of {', '.join(OPERATIONS)}"]}
+        elif op != 'create' and type(item.get('id')) is not int:  # JSON true/false are ints too
+            errors[i] = {'id': ['An integer id is required']}
+        elif op != 'create' and item['id'] in seen_ids:
+            errors[i] = {'id': ['Only one operation per id is allowed in a request']}
+        elif op != 'delete' and not isinstance(item.get('data'), dict):
+            errors[i] = {'data': ['An object is required']}
+        else:
+            if op != 'create':
+                seen_ids.add(item['id'])
+            parsed.append((op, item.get('id'), item.get('data')))
+            continue
+        parsed.append(None)
+    return parsed, errors
+
+
+def apply_operations(user, operations, context, max_items=5000):
+    """
+    Apply the operations for `user` and return one result per item, in order:
+    {index, op, status, id?, data?, errors?}, with HTTP-style statuses.
+    """
+    parsed, errors = parse_operations(operations, max_items)
+    results = [None] * len(parsed)
+    for i, item_errors in errors.items():
+        results[i] = {'index': i, 'op': operations[i].get('op') if isinstance(operations[i], dict) else None,
+                      'status': 400, 'errors': item_errors}
+
+    with transaction.atomic():
+        # Lock the user's sequence first, as single writes do, then their rows
+        sync.reserve(user.pk, 0)
+        ids = [item[1] for item in parsed if item and item[0] != 'create']
+        instances = Transaction.objects.select_for_update().filter(user=user).in_bulk(ids)
+
+        to_validate, positions = [], []
+        deletes = []
+        for i, item in enumerate(parsed):
+            if item is None:
+                continue
+            op, pk, data = item
+            if op != 'create' and pk not in instances:
+                results[i] = {'index': i, 'op': op, 'id': pk, 'status': 404, 'errors': {'id': ['Not found']}}
+            elif op == 'delete':
+                deletes.append(i)
+            else:
+                to_validate.append((instances.get(pk), data))
+                positions.append(i)
+
+        serializer = TransactionSerializer(many=True, context=context)
+        validated = serializer.validate_items(to_validate)
+
+        creates, updates = [], []
+        for i, (instance, _), (attrs, item_errors) in zip(positions, to_validate, validated):
+            if item_errors:
+                results[i] = {'index': i, 'op': parsed[i][0], 'id': parsed[i][1], 'status': 400,
+                              'errors': item_errors}
+            elif instance is None:
+                creates.append((i, Transaction(user=user, **attrs)))
+            else:
+                old = copy.copy(instance)
+                for field, value in attrs.items():
+                    setattr(instance, field, value)
+                updates.append((i, old, instance, set(attrs)))
+
+        count = len(creates) + len(updates) + len(deletes)
+        seq = sync.reserve(user.pk, count) if count else None
+        now = timezone.now()
+        # Sequence numbers follow request order
+        for offset, (i, tx) in enumerate(sorted(creates + [(i, new) for i, _, new, _ in updates]
+                                                 + [(i, instances[parsed[i][1]]) for i in deletes],
+                                                 key=lambda item: item[0])):
+            tx.sync_seq = seq + offset
+
+        if creates:
+            Transaction.objects.bulk_create([tx for _, tx in creates])
+        if updates:
+            fields = set().union(*(changed for _, _, _, changed in updates)) | {'sync_seq', 'updated_at'}
+            for _, _, tx, _ in updates:
+                tx.updated_at = now
+            Transaction.objects.bulk_update([tx for _, _, tx, _ in updates], sorted(fields), batch_size=500)
+        deleted = [instances[parsed[i][1]] for i in deletes]
+        if deleted:
+            sync.record_deletes(user.pk, [(tx.pk, tx.sync_seq) for tx in deleted])
+            Transaction.objects.filter(pk__in=[tx.pk for tx in deleted]).delete()
+        rollups.apply_changes(
+            added=[tx for _, tx in creates] + [new for _, _, new, _ in updates],
+            removed=[old for _, old, _, _ in updates] + deleted,
+        )
+
+    written = [(i, tx) for i, tx in creates] + [(i, new) for i, _, new, _ in updates]
+    data = TransactionSerializer([tx for _, tx in written], many=True, context=context).data
+    for (i, tx), row in zip(written, data):
+        status = 201 if parsed[i][0] == 'create' else 200
+        results[i] = {'index': i, 'op': parsed[i][0], 'id': tx.pk, 'status': status, 'data': row}
+    for i in deletes:
+        results[i] = {'index': i, 'op': 'delete', 'id': parsed[i][1], 'status': 204}
+    return results
@@ -0,0 +1,87 @@
+# tracker/exporters.py
+"""
+Streaming export of a user's transactions as CSV or NDJSON. Rows come from a
+server-side cursor (QuerySet.iterator) as plain tuples and are formatted by
+the serializer fast path helpers, with the same field names and value
+formats as the API, so memory stays flat however many rows a user has.
+
+In CSV, descriptions (free text, often bank memos) that a spreadsheet would
+read as a formula are prefixed with a quote; NDJSON carries them as they are.
+"""
+import csv
+import io
+import json
+
+import zstandard
+
+from .serializers import CATEGORY_LABELS, VALUE_FIELDS, datetime_formatter, format_amount
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+FIELDS = ('id', 'date', 'amount', 'category', 'category_display', 'description', 'currency',
+          'created_at', 'updated_at')
+DESCRIPTION = FIELDS.index('description')
+# Leading characters that make a spreadsheet cell a formula (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """Yield each transaction as a tuple of FIELDS, formatted like the API"""
+    format_datetime = datetime_formatter()
+    for pk, date, amount, category, description, currency, created_at, updated_at in (
+            queryset.order_by('-date', '-id').values_list(*VALUE_FIELDS).iterator(chunk_size=chunk_size)):
+        yield (pk, format_datetime(date), format_amount(amount), category, CATEGORY_LABELS.get(category, category),
+               description, currency, format_datetime(created_at), format_datetime(updated_at))
+
+
+def iter_csv(rows, rows_per_chunk=500):
+    """CSV text with a header line, in chunks of `rows_per_chunk` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    count = 0
+    for row in rows:
+        if row[DESCRIPTION].startswith(FORMULA_PREFIXES):
+            row = row[:DESCRIPTION] + ("'" + row[DESCRIPTION],) + row[DESCRIPTION + 1:]
+        writer.writerow(row)
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, rows_per_chunk=500):
+    """One JSON object per line, in chunks of `rows_per_chunk` rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False, separators=(',', ':')))
+        if len(lines) == rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines.clear()
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def encode(chunks):
+    for chunk in chunks:
+        if chunk:
+            yield chunk.encode()
+
+
+def zstd_compress(chunks, level=3):
+    """Compress a stream of bytes into one zstd frame, emitting output as it is produced"""
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(queryset, fmt, compress=False):
+    """Byte chunks of the export of `queryset` in `fmt`, zstd-compressed if `compress`"""
+    rows = iter_rows(queryset)
+    chunks = encode(iter_csv(rows) if fmt == 'csv' else iter_ndjson(rows))
+    return zstd_compress(chunks) if compress else chunks
@@ -0,0 +1,159 @@
+# tracker/importers.py
+"""
+Streaming import of bank statement exports (CSV or NDJSON) into Transaction.
+Rows are read one at a time from the file object, mapped onto Transaction
+fields, validated a chunk at a time with the bulk serializer pass and stored
+with one bulk_create per chunk, so memory stays flat however long the file
+is. Each chunk commits on its own with its sync sequence numbers and rollup
+deltas; rows that fail validation are reported and skipped.
+
+Transaction stores spending as positive amounts. Bank statements sign it
+negative (a Debit column holds it unsigned), so rows of the other sign are
+credits and refunds, which are reported rather than imported; pass
+spending='positive' for files that list spending as positive amounts, such
+as this app's own export.
+"""
+import codecs
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import rollups, sync
+from .models import Transaction
+from .serializers import TransactionSerializer
+
+FORMATS = ('csv', 'ndjson')
+SPENDING_SIGNS = ('negative', 'positive')
+
+# Accepted spellings of each Transaction field in statement headers
+COLUMN_ALIASES = {
+    'date': ('date', 'transaction date', 'posted', 'posting date', 'booking date'),
+    'amount': ('amount', 'value', 'debit'),
+    'description': ('description', 'memo', 'details', 'narrative', 'payee', 'reference'),
+    'category': ('category',),
+    'currency': ('currency', 'ccy'),
+}
+CATEGORY_CODES = {
+    **{label.lower(): code for code, label in Transaction.CATEGORY_CHOICES},
+    **{code: code for code, _ in Transaction.CATEGORY_CHOICES},
+}
+
+
+class StatementError(Exception):
+    """Raised when a statement as a whole cannot be read"""
+
+
+class RowError(ValueError):
+    """Raised by map_record for a readable record that is not imported; `errors` is {field: [messages]}"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def guess_format(name):
+    return 'ndjson' if name and name.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def iter_records(fileobj, fmt):
+    """Iterate (line number, dict or None if unreadable) over a binary CSV (with header) or NDJSON file"""
+    if fmt not in FORMATS:
+        raise StatementError(f"Unknown format: {fmt}")
+    return _records(fileobj, fmt)
+
+
+def _records(fileobj, fmt):
+    text = codecs.getreader('utf-8-sig')(fileobj, errors='replace')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_num, record
+
+
+def map_record(record, default_currency='GBP', spending='negative'):
+    """
+    Transaction field values for one statement record, for TransactionSerializer.
+    Raises RowError for credits and refunds: amounts not of the `spending` sign.
+    """
+    fields, columns = {}, {}
+    lowered = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            value = lowered.get(alias)
+            if value not in (None, ''):
+                fields[field] = value.strip() if isinstance(value, str) else value
+                columns[field] = alias
+                break
+
+    amount = str(fields.get('amount', '')).replace(',', '')
+    try:
+        signed = Decimal(amount)
+    except InvalidOperation:
+        signed = None  # Left for the serializer to report
+    if signed:
+        negative = spending == 'negative' and columns['amount'] != 'debit'
+        if (signed < 0) != negative:
+            raise RowError({'amount': ['Credits and refunds are not imported']})
+    fields['amount'] = amount.lstrip('-') if amount else None
+    date = str(fields.get('date', ''))
+    fields['date'] = f"{date}T00:00:00" if len(date) == 10 else date or None
+    category = str(fields.get('category', '')).lower()
+    fields['category'] = CATEGORY_CODES.get(category, category or None)
+    fields['currency'] = str(fields.get('currency') or default_currency).upper()
+    fields['description'] = str(fields.get('description', ''))[:Transaction._meta.get_field('description').max_length]
+    return fields
+
+
+def import_statement(user, fileobj, fmt='csv', default_currency='GBP', chunk_size=500, spending='negative'):
+    """
+    Import a statement for `user`. Yields a progress dict after each chunk:
+    {rows, imported, failed, errors: [{line, errors}] for that chunk}.
+    """
+    serializer = TransactionSerializer(many=True)
+    totals = {'rows': 0, 'imported': 0, 'failed': 0}
+    chunk = []
+
+    def flush():
+        readable = [(line, fields) for line, fields in chunk if isinstance(fields, dict)]
+        validated = serializer.validate_items([(None, fields) for _, fields in readable])
+        valid = [Transaction(user=user, **attrs) for attrs, errors in validated if errors is None]
+        errors = [{'line': line, 'errors': fields.errors if isinstance(fields, RowError)
+                   else {'non_field_errors': ['Unreadable row']}}
+                  for line, fields in chunk if not isinstance(fields, dict)]
+        errors += [{'line': line, 'errors': row_errors}
+                   for (line, _), (_, row_errors) in zip(readable, validated) if row_errors]
+        if valid:
+            with transaction.atomic():
+                first = sync.reserve(user.pk, len(valid))
+                for offset, tx in enumerate(valid):
+                    tx.sync_seq = first + offset
+                Transaction.objects.bulk_create(valid)
+                rollups.apply_changes(added=valid)
+        totals['rows'] += len(chunk)
+        totals['imported'] += len(valid)
+        totals['failed'] += len(errors)
+        chunk.clear()
+        return {**totals, 'errors': errors}
+
+    for line, record in iter_records(fileobj, fmt):
+        # Each entry is (line, fields), with a RowError or None in place of fields for rows not imported
+        try:
+            fields = map_record(record, default_currency, spending) if isinstance(record, dict) else None
+        except RowError as e:
+            fields = e
+        chunk.append((line, fields))
+        if len(chunk) >= chunk_size:
+            yield flush()
+    if chunk:
+        yield flush()
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.importers import FORMATS, SPENDING_SIGNS, guess_format, import_statement
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON bank statement into Transaction for one user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file')
+        parser.add_argument('--user', required=True, help='Username to import for')
+        parser.add_argument('--type', choices=FORMATS, help='File format (guessed from the extension by default)')
+        parser.add_argument('--currency', default='GBP', help='Currency of rows without one')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--spending', choices=SPENDING_SIGNS, default='negative',
+                            help='Sign of spending amounts; rows of the other sign (credits) are skipped')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+
+        fmt = options['type'] or guess_format(options['path'])
+        totals = {'rows': 0, 'imported': 0, 'failed': 0}
+        with open(options['path'], 'rb') as statement:
+            for progress in import_statement(user, statement, fmt, options['currency'].upper(),
+                                             options['chunk_size'], options['spending']):
+                for error in progress.pop('errors'):
+                    self.stdout.write(self.style.ERROR(f"line {error['line']}: {error['errors']}"))
+                totals = progress
+                self.stdout.write(f"{totals['rows']} rows read, {totals['imported']} imported, "
+                                  f"{totals['failed']} failed")
+        self.stdout.write(self.style.SUCCESS(f"Imported {totals['imported']} of {totals['rows']} rows"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tracker.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete old sync tombstones; clients with older watermarks are told to sync from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Keep tombstones from the last DAYS days')
+
+    def handle(self, *args, **options):
+        count = prune_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {count} tombstones"))
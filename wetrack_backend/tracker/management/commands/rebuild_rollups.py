@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.rollups import rebuild, verify
+
+
+class Command(BaseCommand):
+    help = 'Rebuild MonthlySpending from Transaction and check it matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to rebuild (defaults to every user)')
+        parser.add_argument('--verify-only', action='store_true',
+                            help='Only compare the stored rollups with a fresh aggregation')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['user']}")
+
+        if not options['verify_only']:
+            rows = rebuild(user)
+            self.stdout.write(f"Rebuilt {rows} rollup rows")
+
+        mismatches = verify(user)
+        for key, expected, stored in mismatches:
+            self.stdout.write(self.style.ERROR(f"{key}: expected {expected}, stored {stored}"))
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollup rows differ from the transactions")
+        self.stdout.write(self.style.SUCCESS('Rollups match the transactions'))
@@ -43,9 +43,81 @@ class Transaction(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Position of the last write in the user's change sequence (tracker.sync)
+    sync_seq = models.BigIntegerField(default=0)
 
     class Meta:
-        ordering = ['-date']
+        ordering = ['-date', '-id']
+        indexes = [
+            # Backs the per-user keyset pagination in tracker.pagination
+            models.Index(fields=['user', '-date', '-id'], name='transaction_user_date_id'),
+            models.Index(fields=['user', 'sync_seq'], name='transaction_user_sync_seq'),
+        ]
         
     def __str__(self):
-        return f"{self.user.username} - {self.amount} {self.currency} on {self.date}"
\ No newline at end of file
+        # user_id, so listing transactions does not load every owner
+        return f"{self.user_id} - {self.amount} {self.currency} on {self.date}"
+
+
+class MonthlySpending(models.Model):
+    """Per user, month, category and currency totals, kept in step with Transaction by tracker.rollups"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='monthly_spending'
+    )
+    month = models.DateField()  # First day of the month, local time
+    category = models.CharField(
+        max_length=2,
+        choices=Transaction.CATEGORY_CHOICES
+    )
+    currency = models.CharField(max_length=3)
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0'))
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['month', 'category', 'currency']
+        unique_together = ('user', 'month', 'category', 'currency')
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} {self.category}: {self.total} {self.currency} ({self.count})"
+
+
+class SyncCounter(models.Model):
+    """Last change sequence number handed out for a user, locked by every write to their transactions"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sync_counter'
+    )
+    seq = models.BigIntegerField(default=0)
+    # Tombstones at or below this sequence number have been pruned
+    pruned_seq = models.BigIntegerField(default=0)
+    # MonthlySpending has been built from the user's transactions (tracker.rollups.ensure_built)
+    rollups_built = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.seq}"
+
+
+class DeletedTransaction(models.Model):
+    """Tombstone telling syncing clients that a transaction was deleted"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='deleted_transactions'
+    )
+    transaction_id = models.BigIntegerField()
+    sync_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['sync_seq']
+        indexes = [
+            models.Index(fields=['user', 'sync_seq'], name='deleted_tx_user_sync_seq'),
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} deleted {self.transaction_id} at {self.sync_seq}"
@@ -0,0 +1,92 @@
+# tracker/pagination.py
+"""
+Keyset pagination for the transaction list. The cursor is the (date, id) of
+the last row sent and the next page is the rows after it in (-date, -id)
+order, so with the (user, -date, -id) index every page costs the same as the
+first, unlike OFFSET which scans and discards all earlier rows.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only cursor pagination on (date, id), newest first. Only requests
+    carrying ?cursor= or ?page_size= are paginated; plain list requests keep
+    getting the bare array existing clients expect.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, row):
+        # Rows are model instances or .values() dicts
+        date, pk = (row['date'], row['id']) if isinstance(row, dict) else (row.date, row.id)
+        position = json.dumps([date.isoformat(), pk]).encode()
+        return base64.urlsafe_b64encode(position).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            date, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            date = parse_datetime(date)
+            if date is None or not isinstance(pk, int):
+                raise ValueError
+        except (binascii.Error, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return date, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-date', '-id')
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
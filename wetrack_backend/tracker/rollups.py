@@ -0,0 +1,160 @@
+# tracker/rollups.py
+"""
+Incremental maintenance of MonthlySpending. Every write to a Transaction
+applies its change as +/- deltas to the affected (user, month, category,
+currency) rows inside the same database transaction, so rollups and
+transactions commit or roll back together. rebuild() and verify() recompute
+them from scratch.
+
+Users whose transactions predate rollups get theirs built by ensure_built()
+the first time a summary reads them, the way sync numbers legacy rows.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from wetrack.routers import replica_reads
+
+from . import sync
+from .models import MonthlySpending, SyncCounter, Transaction
+
+# Users whose rollups are known to be built; the flag never goes back, so this process need not ask again
+_built = set()
+
+
+def month_of(date):
+    """First day of the local month of `date`, matching TruncMonth"""
+    return timezone.localtime(date).date().replace(day=1)
+
+
+def bucket(tx):
+    return tx.user_id, month_of(tx.date), tx.category, tx.currency
+
+
+def apply_delta(user_id, month, category, currency, total, count):
+    """Add `total` and `count` to one rollup row, creating or deleting it as needed"""
+    rows = MonthlySpending.objects.filter(user_id=user_id, month=month, category=category, currency=currency)
+    with transaction.atomic():
+        if not rows.update(total=F('total') + total, count=F('count') + count):
+            try:
+                # Savepoint, so losing the insert race leaves the outer transaction usable
+                with transaction.atomic():
+                    MonthlySpending.objects.create(user_id=user_id, month=month, category=category,
+                                                   currency=currency, total=total, count=count)
+                return
+            except IntegrityError:
+                rows.update(total=F('total') + total, count=F('count') + count)
+        if count < 0:
+            rows.filter(count=0).delete()
+
+
+def apply_changes(added=(), removed=()):
+    """
+    Fold added and removed transactions into one delta per bucket and apply
+    them, in a stable order so concurrent writers lock rows alike.
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for sign, transactions in ((1, added), (-1, removed)):
+        for tx in transactions:
+            delta = deltas[bucket(tx)]
+            delta[0] += sign * tx.amount
+            delta[1] += sign
+    with transaction.atomic():
+        for key in sorted(deltas, key=str):
+            total, count = deltas[key]
+            if total or count:
+                apply_delta(*key, total, count)
+
+
+def record_create(tx):
+    apply_changes(added=[tx])
+
+
+def record_update(old, new):
+    """`old` is a copy of the transaction as it was before `new` was saved"""
+    if bucket(old) != bucket(new) or old.amount != new.amount:
+        apply_changes(added=[new], removed=[old])
+
+
+def record_delete(tx):
+    apply_changes(removed=[tx])
+
+
+def _aggregated(user=None):
+    transactions = Transaction.objects.order_by()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+    return (transactions
+            .annotate(month=TruncMonth('date', output_field=DateField()))
+            .values('user_id', 'month', 'category', 'currency')
+            .annotate(total=Sum('amount'), count=Count('id')))
+
+
+def rebuild(user=None, batch_size=1000):
+    """
+    Recompute MonthlySpending (for one user, or everyone a user at a time)
+    from Transaction; returns the row count. Safe on a live system: each
+    user's sync counter is locked before their transactions are aggregated,
+    as writes lock it, so no delta lands between the aggregation and the swap.
+    """
+    if user is not None:
+        return _rebuild_user(getattr(user, 'pk', user), batch_size)
+    user_ids = (set(Transaction.objects.order_by().values_list('user_id', flat=True).distinct())
+                | set(MonthlySpending.objects.order_by().values_list('user_id', flat=True).distinct()))
+    return sum(_rebuild_user(user_id, batch_size) for user_id in sorted(user_ids))
+
+
+def _rebuild_user(user_id, batch_size):
+    with replica_reads(enabled=False), transaction.atomic():
+        counter = sync.locked_counter(user_id)
+        rows = [MonthlySpending(**row) for row in _aggregated(user_id)]
+        MonthlySpending.objects.filter(user_id=user_id).delete()
+        MonthlySpending.objects.bulk_create(rows, batch_size=batch_size)
+        if not counter.rollups_built:
+            counter.rollups_built = True
+            counter.save(update_fields=['rollups_built'])
+    return len(rows)
+
+
+def ensure_built(user_id):
+    """
+    Build the user's MonthlySpending from their transactions unless that was
+    done before. Holds their sync counter lock, as writes do, so no delta is
+    applied while it rebuilds. Returns True if it built them now.
+    """
+    if user_id in _built:
+        return False
+    with replica_reads(enabled=False), transaction.atomic():
+        built = not sync.locked_counter(user_id).rollups_built
+        if built:
+            rebuild(user_id)
+    _built.add(user_id)
+    return built
+
+
+def verify(user=None):
+    """
+    Compare MonthlySpending with a fresh aggregation. Returns a list of
+    (key, expected (total, count), stored (total, count)) for every bucket
+    that differs; None stands for a missing row.
+    """
+    expected = {
+        (row['user_id'], row['month'], row['category'], row['currency']): (row['total'], row['count'])
+        for row in _aggregated(user)
+    }
+    stored_rows = MonthlySpending.objects.all()
+    if user is not None:
+        stored_rows = stored_rows.filter(user=user)
+    stored = {
+        (row['user_id'], row['month'], row['category'], row['currency']): (row['total'], row['count'])
+        for row in stored_rows.values('user_id', 'month', 'category', 'currency', 'total', 'count')
+    }
+    return [
+        (key, expected.get(key), stored.get(key))
+        for key in sorted(expected.keys() | stored.keys(), key=str)
+        if expected.get(key) != stored.get(key)
+    ]
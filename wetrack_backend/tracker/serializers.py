@@ -1,5 +1,32 @@
+from decimal import Decimal
+
+from django.utils import timezone
 from rest_framework import serializers
+from currency.matrix import convert_amount
 from .models import Transaction
+from .summaries import GROUPINGS
+
+class TransactionListSerializer(serializers.ListSerializer):
+    def validate_items(self, items):
+        """
+        Validate (instance, data) pairs with the one bound child serializer:
+        creates where instance is None, partial updates otherwise. Returns
+        (validated attrs, None) or (None, errors) per pair instead of raising.
+        """
+        results = []
+        for instance, data in items:
+            self.child.instance = instance
+            # Fields look at the root serializer to decide whether they may be omitted
+            self.partial = self.child.partial = instance is not None
+            self.child.initial_data = data
+            try:
+                results.append((self.child.run_validation(data), None))
+            except serializers.ValidationError as exc:
+                results.append((None, exc.detail))
+        self.child.instance = None
+        self.partial = self.child.partial = False
+        return results
+
 
 class TransactionSerializer(serializers.ModelSerializer):
     category_display = serializers.CharField(source='get_category_display', read_only=True)
@@ -8,4 +35,105 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = ['id', 'date', 'amount', 'category', 'category_display',
                  'description', 'currency', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = TransactionListSerializer
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # With ?home=, the view passes the home currency and a RateHistory covering the rows
+        history = self.context.get('history')
+        if history is not None:
+            home = self.context['home']
+            rate = history.rate(instance.currency, home, timezone.localtime(instance.date).date())
+            data['home_currency'] = home
+            data['home_amount'] = None if rate is None else str(convert_amount(instance.amount, rate))
+        return data
+
+
+# Fast path for list responses. Rows come from .values(*VALUE_FIELDS) and are
+# rendered exactly as TransactionSerializer would, without per-field dispatch.
+VALUE_FIELDS = ('id', 'date', 'amount', 'category', 'description', 'currency', 'created_at', 'updated_at')
+CATEGORY_LABELS = dict(Transaction.CATEGORY_CHOICES)
+AMOUNT_PLACES = Decimal('0.01')
+
+
+def format_amount(value):
+    """DecimalField(decimal_places=2) rendering"""
+    return '{:f}'.format(value.quantize(AMOUNT_PLACES))
+
+
+def datetime_formatter():
+    """DateTimeField rendering for the current timezone: ISO 8601, +00:00 written as Z"""
+    tz = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        text = value.astimezone(tz).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+    return format_datetime
+
+
+def represent_values(rows):
+    """TransactionSerializer(many=True).data for rows of .values(*VALUE_FIELDS)"""
+    format_datetime = datetime_formatter()
+    labels = CATEGORY_LABELS
+    return [
+        {
+            'id': row['id'],
+            'date': format_datetime(row['date']),
+            'amount': format_amount(row['amount']),
+            'category': row['category'],
+            'category_display': labels.get(row['category'], row['category']),
+            'description': row['description'],
+            'currency': row['currency'],
+            'created_at': format_datetime(row['created_at']),
+            'updated_at': format_datetime(row['updated_at']),
+        }
+        for row in rows
+    ]
+
+
+class SummaryQuerySerializer(serializers.Serializer):
+    by = serializers.ChoiceField(choices=GROUPINGS, default='month')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    home = serializers.RegexField(r'^[A-Za-z]{3}$', required=False)
+
+    def validate_home(self, value):
+        return value.upper()
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    compress = serializers.ChoiceField(choices=['zstd'], required=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    since = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=500)
+
+
+class CurrencySummarySerializer(serializers.Serializer):
+    currency = serializers.CharField()
+    total = serializers.DecimalField(max_digits=16, decimal_places=2)
+    count = serializers.IntegerField()
+    home_total = serializers.DecimalField(max_digits=16, decimal_places=2, required=False)
+
+
+class MonthSummarySerializer(CurrencySummarySerializer):
+    month = serializers.DateField(format='%Y-%m')
+
+
+class CategorySummarySerializer(CurrencySummarySerializer):
+    category = serializers.CharField()
+    category_display = serializers.SerializerMethodField()
+
+    def get_category_display(self, row):
+        return dict(Transaction.CATEGORY_CHOICES).get(row['category'], row['category'])
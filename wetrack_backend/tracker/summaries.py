@@ -0,0 +1,112 @@
+# tracker/summaries.py
+"""
+Spending totals computed in the database. Each grouping is one GROUP BY
+query, so the result has a row per bucket however many transactions fall
+in the range. Amounts are never added across currencies: every bucket is
+also split by currency. Ranges made of whole months are answered from the
+MonthlySpending rollups instead of the transactions themselves.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from currency.history import RateHistory
+from currency.matrix import convert_amount
+
+GROUPINGS = ('month', 'category', 'currency')
+
+
+def date_range(queryset, start=None, end=None):
+    """
+    Restrict `queryset` to transactions dated from `start` through `end`
+    (inclusive local dates). Bounds are compared as datetimes so an index on
+    `date` can be used.
+    """
+    if start is not None:
+        queryset = queryset.filter(date__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end is not None:
+        queryset = queryset.filter(date__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    return queryset
+
+
+def summarize(queryset, by):
+    """
+    Rows of {<by>, 'currency', 'total', 'count'} for each bucket of `by`
+    ('month', 'category' or 'currency'), ordered by bucket then currency.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping: {by}")
+
+    keys = [by] if by == 'currency' else [by, 'currency']
+    return (_bucketed(queryset, by)
+            .values(*keys)
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by(*keys))
+
+
+def _bucketed(queryset, by):
+    # Clear Meta.ordering, which would otherwise add `date` to the GROUP BY
+    queryset = queryset.order_by()
+    if by == 'month':
+        queryset = queryset.annotate(month=TruncMonth('date', output_field=DateField()))
+    return queryset
+
+
+def summarize_home(queryset, by, home):
+    """
+    summarize() with a `home_total` per row: the amounts converted to `home`
+    at the rate in force on each transaction's day. The database groups by
+    bucket and day, and each daily subtotal is converted from a RateHistory
+    loaded once. Raises MissingRate when a day precedes the stored history.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping: {by}")
+
+    keys = [by] if by == 'currency' else [by, 'currency']
+    daily = list(_bucketed(queryset, by)
+                 .annotate(day=TruncDate('date'))
+                 .values(*keys, 'day')
+                 .annotate(total=Sum('amount'), count=Count('id'))
+                 .order_by(*keys, 'day'))
+    if not daily:
+        return []
+
+    days = [row['day'] for row in daily]
+    history = RateHistory.load({row['currency'] for row in daily} | {home}, min(days), max(days))
+    results = []
+    for bucket, rows in groupby(daily, key=itemgetter(*keys)):
+        row = dict(zip(keys, bucket if len(keys) > 1 else [bucket]), total=Decimal('0'), count=0,
+                   home_total=Decimal('0'))
+        for day in rows:
+            row['total'] += day['total']
+            row['count'] += day['count']
+            row['home_total'] += convert_amount(day['total'], history.require(day['currency'], home, day['day']))
+        results.append(row)
+    return results
+
+
+def month_aligned(start=None, end=None):
+    """True when the range starts on the first and ends on the last day of a month"""
+    return (start is None or start.day == 1) and (end is None or (end + timedelta(days=1)).day == 1)
+
+
+def summarize_rollups(rollups, by, start=None, end=None):
+    """summarize() over MonthlySpending rows for a month_aligned() range"""
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping: {by}")
+    if start is not None:
+        rollups = rollups.filter(month__gte=start)
+    if end is not None:
+        rollups = rollups.filter(month__lte=end)
+
+    keys = [by] if by == 'currency' else [by, 'currency']
+    return (rollups
+            .order_by()
+            .values(*keys)
+            .annotate(total=Sum('total'), count=Sum('count'))
+            .order_by(*keys))
@@ -0,0 +1,141 @@
+# tracker/sync.py
+"""
+Delta sync for mobile clients. Every write to a user's transactions locks
+their SyncCounter row and stamps the change with the next number of their
+sequence; deletes leave a DeletedTransaction tombstone carrying it. Because
+the lock is held until commit, a user's changes commit in sequence order, so
+"everything after N" never skips a change that commits late, whatever the
+clocks say. updated_at rides along in the watermark for display only.
+"""
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DeletedTransaction, SyncCounter, Transaction
+
+
+class InvalidWatermark(ValueError):
+    pass
+
+
+class WatermarkExpired(Exception):
+    """The watermark predates pruned tombstones; the client must sync from scratch"""
+
+
+def locked_counter(user_id):
+    """The user's SyncCounter, locked until the surrounding transaction commits; created on first use"""
+    try:
+        return SyncCounter.objects.select_for_update().get(user_id=user_id)
+    except SyncCounter.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            counter = SyncCounter.objects.create(user_id=user_id)
+    except IntegrityError:
+        # Another writer created it first
+        return SyncCounter.objects.select_for_update().get(user_id=user_id)
+
+    # Number the user's rows written before sync existed, so a first sync can page through them
+    rows = list(Transaction.objects.filter(user_id=user_id, sync_seq=0).order_by('id').only('id'))
+    for seq, row in enumerate(rows, start=1):
+        row.sync_seq = seq
+    Transaction.objects.bulk_update(rows, ['sync_seq'], batch_size=1000)
+    counter.seq = len(rows)
+    counter.save(update_fields=['seq'])
+    return counter
+
+
+def reserve(user_id, count=1):
+    """
+    Lock the user's sequence until the surrounding transaction commits and
+    return the first of `count` new consecutive numbers. Call inside
+    transaction.atomic(), before writing.
+    """
+    counter = locked_counter(user_id)
+    first = counter.seq + 1
+    counter.seq += count
+    counter.save(update_fields=['seq'])
+    return first
+
+
+def record_deletes(user_id, deletions):
+    """Tombstones for deleted transactions, given as (id, sequence number) pairs"""
+    DeletedTransaction.objects.bulk_create([
+        DeletedTransaction(user_id=user_id, transaction_id=pk, sync_seq=seq)
+        for pk, seq in deletions
+    ])
+
+
+def encode_watermark(seq, updated_at=None):
+    position = json.dumps([seq, updated_at.isoformat() if updated_at else None]).encode()
+    return base64.urlsafe_b64encode(position).decode()
+
+
+def decode_watermark(watermark):
+    """(sequence number, updated_at or None) of a watermark; raises InvalidWatermark"""
+    try:
+        seq, updated_at = json.loads(base64.urlsafe_b64decode(watermark.encode()))
+        if updated_at is not None:
+            updated_at = parse_datetime(updated_at)
+            if updated_at is None:
+                raise ValueError
+        if not isinstance(seq, int) or seq < 0:
+            raise ValueError
+    except (binascii.Error, TypeError, ValueError):
+        raise InvalidWatermark('Invalid watermark')
+    return seq, updated_at
+
+
+def changes_since(user, since=0, limit=500, since_updated=None):
+    """
+    Up to `limit` changes after sequence number `since`, oldest first:
+    (changed transactions, deleted ids, new watermark, more to fetch).
+    Raises WatermarkExpired when tombstones after `since` were pruned.
+    """
+    counter = SyncCounter.objects.filter(user=user).first()
+    if counter is None:
+        with transaction.atomic():
+            reserve(user.pk, 0)
+        counter = SyncCounter.objects.get(user=user)
+    if since < counter.pruned_seq or since > counter.seq:
+        raise WatermarkExpired('Watermark is not valid for the retained history')
+
+    # Read after the counter: every change up to counter.seq had committed by then. Both reads
+    # stop there, so changes committing between them are left whole for the next call
+    window = {'user': user, 'sync_seq__gt': since, 'sync_seq__lte': counter.seq}
+    changed = list(Transaction.objects.filter(**window).order_by('sync_seq')[:limit + 1])
+    deleted = list(DeletedTransaction.objects.filter(**window)
+                   .order_by('sync_seq').values_list('sync_seq', 'transaction_id')[:limit + 1])
+
+    # Merge both streams by sequence number and cut at `limit`
+    merged = sorted([(row.sync_seq, row) for row in changed] + deleted, key=lambda item: item[0])
+    more = len(merged) > limit
+    merged = merged[:limit]
+    rows = [item for _, item in merged if isinstance(item, Transaction)]
+    deleted_ids = [item for _, item in merged if not isinstance(item, Transaction)]
+
+    if more:
+        last_seq = merged[-1][0]
+    else:
+        last_seq = max([since, counter.seq] + [seq for seq, _ in merged[-1:]])
+    last_updated = max([row.updated_at for row in rows] + ([since_updated] if since_updated else []), default=None)
+    return rows, deleted_ids, encode_watermark(last_seq, last_updated), more
+
+
+def prune_tombstones(days=30):
+    """Delete tombstones older than `days` and remember the horizon per user; returns the count"""
+    cutoff = timezone.now() - timedelta(days=days)
+    with transaction.atomic():
+        old = DeletedTransaction.objects.filter(deleted_at__lt=cutoff)
+        horizons = old.values('user_id').annotate(seq=Max('sync_seq')).order_by()
+        for horizon in horizons:
+            SyncCounter.objects.filter(user_id=horizon['user_id'], pruned_seq__lt=horizon['seq']) \
+                .update(pruned_seq=horizon['seq'])
+        count, _ = old.delete()
+    return count
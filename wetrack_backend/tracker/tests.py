@@ -1,3 +1,699 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import zstandard
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from benchmarks.seed import seed
+from currency.models import DailyRate
+from wetrack import routers
+from wetrack.testing import QueryBudgetMixin
+
+from . import rollups, sync
+from .importers import import_statement
+from .models import DeletedTransaction, MonthlySpending, SyncCounter, Transaction
+from .serializers import TransactionSerializer
+
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class TransactionSummaryTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        other = User.objects.create_user(username='bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for user, date, amount, category, currency in [
+            (self.user, local(2024, 10, 31, 23, 30), '10.00', '2', 'GBP'),
+            (self.user, local(2024, 11, 1, 0, 15), '5.50', '2', 'GBP'),
+            (self.user, local(2024, 11, 20), '4.50', '1', 'GBP'),
+            (self.user, local(2024, 11, 21), '7.25', '2', 'USD'),
+            (other, local(2024, 11, 21), '100.00', '2', 'GBP'),
+        ]:
+            Transaction.objects.create(user=user, date=date, amount=Decimal(amount), category=category,
+                                       currency=currency, description='test')
+        rollups.rebuild()
+
+    def summary(self, **params):
+        return self.client.get('/api/transactions/summary/', params)
+
+    def test_monthly_totals_are_split_by_currency(self):
+        response = self.summary()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'month': '2024-10', 'currency': 'GBP', 'total': '10.00', 'count': 1},
+            {'month': '2024-11', 'currency': 'GBP', 'total': '10.00', 'count': 2},
+            {'month': '2024-11', 'currency': 'USD', 'total': '7.25', 'count': 1},
+        ])
+
+    def test_category_totals_within_date_range(self):
+        response = self.summary(by='category', start='2024-11-01', end='2024-11-20')
+
+        self.assertEqual(response.json()['results'], [
+            {'category': '1', 'category_display': 'Transportation', 'currency': 'GBP', 'total': '4.50', 'count': 1},
+            {'category': '2', 'category_display': 'Food & Drink', 'currency': 'GBP', 'total': '5.50', 'count': 1},
+        ])
+
+    def test_currency_totals_use_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.summary(by='currency', start='2024-10-02')
+
+        self.assertEqual(response.json()['results'], [
+            {'currency': 'GBP', 'total': '20.00', 'count': 3},
+            {'currency': 'USD', 'total': '7.25', 'count': 1},
+        ])
+
+    def test_whole_months_are_read_from_rollups(self):
+        MonthlySpending.objects.filter(month__month=10).update(total=Decimal('99.00'))
+
+        self.assertEqual(self.summary(by='currency', start='2024-10-01', end='2024-10-31').json()['results'],
+                         [{'currency': 'GBP', 'total': '99.00', 'count': 1}])
+
+    def test_invalid_parameters_are_400(self):
+        self.assertEqual(self.summary(by='week').status_code, 400)
+        self.assertEqual(self.summary(start='2024-12-01', end='2024-11-01').status_code, 400)
+
+
+class TransactionPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Pairs of transactions share a timestamp so pages split ties on id
+        self.transactions = [
+            Transaction.objects.create(user=self.user, date=local(2024, 11, 1 + i // 2), amount=Decimal('1.00'),
+                                       category='1', currency='GBP', description=str(i))
+            for i in range(7)
+        ]
+
+    def test_pages_walk_every_row_once_in_order(self):
+        ids = []
+        url = '/api/transactions/?page_size=3'
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+
+        expected = sorted(self.transactions, key=lambda t: (t.date, t.id), reverse=True)
+        self.assertEqual(ids, [t.id for t in expected])
+
+    def test_unpaginated_list_is_unchanged(self):
+        data = self.client.get('/api/transactions/').json()
+
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 7)
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get('/api/transactions/', {'cursor': 'bogus'}).status_code, 404)
+
+    def test_fast_path_is_byte_identical_to_the_serializer(self):
+        Transaction.objects.create(user=self.user, date=local(2024, 7, 1, 12, 0, 0, 123456), amount=Decimal('1E+1'),
+                                   category='9', currency='EUR', description='caf\u00e9 "quoted"')
+        queryset = Transaction.objects.filter(user=self.user).order_by('-date', '-id')
+        expected = JSONRenderer().render(TransactionSerializer(queryset, many=True).data)
+
+        self.assertEqual(self.client.get('/api/transactions/').content, expected)
+        page = self.client.get('/api/transactions/', {'page_size': 8}).json()['results']
+        self.assertEqual(JSONRenderer().render(page), expected)
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, **fields):
+        data = {'date': '2024-11-05T12:00:00Z', 'amount': '10.00', 'category': '2',
+                'currency': 'GBP', 'description': 'lunch', **fields}
+        return self.client.post('/api/transactions/', data, format='json').json()
+
+    def rollup(self):
+        return {(row.month.strftime('%Y-%m'), row.category, row.currency): (row.total, row.count)
+                for row in MonthlySpending.objects.filter(user=self.user)}
+
+    def test_writes_apply_deltas(self):
+        first = self.create()
+        self.create(amount='2.50')
+        self.assertEqual(self.rollup(), {('2024-11', '2', 'GBP'): (Decimal('12.50'), 2)})
+
+        self.client.patch(f"/api/transactions/{first['id']}/",
+                          {'date': '2024-12-01T09:00:00Z', 'category': '1'}, format='json')
+        self.assertEqual(self.rollup(), {
+            ('2024-11', '2', 'GBP'): (Decimal('2.50'), 1),
+            ('2024-12', '1', 'GBP'): (Decimal('10.00'), 1),
+        })
+
+        self.client.delete(f"/api/transactions/{first['id']}/")
+        self.assertEqual(self.rollup(), {('2024-11', '2', 'GBP'): (Decimal('2.50'), 1)})
+        self.assertEqual(rollups.verify(), [])
+
+    def test_command_rebuilds_and_verifies(self):
+        self.create()
+        MonthlySpending.objects.update(total=Decimal('1.00'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--verify-only', stdout=StringIO())
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        self.assertEqual(self.rollup(), {('2024-11', '2', 'GBP'): (Decimal('10.00'), 1)})
+
+    def test_rebuild_locks_each_users_counter_before_aggregating(self):
+        self.create()
+        steps = []
+        locked_counter, aggregated = sync.locked_counter, rollups._aggregated
+
+        def lock(user_id):
+            steps.append(('lock', user_id))
+            return locked_counter(user_id)
+
+        def aggregate(user=None):
+            steps.append(('aggregate', user))
+            return aggregated(user)
+
+        with mock.patch.object(sync, 'locked_counter', side_effect=lock), \
+                mock.patch.object(rollups, '_aggregated', side_effect=aggregate):
+            rollups.rebuild()
+
+        self.assertEqual(steps, [('lock', self.user.pk), ('aggregate', self.user.pk)])
+        self.assertEqual(rollups.verify(), [])
+
+    def test_transactions_from_before_rollups_are_built_on_first_summary(self):
+        Transaction.objects.create(user=self.user, date=local(2024, 10, 3, 9), amount=Decimal('4.00'),
+                                   category='2', currency='GBP', description='legacy')
+        # User ids can repeat between tests, which roll the database back but not this process
+        rollups._built.discard(self.user.pk)
+        self.create(amount='1.00')  # A write after deploy only adds its own delta
+
+        response = self.client.get('/api/transactions/summary/', {'by': 'category'})
+
+        self.assertEqual(response.json()['results'][0]['total'], '5.00')
+        self.assertTrue(SyncCounter.objects.get(user=self.user).rollups_built)
+        self.assertEqual(rollups.verify(self.user), [])
+        with self.assertNumQueries(0), mock.patch.object(rollups, 'rebuild') as rebuild:
+            rollups.ensure_built(self.user.pk)
+        rebuild.assert_not_called()
+
+
+class HomeCurrencyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for day, gbp, eur in [(1, '0.800000', '0.900000'), (3, '0.500000', '1.000000')]:
+            DailyRate.objects.create(base_currency='USD', target_currency='GBP', date=datetime(2024, 11, day), rate=gbp)
+            DailyRate.objects.create(base_currency='USD', target_currency='EUR', date=datetime(2024, 11, day), rate=eur)
+        for day, amount, currency in [(2, '10.00', 'USD'), (4, '10.00', 'USD'), (4, '9.00', 'EUR'), (5, '3.00', 'GBP')]:
+            Transaction.objects.create(user=self.user, date=local(2024, 11, day, 12), amount=Decimal(amount),
+                                       category='2', currency=currency, description='test')
+
+    def test_list_converts_at_rate_on_transaction_day(self):
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/transactions/', {'home': 'gbp'}).json()
+
+        self.assertEqual([(row['amount'], row['currency'], row['home_amount']) for row in data], [
+            ('3.00', 'GBP', '3.00'),
+            ('9.00', 'EUR', '4.50'),
+            ('10.00', 'USD', '5.00'),
+            ('10.00', 'USD', '8.00'),
+        ])
+        self.assertEqual({row['home_currency'] for row in data}, {'GBP'})
+
+    def test_summary_home_totals(self):
+        data = self.client.get('/api/transactions/summary/', {'by': 'month', 'home': 'GBP'}).json()
+
+        self.assertEqual(data['results'], [
+            {'month': '2024-11', 'currency': 'EUR', 'total': '9.00', 'count': 1, 'home_total': '4.50'},
+            {'month': '2024-11', 'currency': 'GBP', 'total': '3.00', 'count': 1, 'home_total': '3.00'},
+            {'month': '2024-11', 'currency': 'USD', 'total': '20.00', 'count': 2, 'home_total': '13.00'},
+        ])
+
+    def test_summary_before_history_is_503(self):
+        Transaction.objects.create(user=self.user, date=local(2024, 10, 1), amount=Decimal('1.00'),
+                                   category='2', currency='USD', description='old')
+
+        self.assertEqual(self.client.get('/api/transactions/summary/', {'home': 'GBP'}).status_code, 503)
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Written before the user ever synced
+        self.existing = Transaction.objects.create(user=self.user, date=local(2024, 11, 1), amount=Decimal('1.00'),
+                                                   category='1', currency='GBP', description='old')
+
+    def create(self, description):
+        return self.client.post('/api/transactions/', {
+            'date': '2024-11-05T12:00:00Z', 'amount': '10.00', 'category': '2',
+            'currency': 'GBP', 'description': description,
+        }, format='json').json()
+
+    def sync(self, watermark=None, **params):
+        if watermark:
+            params['since'] = watermark
+        return self.client.get('/api/transactions/sync/', params).json()
+
+    def test_first_sync_then_deltas_and_tombstones(self):
+        first = self.sync()
+        self.assertEqual([row['id'] for row in first['changes']], [self.existing.id])
+        self.assertFalse(first['more'])
+
+        lunch = self.create('lunch')
+        dinner = self.create('dinner')
+        self.client.patch(f"/api/transactions/{lunch['id']}/", {'amount': '12.00'}, format='json')
+        self.client.delete(f"/api/transactions/{dinner['id']}/")
+
+        delta = self.sync(first['watermark'])
+        self.assertEqual([(row['id'], row['amount']) for row in delta['changes']], [(lunch['id'], '12.00')])
+        self.assertEqual(delta['deleted'], [dinner['id']])
+
+        self.assertEqual(self.sync(delta['watermark']), {
+            'changes': [], 'deleted': [], 'watermark': delta['watermark'], 'more': False,
+        })
+
+    def test_writes_between_the_two_reads_wait_for_the_next_sync(self):
+        first = self.sync()
+        lunch, dinner = self.create('lunch'), self.create('dinner')
+        filter_tombstones = DeletedTransaction.objects.filter
+
+        def write_then_filter(*args, **kwargs):
+            # Another request updates lunch, then deletes dinner, after the changed rows were read
+            if not write_then_filter.done:
+                write_then_filter.done = True
+                self.client.patch(f"/api/transactions/{lunch['id']}/", {'amount': '12.00'}, format='json')
+                self.client.delete(f"/api/transactions/{dinner['id']}/")
+            return filter_tombstones(*args, **kwargs)
+
+        write_then_filter.done = False
+        with mock.patch.object(DeletedTransaction.objects, 'filter', side_effect=write_then_filter):
+            delta = self.sync(first['watermark'])
+        self.assertEqual([(row['id'], row['amount']) for row in delta['changes']],
+                         [(lunch['id'], '10.00'), (dinner['id'], '10.00')])
+        self.assertEqual(delta['deleted'], [])
+
+        rest = self.sync(delta['watermark'])
+        self.assertEqual([(row['id'], row['amount']) for row in rest['changes']], [(lunch['id'], '12.00')])
+        self.assertEqual(rest['deleted'], [dinner['id']])
+
+    def test_paging_follows_the_sequence(self):
+        ids = [self.create(str(i))['id'] for i in range(3)]
+        self.client.delete(f"/api/transactions/{ids[0]}/")
+
+        seen, watermark, more = [], None, True
+        while more:
+            page = self.sync(watermark, limit=2)
+            seen += [('change', row['id']) for row in page['changes']] + [('delete', pk) for pk in page['deleted']]
+            watermark, more = page['watermark'], page['more']
+
+        self.assertEqual(seen, [('change', self.existing.id), ('change', ids[1]), ('change', ids[2]),
+                                ('delete', ids[0])])
+
+    def test_pruned_history_asks_for_reset(self):
+        watermark = self.sync()['watermark']
+        self.client.delete(f"/api/transactions/{self.existing.id}/")
+        SyncCounter.objects.filter(user=self.user).update(pruned_seq=10)
+
+        response = self.client.get('/api/transactions/sync/', {'since': watermark})
+        self.assertEqual((response.status_code, response.json()['reset']), (410, True))
+        self.assertEqual(self.client.get('/api/transactions/sync/', {'since': 'junk'}).status_code, 400)
+
+    def test_prune_tombstones(self):
+        self.client.delete(f"/api/transactions/{self.existing.id}/")
+
+        self.assertEqual(sync.prune_tombstones(days=-1), 1)
+        self.assertEqual(SyncCounter.objects.get(user=self.user).pruned_seq, 2)
+
+
+class BulkOperationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        other = get_user_model().objects.create_user(username='bob', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.mine = [self.client.post('/api/transactions/', {
+            'date': '2024-11-05T12:00:00Z', 'amount': '10.00', 'category': '2', 'currency': 'GBP', 'description': str(i),
+        }, format='json').json()['id'] for i in range(2)]
+        self.theirs = Transaction.objects.create(user=other, date=local(2024, 11, 1), amount=Decimal('1.00'),
+                                                 category='1', currency='GBP', description='not yours')
+
+    def bulk(self, operations):
+        return self.client.post('/api/transactions/bulk/', {'operations': operations}, format='json')
+
+    def test_mixed_operations_with_per_item_results(self):
+        watermark = self.client.get('/api/transactions/sync/').json()['watermark']
+        new = {'date': '2024-12-01T09:00:00Z', 'amount': '3.50', 'category': '6', 'currency': 'EUR',
+               'description': 'bread'}
+
+        response = self.bulk([
+            {'op': 'create', 'data': new},
+            {'op': 'update', 'id': self.mine[0], 'data': {'amount': '11.00'}},
+            {'op': 'delete', 'id': self.mine[1]},
+            {'op': 'create', 'data': {**new, 'amount': '-1'}},
+            {'op': 'update', 'id': self.theirs.id, 'data': {'amount': '0.50'}},
+            {'op': 'rename'},
+        ])
+
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], [201, 200, 204, 400, 404, 400])
+        self.assertEqual(results[1]['data']['amount'], '11.00')
+        self.assertIn('amount', results[3]['errors'])
+        self.assertEqual(sorted(Transaction.objects.filter(user=self.user).values_list('amount', flat=True)),
+                         [Decimal('3.50'), Decimal('11.00')])
+        self.assertEqual(rollups.verify(self.user), [])
+
+        delta = self.client.get('/api/transactions/sync/', {'since': watermark}).json()
+        self.assertEqual([row['id'] for row in delta['changes']], [results[0]['id'], self.mine[0]])
+        self.assertEqual(delta['deleted'], [self.mine[1]])
+
+    def test_bulk_create_uses_constant_queries(self):
+        row = {'date': '2024-12-01T09:00:00Z', 'amount': '1.00', 'category': '1', 'currency': 'GBP',
+               'description': 'x'}
+        self.bulk([{'op': 'create', 'data': row}])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.bulk([{'op': 'create', 'data': row}] * 200)
+
+        self.assertEqual(len(response.json()['results']), 200)
+        self.assertLess(len(queries), 20)
+
+    def test_oversized_or_malformed_request_is_400(self):
+        with self.settings(TRANSACTION_BULK_MAX_ITEMS=1):
+            self.assertEqual(self.bulk([{'op': 'delete', 'id': 1}] * 2).status_code, 400)
+        self.assertEqual(self.bulk('nope').status_code, 400)
+
+    def test_boolean_ids_are_rejected(self):
+        response = self.bulk([{'op': 'delete', 'id': True}, {'op': 'update', 'id': False, 'data': {}}])
+
+        self.assertEqual([r['errors'] for r in response.json()['results']],
+                         [{'id': ['An integer id is required']}] * 2)
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 2)
+
+
+class StatementImportTests(TestCase):
+    CSV = (
+        'Date,Description,Amount,Category,Currency\n'
+        '2024-11-01,Coffee,-3.20,Food & Drink,\n'
+        '2024-11-02,Train,-12.00,1,EUR\n'
+        'yesterday,Broken,-1.00,2,\n'
+        '2024-11-03,Shop,"-1,250.00",retail shopping,USD\n'
+    ).encode()
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_streams_progress_and_row_errors(self):
+        upload = SimpleUploadedFile('statement.csv', self.CSV, content_type='text/csv')
+        response = self.client.post('/api/transactions/import/', {'file': upload}, format='multipart')
+
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(events[-1]['imported'], 3)
+        self.assertEqual([(e['line'], list(e['errors'])) for e in events[-1]['errors']], [(4, ['date'])])
+        self.assertEqual(sorted(Transaction.objects.filter(user=self.user).values_list('amount', 'category', 'currency')),
+                         [(Decimal('3.20'), '2', 'GBP'), (Decimal('12.00'), '1', 'EUR'),
+                          (Decimal('1250.00'), '5', 'USD')])
+        self.assertEqual(rollups.verify(self.user), [])
+
+    def test_ndjson_is_imported_in_chunks(self):
+        lines = [json.dumps({'date': f"2024-11-{day:02d}T10:00:00Z", 'amount': -day, 'category': '6',
+                             'description': 'groceries'}) for day in range(1, 11)]
+        statement = BytesIO(('\n'.join(lines[:5] + ['not json'] + lines[5:]) + '\n').encode())
+
+        progress = list(import_statement(self.user, statement, 'ndjson', chunk_size=4))
+
+        self.assertEqual([(p['rows'], p['imported']) for p in progress], [(4, 4), (8, 7), (11, 10)])
+        self.assertEqual(progress[1]['errors'], [{'line': 6, 'errors': {'non_field_errors': ['Unreadable row']}}])
+        self.assertEqual(self.client.get('/api/transactions/sync/').json()['changes'][-1]['amount'], '10.00')
+
+    def test_credits_are_reported_not_imported(self):
+        statement = BytesIO((
+            'Date,Description,Amount,Category\n'
+            '2024-11-01,Coffee,-3.20,2\n'
+            '2024-11-02,Salary,"2,000.00",2\n'
+            '2024-11-03,Refund,4.99,2\n'
+            '2024-11-04,Rent,-800.00,2\n'
+        ).encode())
+
+        progress = list(import_statement(self.user, statement, 'csv'))
+
+        self.assertEqual((progress[-1]['imported'], progress[-1]['failed']), (2, 2))
+        self.assertEqual([e['line'] for e in progress[-1]['errors']], [3, 4])
+        self.assertEqual(sorted(Transaction.objects.filter(user=self.user).values_list('amount', flat=True)),
+                         [Decimal('3.20'), Decimal('800.00')])
+
+        # Files listing spending as positive amounts, like the export, skip the negative rows instead
+        statement.seek(0)
+        progress = list(import_statement(self.user, statement, 'csv', spending='positive'))
+        self.assertEqual((progress[-1]['imported'], [e['line'] for e in progress[-1]['errors']]), (2, [2, 5]))
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as statement:
+            statement.write(self.CSV)
+            statement.flush()
+            out = StringIO()
+            call_command('import_statement', statement.name, '--user', 'alice', stdout=out)
+
+        self.assertIn('Imported 3 of 4 rows', out.getvalue())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i, (day, description) in enumerate([(1, 'Café, "corner"'), (2, 'bus'), (3, 'rent')]):
+            Transaction.objects.create(user=self.user, date=local(2024, 11, day, 8), amount=Decimal(f"{i + 1}.5"),
+                                       category='2', currency='GBP', description=description)
+
+    def export(self, **params):
+        response = self.client.get('/api/transactions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson_matches_the_api_representation(self):
+        response, body = self.export(output='ndjson')
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(rows, self.client.get('/api/transactions/').json())
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+    def test_csv_with_date_range(self):
+        response, body = self.export(start='2024-11-02', end='2024-11-03')
+
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,amount,category,category_display,description,currency,created_at,updated_at')
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ['3.50', '2.50'])
+        self.assertIn('transactions.csv', response['Content-Disposition'])
+
+    def test_csv_neutralises_formulas_in_descriptions(self):
+        for description in ('=HYPERLINK("http://x")', '+1 refund', '-SUM(A1)', '@cmd'):
+            Transaction.objects.create(user=self.user, date=local(2024, 11, 10), amount=Decimal('1.00'),
+                                       category='2', currency='GBP', description=description)
+
+        _, body = self.export()
+        _, ndjson = self.export(output='ndjson')
+
+        descriptions = [row[5] for row in csv.reader(body.decode().splitlines()[1:])]
+        self.assertEqual(sorted(descriptions)[:4], ["'+1 refund", "'-SUM(A1)", "'=HYPERLINK(\"http://x\")", "'@cmd"])
+        self.assertIn('Café, "corner"', descriptions)
+        self.assertIn('=HYPERLINK', {json.loads(line)['description'][:10] for line in ndjson.splitlines()})
+
+    def test_zstd_round_trip(self):
+        _, plain = self.export()
+        response, compressed = self.export(compress='zstd')
+
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(compressed), plain)
+        self.assertEqual(response['Content-Type'], 'application/zstd')
+
+    def test_streamed_with_negotiated_encoding(self):
+        _, plain = self.export(output='ndjson')
+        response = self.client.get('/api/transactions/export/', {'output': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+        # Already compressed bodies pass through
+        response = self.client.get('/api/transactions/export/', {'compress': 'zstd'}, HTTP_ACCEPT_ENCODING='zstd')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class BenchmarkSeedTests(TestCase):
+    def test_seeded_users_look_like_api_written_data(self):
+        users = seed(users=2, transactions=5, days=30)
+
+        self.assertEqual([user.username for user in users], ['bench-0', 'bench-1'])
+        self.assertEqual(Transaction.objects.filter(user=users[0]).count(), 5)
+        self.assertEqual(SyncCounter.objects.get(user=users[1]).seq, 5)
+        self.assertEqual(rollups.verify(), [])
+        self.assertTrue(DailyRate.objects.exists())
+
+
+class TransactionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        # Through the real authentication class, which keeps user lookups out of the count
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.added = 0
+
+    def add_transactions(self, count):
+        with transaction.atomic():
+            first = sync.reserve(self.user.pk, count)
+            rows = Transaction.objects.bulk_create([
+                Transaction(user=self.user, date=local(2024, 1 + (self.added + i) % 12, 1 + i % 28, 12),
+                            amount=Decimal('2.50'), category=str(1 + i % 6), currency=('GBP', 'EUR')[i % 2],
+                            description=f"Row {self.added + i}", sync_seq=first + i)
+                for i in range(count)
+            ])
+            rollups.apply_changes(added=rows)
+        self.added += count
+
+    def get(self, path, **params):
+        return lambda: self.client.get(path, params)
+
+    def test_list(self):
+        self.assertQueryBudget(1, self.get('/api/transactions/'), self.add_transactions)
+
+    def test_list_page(self):
+        self.assertQueryBudget(1, self.get('/api/transactions/', page_size=5), self.add_transactions)
+
+    def test_list_in_home_currency(self):
+        # The rows, then RateHistory.load()
+        DailyRate.objects.create(base_currency='USD', target_currency='GBP', date=local(2023, 12, 1).date(),
+                                 rate=Decimal('0.8'))
+        DailyRate.objects.create(base_currency='USD', target_currency='EUR', date=local(2023, 12, 1).date(),
+                                 rate=Decimal('0.9'))
+        self.assertQueryBudget(3, self.get('/api/transactions/', home='GBP'), self.add_transactions)
+
+    def test_summaries(self):
+        for by in ('month', 'category', 'currency'):
+            with self.subTest(by=by):
+                self.assertQueryBudget(1, self.get('/api/transactions/summary/', by=by), self.add_transactions)
+
+    def test_sync(self):
+        # Counter, changed rows, tombstones
+        self.assertQueryBudget(3, self.get('/api/transactions/sync/'), self.add_transactions)
+
+    def test_export(self):
+        self.assertQueryBudget(1, self.get('/api/transactions/export/', output='ndjson'), self.add_transactions)
+
+    def test_str_does_not_load_the_user(self):
+        self.add_transactions(1)
+        row = Transaction.objects.get()
+        with self.assertNumQueries(0):
+            str(row)
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+# Pins must be shared by the workers, so replicas refuse the default LocMemCache
+@override_settings(DATABASE_REPLICAS=['replica'], CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_cache'},
+})
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        # Caches the user's auth state, which is read on the primary before the scope opens,
+        # and builds their rollups, which the first summary does on the primary
+        self.read_aliases(lambda: self.client.get('/api/transactions/'))
+        self.read_aliases(lambda: self.client.get('/api/transactions/summary/'))
+
+    def read_aliases(self, request):
+        """Aliases the router would pick for the request's reads; the test database serves them all"""
+        seen = []
+        db_for_read = routers.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            if model._meta.app_label != routers.CACHE_APP_LABEL:
+                seen.append(db_for_read(router, model, **hints))
+
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read', autospec=True, side_effect=record):
+            request()
+        return set(seen)
+
+    def test_scope_and_pinning(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Transaction))
+        with routers.replica_reads(self.user.pk):
+            self.assertEqual(router.db_for_read(Transaction), 'replica')
+            self.assertEqual(router.db_for_write(Transaction), 'default')
+            # Pins are read from the primary
+            self.assertIsNone(router.db_for_read(cache.cache_model_class))
+        routers.pin(self.user.pk)
+        with routers.replica_reads(self.user.pk):
+            self.assertIsNone(router.db_for_read(Transaction))
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Transaction), 'replica')
+
+    def test_safe_endpoints_read_from_the_replica_until_the_user_writes(self):
+        self.assertEqual(self.read_aliases(lambda: self.client.get('/api/transactions/')), {'replica'})
+        self.assertEqual(self.read_aliases(lambda: self.client.get('/api/transactions/summary/')), {'replica'})
+        self.assertEqual(self.read_aliases(lambda: self.client.get('/api/transactions/sync/')), {None})
+
+        response = self.client.post('/api/transactions/', {
+            'date': '2024-11-01T12:00:00Z', 'amount': '3.50', 'category': '1', 'currency': 'GBP', 'description': 'Bus',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.read_aliases(lambda: self.client.get('/api/transactions/')), {None})
+        cache.delete(routers.pin_key(self.user.pk))
+        self.assertEqual(self.read_aliases(lambda: self.client.get('/api/transactions/')), {'replica'})
+
+    def test_replicas_need_a_shared_cache(self):
+        with self.settings(CACHES=LOCMEM_CACHES):
+            with self.assertRaises(ImproperlyConfigured):
+                routers.ReplicaPinMiddleware(lambda request: HttpResponse())
+        with self.settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=[]):
+            routers.ReplicaPinMiddleware(lambda request: HttpResponse())
+
+    @override_settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=[])
+    def test_async_middleware_pins_after_a_write(self):
+        async def view(request):
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        cache.clear()
+        middleware = routers.ReplicaPinMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        factory = RequestFactory()
+        for request in (factory.get('/'), factory.post('/')):
+            request.user = self.user
+            pinned = routers.is_pinned(self.user.pk)
+            asyncio.run(middleware(request))
+
+        self.assertFalse(pinned)
+        self.assertTrue(routers.is_pinned(self.user.pk))
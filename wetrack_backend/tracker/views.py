@@ -1,14 +1,219 @@
-from rest_framework import viewsets
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
-from .models import Transaction
-from .serializers import TransactionSerializer
+from rest_framework.response import Response
+from auth_app.authentication import ClaimsJWTAuthentication
+from currency.history import MissingRate, RateHistory
+from wetrack.routers import replica_reads
+from . import rollups, sync
+from . import exporters
+from .bulk import BulkError, apply_operations
+from .importers import FORMATS, SPENDING_SIGNS, guess_format, import_statement
+from .models import MonthlySpending, Transaction
+from .pagination import KeysetPagination
+from .serializers import (
+    CategorySummarySerializer, CurrencySummarySerializer, MonthSummarySerializer,
+    ExportQuerySerializer, SummaryQuerySerializer, SyncQuerySerializer, TransactionSerializer,
+    VALUE_FIELDS, represent_values,
+)
+from .summaries import date_range, month_aligned, summarize, summarize_home, summarize_rollups
+
+SUMMARY_SERIALIZERS = {
+    'month': MonthSummarySerializer,
+    'category': CategorySummarySerializer,
+    'currency': CurrencySummarySerializer,
+}
 
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
+    # request.user is only used for its primary key here
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    # Served from a read replica unless the user wrote in the last REPLICA_PIN_SECONDS
+    replica_actions = ('list', 'retrieve', 'summary', 'export')
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(enabled=False) as self.read_scope:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The action and user are only known once the request is authenticated
+        if self.action in self.replica_actions:
+            self.read_scope.enable(request.user.pk)
 
     def get_queryset(self):
         return Transaction.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Rendered by the serializer fast path from .values() rows. ?home=XXX adds
+        home_amount to each row, at the rate on the transaction's day.
+        """
+        home = request.query_params.get('home')
+        if not home:
+            queryset = self.filter_queryset(self.get_queryset()).values(*VALUE_FIELDS)
+            page = self.paginate_queryset(queryset)
+            data = represent_values(queryset if page is None else page)
+            return Response(data) if page is None else self.get_paginated_response(data)
+        home = serializers.RegexField(r'^[A-Za-z]{3}$').run_validation(home).upper()
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset if page is None else page)
+        history = None
+        if rows:
+            days = [timezone.localtime(row.date).date() for row in rows]
+            history = RateHistory.load({row.currency for row in rows} | {home}, min(days), max(days))
+        context = {**self.get_serializer_context(), 'home': home, 'history': history}
+        data = self.get_serializer_class()(rows, many=True, context=context).data
+        return Response(data) if page is None else self.get_paginated_response(data)
+
+    # Writes take the next sync sequence number (locking the user's sequence
+    # first) and keep MonthlySpending in step, all in one database transaction
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            seq = sync.reserve(self.request.user.pk)
+            rollups.record_create(serializer.save(user=self.request.user, sync_seq=seq))
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            seq = sync.reserve(self.request.user.pk)
+            old = Transaction.objects.select_for_update().get(pk=serializer.instance.pk)
+            rollups.record_update(old, serializer.save(sync_seq=seq))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            seq = sync.reserve(self.request.user.pk)
+            instance = Transaction.objects.select_for_update().get(pk=instance.pk)
+            pk = instance.pk
+            instance.delete()
+            sync.record_deletes(instance.user_id, [(pk, seq)])
+            rollups.record_delete(instance)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Apply up to TRANSACTION_BULK_MAX_ITEMS create/update/delete operations
+        in one database transaction and return a result per operation
+        """
+        operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        try:
+            results = apply_operations(
+                request.user, operations, self.get_serializer_context(),
+                max_items=getattr(settings, 'TRANSACTION_BULK_MAX_ITEMS', 5000),
+            )
+        except BulkError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Download every transaction (or those in ?start=&end=) as ?output=csv or
+        ndjson, streamed from a server-side cursor; ?compress=zstd compresses it
+        """
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        fmt, compress = query.validated_data['output'], query.validated_data.get('compress') == 'zstd'
+        queryset = date_range(self.get_queryset(), query.validated_data.get('start'), query.validated_data.get('end'))
+        # The body streams after dispatch() returns, outside the read scope
+        queryset = queryset.using(self.read_scope.alias())
+
+        filename = f"transactions.{fmt}" + ('.zst' if compress else '')
+        response = StreamingHttpResponse(
+            exporters.export(queryset, fmt, compress),
+            content_type='application/zstd' if compress else exporters.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        """
+        Import a CSV or NDJSON statement uploaded as `file` (?type= overrides
+        the guess from its name; ?currency= is used for rows without one;
+        ?spending=positive for files that list spending as positive amounts).
+        Streams one NDJSON progress line per chunk of rows.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A file upload named "file" is required'}, status=400)
+        fmt = request.query_params.get('type') or guess_format(upload.name)
+        if fmt not in FORMATS:
+            return Response({'error': f"type must be one of {', '.join(FORMATS)}"}, status=400)
+        currency = request.query_params.get('currency', 'GBP').upper()
+        spending = request.query_params.get('spending', 'negative')
+        if spending not in SPENDING_SIGNS:
+            return Response({'error': f"spending must be one of {', '.join(SPENDING_SIGNS)}"}, status=400)
+
+        progress = import_statement(request.user, upload, fmt, default_currency=currency, spending=spending)
+        return StreamingHttpResponse((json.dumps(event) + '\n' for event in progress),
+                                     content_type='application/x-ndjson')
+
+    @action(detail=False, methods=['get'], url_path='sync')
+    def sync_changes(self, request):
+        """
+        Transactions changed and ids deleted since ?since=<watermark> (all of
+        them without one), at most ?limit= per call. Repeat with the returned
+        watermark while `more` is true.
+        """
+        query = SyncQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        try:
+            since, since_updated = 0, None
+            if query.validated_data.get('since'):
+                since, since_updated = sync.decode_watermark(query.validated_data['since'])
+            rows, deleted, watermark, more = sync.changes_since(request.user, since, query.validated_data['limit'],
+                                                                since_updated)
+        except sync.InvalidWatermark as e:
+            return Response({'error': str(e)}, status=400)
+        except sync.WatermarkExpired as e:
+            return Response({'error': str(e), 'reset': True}, status=410)
+
+        return Response({
+            'changes': self.get_serializer(rows, many=True).data,
+            'deleted': deleted,
+            'watermark': watermark,
+            'more': more,
+        })
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Totals per month, category or currency (?by=) over an optional
+        ?start=&end= date range; ?home=XXX adds each row's total in XXX
+        """
+        query = SummaryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        by, start, end = query.validated_data['by'], query.validated_data.get('start'), query.validated_data.get('end')
+        home = query.validated_data.get('home')
+
+        if home:
+            try:
+                rows = summarize_home(date_range(self.get_queryset(), start, end), by, home)
+            except MissingRate as e:
+                return Response({'error': f"{e}; run backfill_rates"}, status=503)
+        elif month_aligned(start, end):
+            spending = MonthlySpending.objects.filter(user=request.user)
+            if rollups.ensure_built(request.user.pk):
+                # Built just now on the primary; a replica may not have the rows yet
+                spending = spending.using('default')
+            rows = summarize_rollups(spending, by, start, end)
+        else:
+            rows = summarize(date_range(self.get_queryset(), start, end), by)
+        return Response({
+            'by': by,
+            'start': start,
+            'end': end,
+            'home': home,
+            'results': SUMMARY_SERIALIZERS[by](rows, many=True).data,
+        })
@@ -0,0 +1,207 @@
+# wetrack/compression.py
+"""
+Response compression negotiated from Accept-Encoding: zstd where the client
+takes it, gzip otherwise. Only textual bodies (JSON, NDJSON, CSV, text) of at
+least COMPRESSION_MIN_SIZE bytes are compressed, and a body is left alone if
+compressing does not make it smaller. One-shot bodies reuse a ZstdCompressor
+per thread; streaming bodies are compressed chunk by chunk and flushed after
+each one, so progress lines and export chunks still arrive as they are made.
+
+Against BREACH, every compressed body carries up to COMPRESSION_MAX_RANDOM_BYTES
+of random-length padding (Heal The Breach, as Django's GZipMiddleware does): a
+gzip FNAME field, or a zstd skippable frame after the data. Endpoints that put
+credentials in their bodies (COMPRESSION_EXEMPT_URLS) are not compressed at all.
+"""
+import re
+import secrets
+import struct
+import threading
+import zlib
+
+import zstandard
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+# In order of preference when the client's q-values tie
+ENCODINGS = ('zstd', 'gzip')
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+
+# Magic number of the first zstd skippable frame; decoders drop its payload
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+
+_local = threading.local()
+
+
+def zstd_compressor(level):
+    """This thread's ZstdCompressor at `level`: reusable, but one operation at a time"""
+    compressors = getattr(_local, 'zstd', None)
+    if compressors is None:
+        compressors = _local.zstd = {}
+    compressor = compressors.get(level)
+    if compressor is None:
+        compressor = compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressor
+
+
+def negotiate(accept_encoding):
+    """The encoding of ENCODINGS the client prefers, or None if it accepts neither"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            weights[name.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            weights[name.strip().lower()] = 0.0
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def levels():
+    return {
+        'zstd': getattr(settings, 'COMPRESSION_ZSTD_LEVEL', 3),
+        'gzip': getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6),
+    }
+
+
+def random_padding(max_random_bytes):
+    return b'a' * secrets.randbelow(max_random_bytes) if max_random_bytes else b''
+
+
+def pad_gzip_header(data, padding):
+    """`data`, a gzip member from zlib (no optional header fields), with `padding` as its FNAME"""
+    if not padding:
+        return data
+    header = bytearray(data[:10])
+    header[3] = 0x08  # FLG.FNAME
+    return bytes(header) + padding + b'\x00' + data[10:]
+
+
+def zstd_skippable_frame(padding):
+    return struct.pack('<II', ZSTD_SKIPPABLE_MAGIC, len(padding)) + padding if padding else b''
+
+
+def compress(data, encoding, level, max_random_bytes=0):
+    """`data` compressed whole as one zstd frame or gzip member, padded by up to `max_random_bytes`"""
+    padding = random_padding(max_random_bytes)
+    if encoding == 'zstd':
+        return zstd_compressor(level).compress(data) + zstd_skippable_frame(padding)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return pad_gzip_header(compressor.compress(data) + compressor.flush(), padding)
+
+
+class StreamCompressor:
+    """Compresses a stream chunk by chunk, flushing a complete block after each"""
+
+    def __init__(self, encoding, level, max_random_bytes=0):
+        self._encoding = encoding
+        self._padding = random_padding(max_random_bytes)
+        self._started = False
+        if encoding == 'zstd':
+            # A compressor of its own: a stream can outlive the request on this thread
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._block = zlib.Z_SYNC_FLUSH
+
+    def compress(self, chunk):
+        if not chunk:
+            return b''
+        return self._header(self._compressor.compress(chunk) + self._compressor.flush(self._block))
+
+    def finish(self):
+        data = self._header(self._compressor.flush())
+        return data + zstd_skippable_frame(self._padding) if self._encoding == 'zstd' else data
+
+    def _header(self, data):
+        # The gzip header comes out with the first block
+        if self._started or self._encoding == 'zstd' or not data:
+            return data
+        self._started = True
+        return pad_gzip_header(data, self._padding)
+
+
+def compress_stream(chunks, encoding, level, max_random_bytes=0):
+    stream = StreamCompressor(encoding, level, max_random_bytes)
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.finish()
+
+
+async def compress_async_stream(chunks, encoding, level, max_random_bytes=0):
+    stream = StreamCompressor(encoding, level, max_random_bytes)
+    async for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.finish()
+
+
+def compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not response.has_header('Content-Encoding')
+
+
+def exempt(request):
+    path = request.path_info.lstrip('/')
+    return any(path.startswith(url) for url in getattr(settings, 'COMPRESSION_EXEMPT_URLS', []))
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if not compressible(response) or exempt(request):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        level = levels()[encoding]
+        max_random_bytes = getattr(settings, 'COMPRESSION_MAX_RANDOM_BYTES', 100)
+
+        if response.streaming:
+            wrap = compress_async_stream if response.is_async else compress_stream
+            response.streaming_content = wrap(response.streaming_content, encoding, level, max_random_bytes)
+            if response.has_header('Content-Length'):
+                del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding, level, max_random_bytes)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The compressed body is not byte-for-byte the entity a strong ETag names
+        etag = response.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,352 @@
+# wetrack/perf.py
+"""
+Request-level performance instrumentation. PerfMiddleware records, per route,
+wall time, database query count and time, upstream (FastForex) call count and
+latency, and response size into per-process histograms that /metrics exposes
+in the Prometheus text format. Each histogram spreads its counts over a
+fixed number of locked shards, picked by thread, and only merges them when
+scraped, so recording threads rarely contend however many threads come and go.
+Queries are counted on every thread the request runs code on, including the
+sync_to_async threads of async views.
+
+With PERF_SLOW_REQUEST_MS set, a sample of requests (PERF_SLOW_SAMPLE_RATE)
+also runs under cProfile with their queries captured; those that turn out
+slower than the threshold are dumped to PERF_SLOW_DUMP_DIR, or logged.
+
+/metrics also reports the statistics of psycopg connection pools (DB_POOL),
+including checkout waits.
+"""
+import bisect
+import cProfile
+import contextvars
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from itertools import count
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# (name, help, buckets) of the per-route histograms
+METRICS = {
+    'request_seconds': ('Wall time of requests', SECONDS_BUCKETS),
+    'db_queries': ('Database queries per request', COUNT_BUCKETS),
+    'db_seconds': ('Database time per request', SECONDS_BUCKETS),
+    'upstream_calls': ('Upstream (FastForex) calls per request', COUNT_BUCKETS),
+    'upstream_seconds': ('Upstream (FastForex) time per request', SECONDS_BUCKETS),
+    'response_bytes': ('Response body size', BYTES_BUCKETS),
+}
+PREFIX = 'wetrack_'
+# Shards per histogram; threads share them round-robin
+SHARDS = 16
+
+_slots = count()
+_thread = threading.local()
+
+
+def _slot():
+    """The calling thread's shard index, handed out round-robin as threads first record"""
+    slot = getattr(_thread, 'slot', None)
+    if slot is None:
+        slot = _thread.slot = next(_slots) % SHARDS
+    return slot
+
+
+class Histogram:
+    """Cumulative histogram; observe() only locks the calling thread's shard"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # Bucket counts, then +Inf, then the sum of observations
+        self._shards = [[0] * (len(self.buckets) + 1) + [0.0] for _ in range(SHARDS)]
+        self._locks = [threading.Lock() for _ in range(SHARDS)]
+
+    def observe(self, value):
+        slot = _slot()
+        shard = self._shards[slot]
+        with self._locks[slot]:
+            shard[bisect.bisect_left(self.buckets, value)] += 1
+            shard[-1] += value
+
+    def snapshot(self):
+        """(cumulative counts per bucket including +Inf, count, sum)"""
+        shards = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shards.append(list(shard))
+        totals = [sum(column) for column in zip(*shards)]
+        cumulative, seen = [], 0
+        for n in totals[:-1]:
+            seen += n
+            cumulative.append(seen)
+        return cumulative, seen, totals[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+
+    def histogram(self, name, labels):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms.setdefault(key, Histogram(METRICS[name][1]))
+        return histogram
+
+    def clear(self):
+        self._histograms.clear()
+
+    def render(self):
+        """Prometheus text exposition of every histogram"""
+        by_name = {}
+        for (name, labels), histogram in list(self._histograms.items()):
+            by_name.setdefault(name, []).append((labels, histogram))
+        lines = []
+        for name in sorted(by_name):
+            metric = PREFIX + name
+            lines.append(f"# HELP {metric} {METRICS[name][0]}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in sorted(by_name[name], key=lambda item: item[0]):
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                cumulative, count, total = histogram.snapshot()
+                for bound, seen in zip(histogram.buckets + ('+Inf',), cumulative):
+                    lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {seen}')
+                lines.append(f"{metric}_sum{{{label_text}}} {total:g}")
+                lines.append(f"{metric}_count{{{label_text}}} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+# psycopg_pool statistic: (metric, type, help, scale)
+POOL_STATS = {
+    'pool_size': ('db_pool_connections', 'gauge', 'Connections held by the pool, busy or idle', 1),
+    'pool_available': ('db_pool_idle_connections', 'gauge', 'Idle connections in the pool', 1),
+    'requests_waiting': ('db_pool_waiting_requests', 'gauge', 'Requests waiting for a connection', 1),
+    'requests_num': ('db_pool_checkouts_total', 'counter', 'Connections checked out', 1),
+    'requests_queued': ('db_pool_queued_checkouts_total', 'counter', 'Checkouts that had to wait', 1),
+    'requests_wait_ms': ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection', 0.001),
+    'requests_errors': ('db_pool_checkout_errors_total', 'counter', 'Checkouts that timed out or failed', 1),
+    'connections_num': ('db_pool_connects_total', 'counter', 'Connections opened', 1),
+    'connections_ms': ('db_pool_connect_seconds_total', 'counter', 'Time spent opening connections', 0.001),
+    'connections_errors': ('db_pool_connect_errors_total', 'counter', 'Failed connection attempts', 1),
+    'connections_lost': ('db_pool_lost_connections_total', 'counter', 'Connections failing the checkout check', 1),
+}
+
+
+def render_pool_stats():
+    """Prometheus text for the psycopg connection pools of this process, if any"""
+    pools = [(alias, getattr(connections[alias], 'pool', None)) for alias in connections]
+    stats = [(alias, pool.get_stats()) for alias, pool in pools if pool is not None]
+    lines = []
+    for stat, (name, kind, help_text, scale) in POOL_STATS.items():
+        metric = PREFIX + name
+        values = [(alias, values[stat]) for alias, values in stats if stat in values]
+        if not values:
+            continue
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{database="{_escape(alias)}"}} {value * scale:g}' for alias, value in values)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+class RequestStats:
+    """What one request spent; the middleware publishes it in a context variable"""
+
+    def __init__(self, capture_queries=False):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.queries = [] if capture_queries else None
+        # An async request can run queries on several sync_to_async threads at once
+        self._lock = threading.Lock()
+
+    def query(self, elapsed, sql):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += elapsed
+            if self.queries is not None:
+                self.queries.append((elapsed, sql))
+
+    def upstream(self, elapsed):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += elapsed
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def record_upstream(seconds):
+    """Count an upstream call against the current request, if any"""
+    stats = _current.get()
+    if stats is not None:
+        stats.upstream(seconds)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Times queries against the request in the context, on whichever thread they run"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query(time.perf_counter() - started, sql)
+
+
+def instrument(connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+# Connections of threads yet to connect (asgiref's executors) get the wrapper as they connect
+connection_created.connect(instrument, dispatch_uid='wetrack.perf.instrument')
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name or match.route) if match else 'unmatched'
+
+
+class PerfMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, profiler, started = self.start(profile=True)
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, profiler, started)
+
+    async def __acall__(self, request):
+        # cProfile would also see every other request on the event loop, so async requests only capture queries
+        stats, token, profiler, started = self.start(profile=False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, profiler, started)
+
+    def start(self, profile):
+        # Connections this thread opened before the signal was connected
+        for connection in connections.all(initialized_only=True):
+            instrument(connection)
+        threshold = getattr(settings, 'PERF_SLOW_REQUEST_MS', None)
+        sampled = threshold is not None and random.random() < getattr(settings, 'PERF_SLOW_SAMPLE_RATE', 0.05)
+        stats = RequestStats(capture_queries=sampled)
+        profiler = cProfile.Profile() if sampled and profile else None
+        return stats, _current.set(stats), profiler, time.perf_counter()
+
+    def finish(self, request, response, stats, profiler, started):
+        elapsed = time.perf_counter() - started
+        labels = (('method', request.method), ('route', route_of(request)), ('status', str(response.status_code)))
+        route_labels = labels[1:2]
+        registry.histogram('request_seconds', labels).observe(elapsed)
+        registry.histogram('db_queries', route_labels).observe(stats.db_queries)
+        registry.histogram('db_seconds', route_labels).observe(stats.db_seconds)
+        registry.histogram('upstream_calls', route_labels).observe(stats.upstream_calls)
+        registry.histogram('upstream_seconds', route_labels).observe(stats.upstream_seconds)
+        if response.streaming:
+            wrap = _acounted if response.is_async else _counted
+            response.streaming_content = wrap(response.streaming_content,
+                                              registry.histogram('response_bytes', route_labels))
+        else:
+            registry.histogram('response_bytes', route_labels).observe(len(response.content))
+
+        threshold = getattr(settings, 'PERF_SLOW_REQUEST_MS', None)
+        if stats.queries is not None and elapsed * 1000 >= threshold:
+            dump_slow_request(request, elapsed, stats, profiler)
+        return response
+
+
+def _counted(chunks, histogram):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    histogram.observe(size)
+
+
+async def _acounted(chunks, histogram):
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    histogram.observe(size)
+
+
+def dump_slow_request(request, elapsed, stats, profiler):
+    """Write (or log) the queries and cProfile stats, if profiled, of a slow request"""
+    profile = io.StringIO()
+    if profiler is not None:
+        pstats.Stats(profiler, stream=profile).sort_stats('cumulative').print_stats(30)
+    else:
+        profile.write('(not profiled: async request)\n')
+    queries = '\n'.join(f"{seconds * 1000:.2f}ms {sql}" for seconds, sql in stats.queries)
+    summary = (f"Slow request {request.method} {request.path} ({route_of(request)}): "
+               f"{elapsed * 1000:.1f}ms, {stats.db_queries} queries in {stats.db_seconds * 1000:.1f}ms, "
+               f"{stats.upstream_calls} upstream calls in {stats.upstream_seconds * 1000:.1f}ms")
+
+    dump_dir = getattr(settings, 'PERF_SLOW_DUMP_DIR', None)
+    if not dump_dir:
+        logger.warning(f"{summary}\nQueries:\n{queries}\nProfile:\n{profile.getvalue()}")
+        return
+    os.makedirs(dump_dir, exist_ok=True)
+    route = re.sub(r'[^\w.-]', '_', route_of(request))
+    stem = os.path.join(dump_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{route}")
+    if profiler is not None:
+        profiler.dump_stats(f"{stem}.prof")
+    with open(f"{stem}.txt", 'w') as f:
+        f.write(f"{summary}\n\nQueries:\n{queries}\n\nProfile:\n{profile.getvalue()}")
+    logger.warning(f"{summary}; dumped to {stem}.{'prof' if profiler is not None else 'txt'}")
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint; requires `Authorization: Bearer <PERF_METRICS_TOKEN>`.
+    Without a token configured it is only served with DEBUG on.
+    """
+    token = getattr(settings, 'PERF_METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render() + render_pool_stats(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,160 @@
+# wetrack/routers.py
+"""
+Read replicas. Writes always go to `default`; reads go to a replica only
+inside a replica_reads() scope, which views open around endpoints that are
+safe to serve slightly stale (transaction lists, summaries, exports, rate
+cache reads). A scope opened for a user stays on the primary while that user
+is pinned: ReplicaPinMiddleware pins a user for REPLICA_PIN_SECONDS after any
+successful unsafe request of theirs, so they always read their own writes.
+Pins live in Django's cache, so with replicas configured the middleware
+refuses a per-process cache (LocMemCache, DummyCache): a pin set by one
+worker must be seen by the next request, whichever worker serves it.
+
+Replicas are the DATABASES aliases listed in DATABASE_REPLICAS. Give each
+`'TEST': {'MIRROR': 'default'}`; to exercise the routing by hand, point two
+aliases at two local SQLite files or Postgres databases.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# app_label of the model DatabaseCache queries through
+CACHE_APP_LABEL = 'django_cache'
+
+_scope = contextvars.ContextVar('read_scope', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pin_key(user_id):
+    return f"db:pin:{user_id}"
+
+
+def check_pin_cache():
+    """Raise ImproperlyConfigured if replicas are set up but pins would not be shared by the workers"""
+    backend = caches['default']
+    if replicas() and isinstance(backend, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f"Read replicas need a cache shared by all workers for read-your-writes pins, not "
+            f"{type(backend).__name__}: set REDIS_URL or DB_CACHE_TABLE, or configure CACHES"
+        )
+
+
+def pin(user_id):
+    """Keep `user_id`'s reads on the primary for REPLICA_PIN_SECONDS"""
+    cache.set(pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+async def apin(user_id):
+    await cache.aset(pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(pin_key(user_id)) is not None
+
+
+class ReadScope:
+    """Where reads go within one replica_reads() block; the replica is picked on the first read"""
+
+    def __init__(self, enabled, user_id=None):
+        self.enabled = enabled
+        self.user_id = user_id
+        self._alias = None
+        self._resolved = False
+
+    def enable(self, user_id=None):
+        self.enabled, self.user_id, self._resolved = True, user_id, False
+
+    def alias(self):
+        """The replica alias for this scope's reads, or None for the primary"""
+        if not self.enabled:
+            return None
+        if not self._resolved:
+            aliases = replicas()
+            self._alias = random.choice(aliases) if aliases and not is_pinned(self.user_id) else None
+            self._resolved = True
+        return self._alias
+
+
+@contextmanager
+def replica_reads(user_id=None, enabled=True):
+    """Send reads in the block to a replica, unless `user_id` is pinned; yields the ReadScope"""
+    scope = ReadScope(enabled, user_id)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def read_alias():
+    scope = _scope.get()
+    return scope.alias() if scope is not None else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            # DatabaseCache holds the pins, which a lagging replica would not have yet
+            return None
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+class ReplicaPinMiddleware:
+    """Pin the user after a successful unsafe request; place after authentication"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        check_pin_cache()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user_id = user_to_pin(request, response)
+        if user_id is not None:
+            pin(user_id)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # A session user not yet loaded is fetched from the database
+            user_id = await sync_to_async(user_to_pin)(request, response)
+            if user_id is not None:
+                await apin(user_id)
+        return response
+
+
+def user_to_pin(request, response):
+    """The pk of the user a successful unsafe request wrote for, if any"""
+    if request.method in SAFE_METHODS or response.status_code >= 400:
+        return None
+    # DRF copies the user it authenticated onto the Django request
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
@@ -91,7 +91,10 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'auth_app.middleware.CustomCsrfMiddleware',
+    'wetrack.perf.PerfMiddleware',
+    'wetrack.compression.CompressionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'wetrack.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -133,11 +136,40 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    # last_login is written behind by auth_app.logins instead
+    'UPDATE_LAST_LOGIN': False,
+    'TOKEN_OBTAIN_SERIALIZER': 'auth_app.serializers.BufferedTokenObtainPairSerializer',
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Write-behind buffers (last_login, CurrencyConversion): flush at this many items or every N seconds
+WRITE_BEHIND_MAX_SIZE = 500
+WRITE_BEHIND_INTERVAL = 2
+
+# Request metrics (wetrack.perf): /metrics requires this bearer token, or DEBUG when unset. Setting
+# PERF_SLOW_REQUEST_MS profiles a PERF_SLOW_SAMPLE_RATE share of requests and dumps the slow ones
+PERF_METRICS_TOKEN = os.environ.get('PERF_METRICS_TOKEN')
+PERF_SLOW_REQUEST_MS = None
+PERF_SLOW_SAMPLE_RATE = 0.05
+PERF_SLOW_DUMP_DIR = None
+
+# Response compression (wetrack.compression): zstd or gzip by Accept-Encoding, for textual
+# bodies of at least COMPRESSION_MIN_SIZE bytes. Inside PerfMiddleware, so sizes are as sent
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_ZSTD_LEVEL = 3
+COMPRESSION_GZIP_LEVEL = 6
+# Up to this many random bytes pad each compressed body against BREACH; bodies of the
+# endpoints that return tokens are never compressed
+COMPRESSION_MAX_RANDOM_BYTES = 100
+COMPRESSION_EXEMPT_URLS = [
+    'auth/',
+    'api/auth/',
+]
+
+# Seconds auth_app.authentication.ClaimsJWTAuthentication trusts a cached is_active/password check
+AUTH_USER_STATE_TTL = 30
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
@@ -150,6 +182,7 @@ JWT_AUTH_REFRESH_COOKIE = None
 REST_AUTH = {
     'TOKEN_SERIALIZER': 'dj_rest_auth.serializers.TokenSerializer',
     'USER_DETAILS_SERIALIZER': 'auth_app.views.UserSerializer',
+    'LOGIN_SERIALIZER': 'auth_app.serializers.BufferedLoginSerializer',
     'USE_JWT': True,
     'JWT_AUTH_COOKIE': None,
     'JWT_AUTH_REFRESH_COOKIE': None,
@@ -187,6 +220,78 @@ DATABASES = {
     }
 }
 
+# DB_POOL=True keeps a psycopg 3 connection pool per process, checked on checkout; size its
+# maximum for the worker's threads (WSGI) or concurrent requests (ASGI). Without it,
+# connections persist for DB_CONN_MAX_AGE seconds (0: one per request), which ASGI does not support
+if os.environ.get('DB_POOL', 'False') == 'True':
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+        'check': ConnectionPool.check_connection,
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Read replicas (wetrack.routers): comma-separated hosts with the primary's name and credentials
+DATABASE_REPLICAS = []
+for i, host in enumerate(host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host):
+    DATABASES[f'replica_{i}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{i}')
+DATABASE_ROUTERS = ['wetrack.routers.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they write. Pins live in CACHES, which
+# must then be shared by every worker: wetrack.routers refuses a per-process cache with replicas
+REPLICA_PIN_SECONDS = 5
+
+# Cache shared by the workers: Redis at REDIS_URL (needs the redis package), or a table made
+# by `manage.py createcachetable` with DB_CACHE_TABLE. Without either, each process has its own
+if os.environ.get('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                          'LOCATION': os.environ['REDIS_URL']}}
+elif os.environ.get('DB_CACHE_TABLE'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                          'LOCATION': os.environ['DB_CACHE_TABLE']}}
+
+# Exchange rate cache (seconds)
+CURRENCY_RATE_CACHE_TTL = int(os.environ.get('CURRENCY_RATE_CACHE_TTL', 300))
+CURRENCY_RATE_DB_TTL = int(os.environ.get('CURRENCY_RATE_DB_TTL', 3600))
+CURRENCY_RATE_CACHE_SIZE = 1024
+# Every cross rate is derived from this base's snapshot
+CURRENCY_MATRIX_BASE = os.environ.get('CURRENCY_MATRIX_BASE', 'USD')
+CURRENCY_BATCH_MAX_ITEMS = 5000
+# Each distinct pair in a batch may need its own upstream call
+CURRENCY_BATCH_MAX_PAIRS = 100
+# Identical upstream calls are coalesced; the cross-worker lock lives in CACHES
+CURRENCY_UPSTREAM_LOCK_TIMEOUT = 10
+CURRENCY_UPSTREAM_WAIT = 5
+# Minimum seconds between background refreshes of the same stale rate
+CURRENCY_REVALIDATE_INTERVAL = 10
+# FastForex (connect, read) timeouts and circuit breaker
+FASTFOREX_TIMEOUT = (3.05, 5)
+FASTFOREX_BREAKER_FAILURES = 5
+FASTFOREX_BREAKER_RESET = 30
+# Shared keep-alive connection pool for outbound FastForex calls
+FASTFOREX_POOL_SIZE = 32
+FASTFOREX_RETRIES = 1
+# Connection limit of the httpx client behind the async currency views
+FASTFOREX_ASYNC_POOL_SIZE = 100
+
+# Upstream exchange rate provider and background refresher
+CURRENCY_RATE_PROVIDER = 'currency.fastforex.FastForexProvider'
+CURRENCY_ASYNC_RATE_PROVIDER = 'currency.fastforex.AsyncFastForexProvider'
+FASTFOREX_BASE_URL = os.environ.get('FASTFOREX_BASE_URL', 'https://api.fastforex.io')
+# Comma-separated; empty means every Transaction currency
+CURRENCY_REFRESH_BASES = [base for base in os.environ.get('CURRENCY_REFRESH_BASES', '').split(',') if base]
+CURRENCY_REFRESH_INTERVAL = int(os.environ.get('CURRENCY_REFRESH_INTERVAL', 600))
+
+# Operations accepted by one POST /api/transactions/bulk/
+TRANSACTION_BULK_MAX_ITEMS = 5000
+
 # SSL
 if os.environ.get('DEVELOPMENT_MODE', 'True') == 'True':
     SECURE_SSL_REDIRECT = False
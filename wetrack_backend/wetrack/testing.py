@@ -0,0 +1,55 @@
+# wetrack/testing.py
+"""
+Query budgets for tests: the number of queries a page or endpoint may make,
+checked at more than one data size so that N+1 patterns fail even while the
+absolute count is still small.
+
+    class TransactionQueryTests(QueryBudgetMixin, TestCase):
+        def test_list(self):
+            self.assertQueryBudget(2, lambda: self.client.get('/api/transactions/'), self.add_transactions)
+
+`populate(n)` adds n more rows of whatever the request lists. The request is
+made once unmeasured at each size (to warm per-process caches) and once
+counted; the assertion fails, printing the SQL, when a count is over budget
+or differs between sizes.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def _listing(captured):
+    return '\n'.join(f"{i}. {query['sql']}" for i, query in enumerate(captured.captured_queries, start=1))
+
+
+class QueryBudgetMixin:
+    query_budget_sizes = (1, 10)
+
+    def count_queries(self, request, using=DEFAULT_DB_ALIAS):
+        """Run `request` once and return its captured queries"""
+        with CaptureQueriesContext(connections[using]) as captured:
+            response = request()
+            # Streaming bodies run their queries while being consumed
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        status = getattr(response, 'status_code', 200)
+        self.assertLess(status, 400, f"Request failed with {status}: {getattr(response, 'content', b'')[:200]}")
+        return captured
+
+    def assertQueryBudget(self, budget, request, populate, sizes=None, using=DEFAULT_DB_ALIAS):
+        """Make `request` at each data size; fail if it takes more than `budget` queries or more with more data"""
+        counts = []
+        total = 0
+        for size in sizes or self.query_budget_sizes:
+            populate(size - total)
+            total = size
+            self.count_queries(request, using)
+            captured = self.count_queries(request, using)
+            counts.append((size, captured))
+            if len(captured) > budget:
+                self.fail(f"{len(captured)} queries with {size} rows, over the budget of {budget}:\n"
+                          f"{_listing(captured)}")
+
+        (small, first), (large, last) = counts[0], counts[-1]
+        if len(last) != len(first):
+            self.fail(f"Query count grows with data: {len(first)} with {small} rows, {len(last)} with {large}.\n"
+                      f"With {small}:\n{_listing(first)}\nWith {large}:\n{_listing(last)}")
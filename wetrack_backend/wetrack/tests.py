@@ -0,0 +1,249 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import zstandard
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, OperationalError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from currency.cache import rate_cache
+from currency.circuit import CircuitBreaker
+from currency.fastforex import FastForexProvider
+from currency.testing import FakeFastForex
+
+from . import perf
+from .compression import CompressionMiddleware, negotiate
+from .writebehind import WriteBehindBuffer
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+    def test_flushes_by_size_and_interval(self):
+        written = []
+        buffer = WriteBehindBuffer('test', written.append, max_size=3, interval=0.05)
+        self.addCleanup(buffer.close)
+
+        buffer.add(1, 2, 3)
+        buffer.add(4)
+        deadline = time.monotonic() + 2
+        while sum(written, []) != [1, 2, 3, 4] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(sum(written, []), [1, 2, 3, 4])
+
+    def test_failed_flush_keeps_items_and_close_writes_them(self):
+        written = []
+        fail = mock.Mock(side_effect=[RuntimeError('db down'), None], wraps=written.extend)
+        buffer = WriteBehindBuffer('test', fail, max_size=100, interval=60)
+
+        buffer.add('a', 'b')
+        self.assertEqual(buffer.flush(), 0)
+        buffer.add('c')
+        self.assertEqual(buffer.pending(), 3)
+
+        fail.side_effect = None
+        buffer.close()
+        self.assertEqual((written, buffer.pending()), (['a', 'b', 'c'], 0))
+
+    def test_rejected_items_are_dropped_and_the_rest_written(self):
+        written = []
+
+        def write(items):
+            if 'poison' in items:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            written.extend(items)
+
+        buffer = WriteBehindBuffer('test', write, max_size=100, interval=60)
+        buffer.add('a', 'b', 'poison', 'c', 'd')
+
+        with self.assertLogs('wetrack.writebehind', 'ERROR'):
+            self.assertEqual(buffer.flush(), 4)
+        self.assertEqual((written, buffer.pending()), (['a', 'b', 'c', 'd'], 0))
+
+    def test_outage_during_bisection_keeps_what_is_unwritten(self):
+        written = []
+        calls = []
+
+        def write(items):
+            calls.append(list(items))
+            if len(calls) == 4:
+                raise OperationalError('server closed the connection')
+            if 'poison' in items:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            written.extend(items)
+
+        buffer = WriteBehindBuffer('test', write, max_size=100, interval=60)
+        buffer.add('poison', 'a', 'b', 'c')
+
+        with self.assertLogs('wetrack.writebehind', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        # ['poison', 'a'] -> ['poison'] rejected, ['a'] hit the outage
+        self.assertEqual((written, buffer.pending()), ([], 3))
+        buffer.flush()
+        self.assertEqual(written, ['a', 'b', 'c'])
+
+
+@override_settings(PERF_METRICS_TOKEN='secret')
+class PerfMiddlewareTests(TestCase):
+    def setUp(self):
+        rate_cache.clear()
+        self.addCleanup(rate_cache.clear)
+        perf.registry.clear()
+        self.addCleanup(perf.registry.clear)
+
+    def metric(self, text, line_start):
+        return next(float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith(line_start))
+
+    def test_records_route_db_and_upstream_stats(self):
+        with FakeFastForex() as fake:
+            provider = FastForexProvider(base_url=fake.url, breaker=CircuitBreaker('test'))
+            with mock.patch('currency.cache.get_provider', return_value=provider):
+                self.assertEqual(self.client.get('/api/currency/rate/', {'from': 'EUR', 'to': 'JPY'}).status_code, 200)
+
+        text = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+
+        route = 'route="exchange-rate"'
+        self.assertEqual(self.metric(text, f'wetrack_request_seconds_count{{method="GET",{route},status="200"}}'), 1)
+        self.assertGreater(self.metric(text, f'wetrack_db_queries_sum{{{route}}}'), 0)
+        self.assertEqual(self.metric(text, f'wetrack_upstream_calls_sum{{{route}}}'), 1)
+        self.assertGreater(self.metric(text, f'wetrack_response_bytes_sum{{{route}}}'), 0)
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(PERF_METRICS_TOKEN=None)
+    def test_metrics_without_a_token_need_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_async_requests_count_queries_on_executor_threads(self):
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        async def view(request):
+            await sync_to_async(query, thread_sensitive=False)()
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse('ok')
+
+        middleware = perf.PerfMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        asyncio.run(middleware(RequestFactory().get('/async/')))
+
+        histogram = perf.registry.histogram('db_queries', (('route', 'unmatched'),))
+        self.assertEqual(histogram.snapshot()[1:], (1, 2))
+
+    def test_slow_requests_are_dumped(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            with self.settings(PERF_SLOW_REQUEST_MS=0, PERF_SLOW_SAMPLE_RATE=1, PERF_SLOW_DUMP_DIR=dump_dir):
+                self.client.get('/api/currency/cache/stats/')
+            names = sorted(os.listdir(dump_dir))
+
+        self.assertEqual([name.rsplit('.', 1)[1] for name in names], ['prof', 'txt'])
+        self.assertIn('rate-cache-stats', names[0])
+
+    def test_pool_stats_are_exported(self):
+        pool = mock.Mock(get_stats=mock.Mock(return_value={'pool_size': 4, 'requests_wait_ms': 1500}))
+        with mock.patch.object(perf, 'connections', {'default': mock.Mock(pool=pool), 'other': object()}):
+            text = perf.render_pool_stats()
+
+        self.assertIn('wetrack_db_pool_connections{database="default"} 4\n', text)
+        self.assertIn('# TYPE wetrack_db_pool_wait_seconds_total counter\nwetrack_db_pool_wait_seconds_total'
+                      '{database="default"} 1.5\n', text)
+
+    def test_histogram_merges_shards_of_many_threads(self):
+        histogram = perf.Histogram((1, 10))
+        threads = [threading.Thread(target=lambda: [histogram.observe(v) for v in (0.5, 5, 50)]) for _ in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(histogram.snapshot(), ([40, 80, 120], 120, 2220.0))
+        self.assertEqual(len(histogram._shards), perf.SHARDS)
+
+
+class CompressionTests(TestCase):
+    currencies = {f"C{i:02d}": f"Currency number {i}" for i in range(150)}
+
+    def get_currencies(self, **headers):
+        with mock.patch.object(rate_cache, 'get_currencies', return_value=self.currencies):
+            return self.client.get('/api/currency/currencies/', **headers)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip, deflate, br, zstd'), 'zstd')
+        self.assertEqual(negotiate('gzip, zstd;q=0.5'), 'gzip')
+        self.assertEqual(negotiate('zstd;q=0, gzip;q=0.1'), 'gzip')
+        self.assertEqual(negotiate('*'), 'zstd')
+        self.assertIsNone(negotiate('identity, br'))
+        self.assertIsNone(negotiate(''))
+
+    def test_zstd_when_accepted(self):
+        response = self.get_currencies(HTTP_ACCEPT_ENCODING='gzip, zstd')
+
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        body = zstandard.ZstdDecompressor().decompress(response.content)
+        self.assertEqual(json.loads(body), {'currencies': self.currencies})
+        self.assertLess(len(response.content), len(body) / 3)
+
+    def test_gzip_fallback(self):
+        response = self.get_currencies(HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), {'currencies': self.currencies})
+
+    def test_uncompressed_without_accept_encoding_or_below_threshold(self):
+        response = self.get_currencies()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        with self.settings(COMPRESSION_MIN_SIZE=1 << 20):
+            response = self.get_currencies(HTTP_ACCEPT_ENCODING='zstd')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json(), {'currencies': self.currencies})
+
+    def test_padding_varies_the_compressed_length(self):
+        lengths = {len(self.get_currencies(HTTP_ACCEPT_ENCODING=encoding).content)
+                   for encoding in ('zstd', 'gzip') for _ in range(10)}
+        self.assertGreater(len(lengths), 2)
+
+        with self.settings(COMPRESSION_MAX_RANDOM_BYTES=0):
+            lengths = {len(self.get_currencies(HTTP_ACCEPT_ENCODING='gzip').content) for _ in range(5)}
+        self.assertEqual(len(lengths), 1)
+
+    def test_credential_endpoints_are_not_compressed(self):
+        body = json.dumps({'access': 'x' * 2048}).encode()
+        middleware = CompressionMiddleware(lambda request: HttpResponse(body, content_type='application/json'))
+
+        request = RequestFactory().post('/api/auth/token/refresh/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(middleware(request).has_header('Content-Encoding'))
+        request = RequestFactory().get('/api/transactions/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(middleware(request).content), body)
+
+    def test_async_streaming_response(self):
+        async def chunks():
+            for i in range(200):
+                yield json.dumps({'line': i}).encode() + b'\n'
+
+        async def view(request):
+            return StreamingHttpResponse(chunks(), content_type='application/x-ndjson')
+
+        async def read(response):
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        middleware = CompressionMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(RequestFactory().get('/export/', HTTP_ACCEPT_ENCODING='zstd')))
+
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(asyncio.run(read(response)))
+        self.assertEqual(len(body.splitlines()), 200)
@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from wetrack.perf import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('dj_rest_auth.urls')),
@@ -25,4 +27,5 @@ urlpatterns = [
     path('auth/registration/', include('dj_rest_auth.registration.urls')),
     path('api/currency/', include('currency.urls')),
     path('api/', include('tracker.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
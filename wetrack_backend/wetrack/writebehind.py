@@ -0,0 +1,151 @@
+# wetrack/writebehind.py
+"""
+Write-behind buffering for writes nobody waits on (audit rows, last_login).
+Callers append items in memory; a background thread hands them to a flush
+function in batches, when `max_size` items are pending or every `interval`
+seconds. Pending items are flushed when the buffer is closed, and every
+buffer is closed at interpreter exit, so a worker that exits normally loses
+nothing. A batch that fails to write is kept for the next flush, up to
+`max_pending` items. A batch the database rejects for its data (an
+IntegrityError or DataError, e.g. a row for a deleted user) is bisected until
+the offending items are found; those are logged and dropped, the rest written.
+"""
+import atexit
+import logging
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Raised for the rows of a batch rather than the database as a whole
+ROW_ERRORS = (IntegrityError, DataError)
+
+_buffers = weakref.WeakSet()
+
+
+class WriteBehindBuffer:
+    def __init__(self, name, flush_items, max_size=None, interval=None, max_pending=None):
+        self.name = name
+        self._flush_items = flush_items
+        self._max_size = max_size
+        self._interval = interval
+        self._max_pending = max_pending
+        self._items = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        _buffers.add(self)
+
+    # Limits are read late so tests and settings overrides apply
+    @property
+    def max_size(self):
+        return self._max_size or getattr(settings, 'WRITE_BEHIND_MAX_SIZE', 500)
+
+    @property
+    def interval(self):
+        return self._interval if self._interval is not None else getattr(settings, 'WRITE_BEHIND_INTERVAL', 2)
+
+    @property
+    def max_pending(self):
+        return self._max_pending or self.max_size * 20
+
+    def add(self, *items):
+        with self._lock:
+            self._items.extend(items)
+            pending = len(self._items)
+            closed = self._closed
+        if closed or not self.interval:
+            # No flush thread: write batches inline once full, and anything after close() at once
+            if closed or pending >= self.max_size:
+                self.flush()
+            return
+        self._ensure_thread()
+        if pending >= self.max_size:
+            self._wake.set()
+
+    def clear(self):
+        """Discard everything pending"""
+        with self._lock:
+            self._items = []
+
+    def pending(self):
+        with self._lock:
+            return len(self._items)
+
+    def flush(self):
+        """Write everything pending now; returns the number of items written"""
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, []
+            if not items:
+                return 0
+            # Items are written or rejected in order, so those done are always a prefix
+            done = {'written': 0, 'rejected': 0}
+            try:
+                self._write(items, done)
+            except Exception as e:
+                unwritten = items[done['written'] + done['rejected']:]
+                with self._lock:
+                    self._items[:0] = unwritten
+                    dropped = len(self._items) - self.max_pending
+                    if dropped > 0:
+                        del self._items[:dropped]
+                logger.error(f"Write-behind {self.name} flush of {len(unwritten)} items failed: {str(e)}"
+                             + (f"; dropped {dropped} oldest" if dropped > 0 else ''))
+            return done['written']
+
+    def _write(self, items, done):
+        """Write `items`, splitting the batch in two while the database rejects its data"""
+        try:
+            self._flush_items(items)
+        except ROW_ERRORS as e:
+            if len(items) == 1:
+                done['rejected'] += 1
+                logger.error(f"Write-behind {self.name} dropped an item the database rejects: {items[0]!r}: {str(e)}")
+                return
+            middle = len(items) // 2
+            self._write(items[:middle], done)
+            self._write(items[middle:], done)
+        else:
+            done['written'] += len(items)
+
+    def close(self, timeout=10):
+        """Stop the flush thread and write what is left"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # This thread's connection is reused between flushes, within CONN_MAX_AGE
+                close_old_connections()
+            if self._closed:
+                return
+
+
+@atexit.register
+def close_all():
+    for buffer in list(_buffers):
+        buffer.close()